@@ -0,0 +1,196 @@
+"""
+Cache ảnh huấn luyện đã giải mã dưới dạng uint8 memory-mapped.
+
+Mỗi epoch train.py duyệt tập huấn luyện nhiều lần, và với ImageFolder mỗi lần
+lấy mẫu phải giải mã lại cả một ảnh PNG 2K chỉ để cắt một vùng 360x360. Lệnh
+tiền xử lý ở đây giải mã tập ảnh đúng một lần và ghi các điểm ảnh (H, W, 3,
+uint8) nối tiếp nhau vào các file shard, kèm file chỉ mục index.json ghi vị
+trí và kích thước từng ảnh. CropCacheDataset đọc shard bằng np.memmap nên chỉ
+những trang chứa vùng được cắt mới được nạp từ đĩa, không còn bước giải mã.
+
+Có thể lưu nguyên ảnh, hoặc một tập tile kích thước cố định (phủ toàn bộ ảnh,
+chồng lên nhau một chút ở biên) để mỗi lần cắt chỉ chạm một vùng nhỏ liên
+tục trên đĩa. Với tile, mỗi mẫu vẫn ứng với một ảnh gốc: một tile của ảnh
+được chọn ngẫu nhiên rồi cắt trong tile đó.
+
+Cách dùng:
+    python crop_cache.py div2k/train div2k_cache/train
+    python crop_cache.py div2k/val div2k_cache/val --tile 512
+"""
+import os
+import json
+import math
+import argparse
+import numpy as np
+import torch
+from PIL import Image, ImageFile
+ImageFile.LOAD_TRUNCATED_IMAGES = True
+
+CACHE_INDEX = 'index.json'
+CACHE_FORMAT = 'uint8-hwc'
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.bmp')
+DEFAULT_SHARD_BYTES = 1024 * 1024 * 1024
+
+
+def list_images(image_dir):
+    """Mọi file ảnh trong image_dir và các thư mục con, theo thứ tự tên"""
+    images = []
+    for root, dirs, files in os.walk(image_dir):
+        dirs.sort()
+        images.extend(os.path.join(root, name) for name in sorted(files)
+                      if name.lower().endswith(IMAGE_EXTENSIONS))
+    return images
+
+
+def tile_origins(size, tile):
+    """Tọa độ bắt đầu của các tile dài tile phủ hết một cạnh dài size"""
+    if size <= tile:
+        return [0]
+    count = math.ceil(size / tile)
+    return [round(i * (size - tile) / (count - 1)) for i in range(count)]
+
+
+def image_tiles(pixels, tile):
+    """Các vùng (H, W, 3) cần lưu của ảnh: cả ảnh, hoặc các tile tile x tile"""
+    if not tile:
+        return [pixels]
+    height, width = pixels.shape[:2]
+    return [pixels[top:top + tile, left:left + tile]
+            for top in tile_origins(height, tile) for left in tile_origins(width, tile)]
+
+
+def build_crop_cache(image_dir, output_dir, tile=None, shard_bytes=DEFAULT_SHARD_BYTES):
+    """
+    Giải mã mọi ảnh trong image_dir và ghi điểm ảnh uint8 vào các shard của
+    output_dir cùng file chỉ mục. Trả về nội dung chỉ mục.
+
+    Args:
+        image_dir: thư mục ảnh (cấu trúc như ImageFolder, ví dụ div2k/train)
+        output_dir: thư mục cache
+        tile: kích thước tile vuông; None để lưu nguyên ảnh
+        shard_bytes: dung lượng tối đa của mỗi shard (một ảnh không bị chia
+            qua hai shard)
+    """
+    paths = list_images(image_dir)
+    if not paths:
+        raise ValueError(f"Không tìm thấy ảnh trong {image_dir}")
+    os.makedirs(output_dir, exist_ok=True)
+
+    index = {'format': CACHE_FORMAT, 'source': os.path.abspath(image_dir), 'tile': tile,
+             'shards': [], 'images': []}
+    shard, written = None, 0
+    try:
+        for i, path in enumerate(paths):
+            with Image.open(path) as image:
+                pixels = np.asarray(image.convert('RGB'), dtype=np.uint8)
+            entries = []
+            for region in image_tiles(pixels, tile):
+                region = np.ascontiguousarray(region)
+                if shard is None or (written and written + region.nbytes > shard_bytes):
+                    if shard is not None:
+                        shard.close()
+                    index['shards'].append(f'shard_{len(index["shards"]):03d}.bin')
+                    shard = open(os.path.join(output_dir, index['shards'][-1]), 'wb')
+                    written = 0
+                entries.append([len(index['shards']) - 1, written, *region.shape[:2]])
+                shard.write(region.tobytes())
+                written += region.nbytes
+            index['images'].append({'path': os.path.relpath(path, image_dir), 'entries': entries})
+            print(f"\r[{i + 1}/{len(paths)}] {os.path.relpath(path, image_dir)}", end='', flush=True)
+    finally:
+        if shard is not None:
+            shard.close()
+    print()
+
+    # Chỉ mục được ghi sau cùng: cache dở dang không có index.json
+    with open(os.path.join(output_dir, CACHE_INDEX), 'w', encoding='utf-8') as f:
+        json.dump(index, f)
+    return index
+
+
+def is_crop_cache(path):
+    """path có phải thư mục cache do build_crop_cache tạo không"""
+    return os.path.isfile(os.path.join(path, CACHE_INDEX))
+
+
+class CropCacheDataset(torch.utils.data.Dataset):
+    """
+    Dataset cắt ngẫu nhiên crop x crop (kèm lật ngang ngẫu nhiên) từ cache
+    uint8, tương đương RandomHorizontalFlip + RandomCrop(pad_if_needed) +
+    ToTensor + Normalize(0.5, 0.5) trên ảnh gốc. Trả về (tensor (3, crop,
+    crop) trong [-1, 1], 0) như ImageFolder với một lớp.
+
+    Shard được mở bằng np.memmap lần đầu cần đến trong từng tiến trình, nên
+    dataset dùng được với DataLoader nhiều worker.
+    """
+
+    def __init__(self, cache_dir, crop=360, flip=True):
+        with open(os.path.join(cache_dir, CACHE_INDEX), encoding='utf-8') as f:
+            index = json.load(f)
+        if index.get('format') != CACHE_FORMAT:
+            raise ValueError(f"Định dạng cache không được hỗ trợ: {index.get('format')}")
+        if index.get('tile') and index['tile'] < crop:
+            raise ValueError(f"Tile {index['tile']} nhỏ hơn kích thước crop {crop}")
+        self.cache_dir = cache_dir
+        self.crop = crop
+        self.flip = flip
+        self.shard_files = index['shards']
+        self.images = [image['entries'] for image in index['images']]
+        self._shards = None
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_shards'] = None
+        return state
+
+    def __len__(self):
+        return len(self.images)
+
+    def _region(self, shard, offset, height, width):
+        if self._shards is None:
+            self._shards = [np.memmap(os.path.join(self.cache_dir, name), dtype=np.uint8, mode='r')
+                            for name in self.shard_files]
+        return self._shards[shard][offset:offset + height * width * 3].reshape(height, width, 3)
+
+    def __getitem__(self, i):
+        entries = self.images[i]
+        entry = entries[torch.randint(len(entries), ()).item()] if len(entries) > 1 else entries[0]
+        region = self._region(*entry)
+        height, width = region.shape[:2]
+        crop = self.crop
+
+        top = torch.randint(height - crop + 1, ()).item() if height > crop else 0
+        left = torch.randint(width - crop + 1, ()).item() if width > crop else 0
+        pixels = region[top:top + crop, left:left + crop]
+        if pixels.shape[:2] != (crop, crop):
+            # Ảnh nhỏ hơn crop: đệm 0 (màu đen) như pad_if_needed
+            canvas = np.zeros((crop, crop, 3), dtype=np.uint8)
+            canvas[:pixels.shape[0], :pixels.shape[1]] = pixels
+            pixels = canvas
+        if self.flip and torch.rand(()).item() < 0.5:
+            pixels = pixels[:, ::-1]
+
+        # Luôn sao chép: vùng cắt có thể chính là view chỉ đọc của memmap
+        image = torch.from_numpy(np.array(pixels)).permute(2, 0, 1)
+        return image.float().div_(127.5).sub_(1.0), 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Giải mã tập ảnh huấn luyện thành cache uint8 memory-mapped')
+    parser.add_argument('images', help='Thư mục ảnh (ví dụ div2k/train)')
+    parser.add_argument('output', help='Thư mục cache (ví dụ div2k_cache/train)')
+    parser.add_argument('--tile', type=int, default=None,
+                        help='Lưu các tile NxN phủ ảnh thay vì nguyên ảnh (N >= kích thước crop khi huấn luyện)')
+    parser.add_argument('--shard-mb', type=int, default=DEFAULT_SHARD_BYTES // (1024 * 1024),
+                        help='Dung lượng tối đa mỗi shard, MB (mặc định: 1024)')
+    args = parser.parse_args()
+
+    index = build_crop_cache(args.images, args.output, tile=args.tile,
+                             shard_bytes=args.shard_mb * 1024 * 1024)
+    total = sum(os.path.getsize(os.path.join(args.output, name)) for name in index['shards'])
+    print(f"Đã lưu {len(index['images'])} ảnh vào {len(index['shards'])} shard "
+          f"({total / 1024 / 1024:.1f} MB) tại {args.output}")
+
+
+if __name__ == '__main__':
+    main()
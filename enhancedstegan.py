@@ -1,5 +1,7 @@
 import os
 import re
+import struct
+import threading
 import torch
 import torch.nn as nn
 from PIL import Image
@@ -11,13 +13,38 @@ except ImportError:
     imread = imageio.imread
     imwrite = imageio.imwrite
 import zlib
-from reedsolo import RSCodec
+import math
+import functools
+import contextlib
+from rs_codec import RSCodec
 from collections import Counter
 
-from encoder import BasicEncoder, ResidualEncoder
-from decoder import BasicDecoder
+from encoder import BasicEncoder, ResidualEncoder, DenseEncoder
+from decoder import BasicDecoder, DenseDecoder
+from optimize import optimize_for_inference, max_difference, PIXEL_SCALE, SharedCoverEncoder
+from model_export import is_export_dir, is_slim_export, load_export, load_state_dicts, read_manifest
+from model_cache import model_cache, model_nbytes, source_mtime
 
-rs = RSCodec(250)
+DEFAULT_ECC_SYMBOLS = 250
+# Số bit mỗi kênh payload của dải cột đầu tiên khi giải mã tăng dần
+PROGRESSIVE_MIN_BITS = 1 << 15
+MIN_ECC_SYMBOLS = 16
+# Hệ số an toàn nhân với tỉ lệ lỗi bit đo được khi chọn số byte ECC
+ECC_BER_MARGIN = 2.0
+# Chế độ độ chính xác khi suy luận (xem StegoEngine)
+PRECISIONS = ('float32', 'bfloat16')
+# PSNR (dB) của ảnh stego ở độ chính xác thấp được phép kém bản float32 bao nhiêu
+ENCODE_PSNR_TOLERANCE = 0.5
+# Số cột đầu của ảnh dùng để so sánh PSNR với bản float32 khi mã hóa
+ENCODE_CHECK_COLUMNS = 64
+# Các mô hình và thuộc tính của StegoEngine được lưu trong model_cache
+CACHED_ROLES = ('encoder', 'decoder', 'reverse_decoder')
+CACHED_ATTRIBUTES = ('device', 'data_depth', 'hidden_size', 'bit_error_rate', 'radius', 'precision',
+                     '_model_files')
+# Thuộc tính phụ thuộc vào một mô hình cụ thể, được lưu cùng mô hình đó
+CACHED_ROLE_ATTRIBUTES = {'decoder': ('decoder_pixels',)}
+
+rs = RSCodec(DEFAULT_ECC_SYMBOLS)
 
 _BYTE_TO_BITS = [[(b >> (7-i)) & 1 for i in range(8)] for b in range(256)]
 
@@ -46,95 +73,235 @@ def bits_to_bytearray(bits):
     weights = np.array([128, 64, 32, 16, 8, 4, 2, 1], dtype=np.uint8)
     return bytearray((bits * weights).sum(axis=1).astype(np.uint8))
 
-def text_to_bytearray(text):
-    """Nén và thêm error correction"""
+@functools.lru_cache(maxsize=None)
+def rs_codec(nsym):
+    """RSCodec với nsym byte ECC mỗi khối 255 byte (dùng lại giữa các lần gọi)"""
+    return rs if nsym == DEFAULT_ECC_SYMBOLS else RSCodec(nsym)
+
+def text_to_bytearray(text, nsym=None):
+    """Nén và thêm error correction (nsym byte ECC mỗi khối, mặc định 250)"""
     assert isinstance(text, str), "mong đợi một chuỗi string"
     x = zlib.compress(text.encode("utf-8"))
-    x = rs.encode(bytearray(x))
+    x = rs_codec(nsym or DEFAULT_ECC_SYMBOLS).encode(bytearray(x))
     return x
 
-def bytearray_to_text(x):
+def bytearray_to_text(x, nsym=None):
     """Giải nén và sửa lỗi"""
     try:
-        text = rs.decode(x)[0]
+        text = rs_codec(nsym or DEFAULT_ECC_SYMBOLS).decode(x)[0]
         text = zlib.decompress(text)
         return text.decode("utf-8")
     except BaseException as e:
         return False
 
-# MÔ HÌNH ENCODER
-class DenseEncoder(nn.Module):
-    def __init__(self, data_depth=4, hidden_size=32):
-        super().__init__()
-        self.data_depth = data_depth
-        self.hidden_size = hidden_size
-        self.name = "DenseEncoder"
-        
-        self.conv1 = nn.Sequential(
-            nn.Conv2d(3, hidden_size, 3, padding=1),
-            nn.LeakyReLU(inplace=True),
-            nn.BatchNorm2d(hidden_size),
-        )
-        self.conv2 = nn.Sequential(
-            nn.Conv2d(hidden_size + data_depth, hidden_size, 3, padding=1),
-            nn.LeakyReLU(inplace=True),
-            nn.BatchNorm2d(hidden_size),
-        )
-        self.conv3 = nn.Sequential(
-            nn.Conv2d(hidden_size * 2 + data_depth, hidden_size, 3, padding=1),
-            nn.LeakyReLU(inplace=True),
-            nn.BatchNorm2d(hidden_size),
-        )
-        self.conv4 = nn.Sequential(
-            nn.Conv2d(hidden_size * 3 + data_depth, 3, 3, padding=1)
-        )
+def bytearrays_to_texts(xs, nsym=None):
+    """Như bytearray_to_text cho nhiều ứng viên, sửa lỗi Reed-Solomon cùng một lô"""
+    texts = []
+    for x in rs_codec(nsym or DEFAULT_ECC_SYMBOLS).decode_batch(xs):
+        if x is None:
+            # Reed-Solomon không sửa được
+            texts.append(False)
+            continue
+        try:
+            texts.append(zlib.decompress(x).decode("utf-8"))
+        except BaseException:
+            texts.append(False)
+    return texts
 
-    def forward(self, image, data):
-        x = self.conv1(image)
-        x_list = [x]
-        x_1 = self.conv2(torch.cat(x_list + [data], dim=1))
-        x_list.append(x_1)
-        x_2 = self.conv3(torch.cat(x_list + [data], dim=1))
-        x_list.append(x_2)
-        x_3 = self.conv4(torch.cat(x_list + [data], dim=1))
-        return image + x_3
-
-# MÔ HÌNH DECODER
-class DenseDecoder(nn.Module):
-    def __init__(self, data_depth=4, hidden_size=32):
-        super().__init__()
-        self.data_depth = data_depth
-        self.hidden_size = hidden_size
-        self.name = "DenseDecoder"
-        
-        self.conv1 = nn.Sequential(
-            nn.Conv2d(3, hidden_size, 3, padding=1),
-            nn.LeakyReLU(inplace=True),
-            nn.BatchNorm2d(hidden_size),
-        )
-        self.conv2 = nn.Sequential(
-            nn.Conv2d(hidden_size, hidden_size, 3, padding=1),
-            nn.LeakyReLU(inplace=True),
-            nn.BatchNorm2d(hidden_size),
-        )
-        self.conv3 = nn.Sequential(
-            nn.Conv2d(hidden_size * 2, hidden_size, 3, padding=1),
-            nn.LeakyReLU(inplace=True),
-            nn.BatchNorm2d(hidden_size)
-        )
-        self.conv4 = nn.Sequential(
-            nn.Conv2d(hidden_size * 3, data_depth, 3, padding=1),
-        )
+def rs_strip(x, nsym=DEFAULT_ECC_SYMBOLS, nsize=255):
+    """Bỏ phần ECC của chuỗi đã mã hóa RS (mã hệ thống) mà không sửa lỗi"""
+    x = bytes(x)
+    return b''.join(x[i:i + nsize][:-nsym] for i in range(0, len(x), nsize))
 
-    def forward(self, image):
-        x = self.conv1(image)
-        x_list = [x]
-        x_1 = self.conv2(torch.cat(x_list, dim=1))
-        x_list.append(x_1)
-        x_2 = self.conv3(torch.cat(x_list, dim=1))
-        x_list.append(x_2)
-        x_3 = self.conv4(torch.cat(x_list, dim=1))
-        return x_3
+def choose_ecc_symbols(bit_error_rate, target=1e-6, nsize=255):
+    """
+    Chọn số byte ECC (chẵn) nhỏ nhất cho mỗi khối RS sao cho xác suất một khối
+    có quá nsym/2 byte lỗi (không sửa được) không vượt quá target, với giả
+    thiết lỗi bit độc lập với tỉ lệ bit_error_rate.
+    """
+    q = 1.0 - (1.0 - min(max(bit_error_rate, 0.0), 0.5)) ** 8
+    if q <= 0.0:
+        return MIN_ECC_SYMBOLS
+    log_q, log_p = math.log(q), math.log1p(-q)
+    # Xác suất khối có đúng k byte lỗi (phân phối nhị thức)
+    pmf = [math.exp(math.lgamma(nsize + 1) - math.lgamma(k + 1) - math.lgamma(nsize - k + 1)
+                    + k * log_q + (nsize - k) * log_p) for k in range(nsize + 1)]
+    for nsym in range(MIN_ECC_SYMBOLS, DEFAULT_ECC_SYMBOLS, 2):
+        if sum(pmf[nsym // 2 + 1:]) <= target:
+            return nsym
+    return DEFAULT_ECC_SYMBOLS
+
+def _ecc_fits(length, nsym, nsize=255):
+    """Body dài length byte có thể là đầu ra RS với nsym byte ECC hay không"""
+    remainder = length % nsize
+    return 0 < nsym < nsize and (remainder == 0 or remainder > nsym)
+
+# FRAME PAYLOAD
+# Mỗi bản sao payload là một frame: header cố định + body (zlib + RS).
+#   v1: sync (4 byte) | version (1) | flags (1) | length (4) | crc32 của body (4)
+#   v2: sync (4 byte) | version (1) | flags (1) | nsym (1) | length (4) | crc32 (4)
+# v1 luôn dùng 250 byte ECC, v2 ghi lại số byte ECC đã chọn khi mã hóa.
+# Sync word là attached sync marker của CCSDS, có tự tương quan thấp.
+# flags hiện được dự trữ (luôn bằng 0) cho các phiên bản sau.
+FRAME_SYNC = b'\x1a\xcf\xfc\x1d'
+FRAME_VERSION = 2
+_FRAME_HEADERS = {
+    1: struct.Struct('>4sBBII'),
+    2: struct.Struct('>4sBBBII'),
+}
+_POPCOUNT = np.array([bin(b).count('1') for b in range(256)], dtype=np.int32)
+
+def _bit_distance(a, b):
+    """Số bit khác nhau giữa hai chuỗi byte cùng độ dài"""
+    return int(sum(_POPCOUNT[x ^ y] for x, y in zip(bytes(a), bytes(b))))
+
+def _unpack_frame_header(data, version):
+    """Đọc header theo version -> (sync, version, flags, nsym, length, crc)"""
+    fields = _FRAME_HEADERS[version].unpack(bytes(data[:_FRAME_HEADERS[version].size]))
+    if version == 1:
+        sync, version, flags, length, crc = fields
+        return sync, version, flags, DEFAULT_ECC_SYMBOLS, length, crc
+    return fields
+
+def make_frame(text, nsym=None):
+    """Đóng gói text thành một frame có header độ dài, số byte ECC và CRC32"""
+    nsym = nsym or DEFAULT_ECC_SYMBOLS
+    body = bytes(text_to_bytearray(text, nsym))
+    header = _FRAME_HEADERS[FRAME_VERSION].pack(FRAME_SYNC, FRAME_VERSION, 0, nsym, len(body), zlib.crc32(body))
+    return header + body
+
+def parse_frame_header(data):
+    """
+    Đọc header frame (chính xác), trả về (version, nsym, length, crc, size)
+    hoặc None nếu không hợp lệ.
+    """
+    if len(data) < 5 or data[4] not in _FRAME_HEADERS or len(data) < _FRAME_HEADERS[data[4]].size:
+        return None
+    sync, version, _, nsym, length, crc = _unpack_frame_header(data, data[4])
+    if sync != FRAME_SYNC or not _ecc_fits(length, nsym):
+        return None
+    return version, nsym, length, crc, _FRAME_HEADERS[version].size
+
+def read_frame_headers(frame, period, max_distance=8):
+    """
+    Đọc header của một frame đã cộng dồn khi đã biết chu kỳ (bit). Độ dài body
+    suy ra từ chu kỳ nên không phụ thuộc vào trường length có thể còn lỗi bit;
+    sync word, version và nsym được so khớp có dung sai.
+    Trả về danh sách (version, nsym, length, crc, size) khả dĩ, theo thứ tự
+    ưu tiên, rỗng nếu đây không phải một frame.
+    """
+    if len(frame) < 5 or _bit_distance(frame[:4], FRAME_SYNC) > max_distance:
+        return []
+    
+    versions = sorted((v for v in _FRAME_HEADERS if _POPCOUNT[frame[4] ^ v] <= 2),
+                      key=lambda v: _POPCOUNT[frame[4] ^ v])
+    headers = []
+    for version in versions:
+        size = _FRAME_HEADERS[version].size
+        length = period // 8 - size
+        if length <= 0 or len(frame) < size:
+            continue
+        _, _, _, nsym, _, crc = _unpack_frame_header(frame, version)
+        # nsym có thể còn lỗi bit: thử cả các giá trị lệch một bit khớp với length
+        for candidate in [nsym] + [nsym ^ (1 << b) for b in range(8)]:
+            if _ecc_fits(length, candidate):
+                headers.append((version, candidate, length, crc, size))
+    return headers
+
+def find_sync(raw, max_distance=3):
+    """Vị trí (byte) các sync word trong raw, cho phép sai tối đa max_distance bit"""
+    raw = np.frombuffer(bytes(raw), dtype=np.uint8)
+    n = len(raw) - len(FRAME_SYNC) + 1
+    if n <= 0:
+        return np.empty(0, dtype=np.int64)
+    distance = np.zeros(n, dtype=np.int32)
+    for k, byte in enumerate(FRAME_SYNC):
+        distance += _POPCOUNT[raw[k:k + n] ^ byte]
+    return np.nonzero(distance <= max_distance)[0]
+
+def frame_body_to_text(body, nsym, crc=None):
+    """
+    Giải mã body của frame. Nếu CRC khớp thì body không có lỗi, chỉ cần bỏ
+    phần ECC; ngược lại mới phải sửa lỗi bằng Reed-Solomon.
+    Trả về False nếu không giải mã được.
+    """
+    if crc is not None and zlib.crc32(bytes(body)) == crc:
+        try:
+            return zlib.decompress(rs_strip(body, nsym)).decode("utf-8")
+        except BaseException:
+            pass
+    return bytearray_to_text(bytearray(body), nsym)
+
+def decode_frames(logits, start=0, max_headers=64):
+    """
+    Giải mã payload dạng frame từ logits của decoder.
+
+    Chu kỳ của frame lấy từ header tại các sync word (frame hợp lệ bắt đầu ở
+    vị trí là bội của độ dài frame vì payload được lặp từ bit 0), hoặc từ tự
+    tương quan khi ảnh nhiễu tới mức không đọc được header nào. Logits của mọi
+    bản sao được cộng dồn (quyết định mềm), sync word phải xuất hiện ở đầu
+    chu kỳ, và CRC được kiểm tra trước khi phải giải mã Reed-Solomon.
+
+    Args:
+        logits: mảng logits đã làm phẳng
+        start: vị trí (trong payload gốc) của phần tử đầu tiên của logits
+
+    Returns:
+        text, False nếu tìm thấy frame nhưng không giải mã được,
+        hoặc None nếu không có frame nào (ảnh stego định dạng cũ)
+    """
+    skip = (-start) % 8
+    logits = logits[skip:]
+    start += skip
+    raw = bits_to_bytearray((logits > 0).astype(np.uint8))
+    
+    votes = Counter()
+    copies = []
+    for pos in find_sync(raw)[:max_headers]:
+        header = parse_frame_header(raw[pos:pos + 16])
+        if header is None:
+            continue
+        period = 8 * (header[4] + header[2])
+        # Trường length có thể bị lỗi bit: một frame không thể dài hơn số
+        # logits hiện có, bỏ qua để không cấp phát theo độ dài sai
+        if period > len(logits) or (start + 8 * pos) % period:
+            continue
+        votes[period] += 1
+        copies.append((pos, header))
+    
+    def candidate_periods():
+        voted = [period for period, _ in votes.most_common(3)]
+        yield from voted
+        # Chỉ tính tự tương quan khi các header đọc được không dẫn tới kết quả
+        yield from (period for period in find_periods(logits) if period not in voted)
+    
+    found = False
+    for period in candidate_periods():
+        frame = bits_to_bytearray((fold_logits(logits, period, start) > 0).astype(np.uint8))
+        headers = read_frame_headers(frame, period)
+        found = found or bool(headers)
+        
+        # 1. Cộng dồn mềm tất cả bản sao rồi kiểm tra CRC
+        for version, nsym, length, crc, size in headers:
+            if zlib.crc32(bytes(frame[size:])) == crc:
+                text = frame_body_to_text(frame[size:], nsym, crc)
+                if text is not False:
+                    return text
+        
+        # 2. Tìm một bản sao riêng lẻ không có lỗi (chỉ tốn một lần CRC)
+        for pos, (_, nsym, length, crc, size) in copies:
+            body = raw[pos + size:pos + size + length]
+            if 8 * (size + length) == period and len(body) == length and zlib.crc32(bytes(body)) == crc:
+                text = frame_body_to_text(body, nsym, crc)
+                if text is not False:
+                    return text
+        
+        # 3. Sửa lỗi Reed-Solomon trên kết quả đã cộng dồn
+        for version, nsym, length, crc, size in headers:
+            text = frame_body_to_text(frame[size:], nsym)
+            if text is not False:
+                return text
+    return False if found else None
 
 # MÔ HÌNH REVERSE DECODER
 class ReverseDecoder(nn.Module):
@@ -196,55 +363,188 @@ class ReverseDecoder(nn.Module):
         
         return recovered_cover
 
+# Các lớp mô hình theo tên, để dựng lại mô hình từ checkpoint/manifest
+MODEL_CLASSES = {cls.__name__: cls for cls in (BasicEncoder, ResidualEncoder, DenseEncoder,
+                                               BasicDecoder, DenseDecoder, ReverseDecoder)}
+
+def build_model(name, data_depth, hidden_size):
+    """Tạo mô hình (chưa có trọng số) thuộc lớp name trong MODEL_CLASSES"""
+    if name not in MODEL_CLASSES:
+        raise ValueError(f"Lớp mô hình không được hỗ trợ: {name}")
+    if name == 'ReverseDecoder':
+        return ReverseDecoder(hidden_size)
+    return MODEL_CLASSES[name](data_depth, hidden_size)
+
+def checkpoint_architecture(checkpoint):
+    """
+    (data_depth, hidden_size, dict role -> tên lớp) của checkpoint huấn luyện,
+    đọc từ checkpoint['architecture'] (train.py). Checkpoint cũ không có mục
+    này được suy ra từ kích thước trọng số: hidden_size là số kênh ra của khối
+    đầu encoder, data_depth là số kênh ra của khối cuối decoder, và khối thứ
+    ba của mô hình Dense nhận ghép kênh của mọi khối trước. BasicEncoder và
+    ResidualEncoder có cùng trọng số nên checkpoint cũ được coi là
+    ResidualEncoder như trước đây.
+    """
+    spec = checkpoint.get('architecture')
+    if spec:
+        return spec['data_depth'], spec['hidden_size'], \
+            {role: spec[role] for role in CACHED_ROLES if spec.get(role)}
+
+    encoder = checkpoint['state_dict_encoder']
+    decoder = checkpoint['state_dict_decoder']
+    hidden_size = encoder['conv1.0.weight'].size(0)
+    data_depth = decoder['conv4.0.weight'].size(0)
+    dense_encoder = encoder['conv3.0.weight'].size(1) != hidden_size
+    dense_decoder = decoder['conv3.0.weight'].size(1) != hidden_size
+    classes = {'encoder': 'DenseEncoder' if dense_encoder else 'ResidualEncoder',
+               'decoder': 'DenseDecoder' if dense_decoder else 'BasicDecoder'}
+    if 'state_dict_reverse_decoder' in checkpoint:
+        classes['reverse_decoder'] = 'ReverseDecoder'
+    return data_depth, hidden_size, classes
+
 # PAYLOAD & MESSAGE
-def make_payload(width, height, depth, text):
-    """Tạo payload từ text để ẩn vào ảnh"""
-    message = text_to_bits(text) + [0] * 32
-    payload = message
-    while len(payload) < width * height * depth:
-        payload += message
-    payload = payload[:width * height * depth]
-    return torch.FloatTensor(payload).view(1, depth, height, width)
+def make_payload(width, height, depth, text, legacy=False, nsym=None):
+    """
+    Tạo payload từ text để ẩn vào ảnh - ĐÃ TỐI ƯU với numpy.
+    Chuỗi bit của một frame (xem make_frame, nsym byte ECC mỗi khối RS) được
+    tạo một lần bằng np.unpackbits rồi lặp lại trực tiếp vào tensor float32
+    cấp phát sẵn. Với legacy=True dùng định dạng cũ: message kèm 32 bit 0
+    phân cách và luôn 250 byte ECC.
+    """
+    if legacy:
+        message = np.unpackbits(np.frombuffer(bytes(text_to_bytearray(text)), dtype=np.uint8))
+        message = np.concatenate([message, np.zeros(32, dtype=np.uint8)])
+    else:
+        message = np.unpackbits(np.frombuffer(make_frame(text, nsym), dtype=np.uint8))
+    
+    total = width * height * depth
+    payload = torch.empty(total, dtype=torch.float32)
+    out = payload.numpy()
+    repeats, remainder = divmod(total, len(message))
+    out[:repeats * len(message)].reshape(repeats, len(message))[:] = message
+    out[repeats * len(message):] = message[:remainder]
+    return payload.view(1, depth, height, width)
 
 def make_message(image, decoder, device, max_attempts=50):
     """Giải mã message từ ảnh stego - ĐÃ TỐI ƯU cho các model độ chính xác cao"""
     image = image.to(device)
     
     with torch.no_grad():
-        decoded = (decoder(image).view(-1) > 0).to(torch.uint8)
-        bits = decoded.cpu().numpy()
+        logits = decoder(image).reshape(-1)
     
-    raw_bytes = bits_to_bytearray(bits)
+    return extract_message(logits, max_attempts)
+
+def find_periods(logits, max_bits=1 << 22, min_period=64, max_candidates=4):
+    """
+    Tìm các chu kỳ lặp (số bit, bội của 8) khả dĩ của payload bằng tự tương
+    quan (FFT) trên dấu của logits. Chu kỳ cơ bản (độ trễ nhỏ nhất có đỉnh gần
+    bằng đỉnh cao nhất) đứng đầu, sau đó là các đỉnh khác theo độ cao giảm dần.
+    Trả về danh sách rỗng nếu không thấy ít nhất hai bản sao.
+    """
+    signs = np.where(logits[:max_bits] > 0, 1.0, -1.0)
+    n = len(signs)
+    if n < 2 * min_period:
+        return []
     
-    # Phương pháp 1: Dừng sớm với giới hạn số lần thử (nhanh cho payload lớn)
-    attempts = 0
-    for candidate in raw_bytes.split(b'\x00\x00\x00\x00'):
-        if len(candidate) < 10:  # Quá ngắn, bỏ qua
-            continue
-        
-        attempts += 1
-        if attempts > max_attempts:
-            print(f"Đã đạt giới hạn số lần thử ({max_attempts}), thử voting...")
+    size = 1 << int(np.ceil(np.log2(2 * n)))
+    spectrum = np.fft.rfft(signs, size)
+    autocorr = np.fft.irfft(spectrum * np.conj(spectrum), size)[:n // 2 + 1]
+    
+    lags = np.arange(min_period, n // 2 + 1, 8)
+    if len(lags) == 0:
+        return []
+    score = autocorr[lags] / (n - lags)
+    # Nhiễu của tự tương quan với dữ liệu ngẫu nhiên vào khoảng 1/sqrt(n - lag)
+    significant = np.nonzero((score > 6.0 / np.sqrt(n - lags)) & (score > 0.1))[0]
+    if len(significant) == 0:
+        return []
+    
+    order = significant[np.argsort(-score[significant])]
+    best = score[order[0]]
+    # Bội số của chu kỳ cũng cho đỉnh cao nên ưu tiên đỉnh có độ trễ nhỏ nhất
+    fundamental = significant[score[significant] >= 0.8 * best][0]
+    candidates = [int(lags[fundamental])]
+    for i in order:
+        if len(candidates) >= max_candidates:
             break
-            
-        result = bytearray_to_text(bytearray(candidate))
+        if int(lags[i]) not in candidates:
+            candidates.append(int(lags[i]))
+    return candidates
+
+def fold_logits(logits, period, start=0, clip=16.0):
+    """
+    Trung bình logits của mọi bản sao payload theo từng vị trí trong chu kỳ.
+    start là vị trí (trong payload gốc) của phần tử đầu tiên của logits.
+    """
+    logits = np.clip(logits, -clip, clip)
+    full = len(logits) // period * period
+    sums = logits[:full].reshape(-1, period).sum(axis=0, dtype=np.float64)
+    counts = np.full(period, full // period, dtype=np.int64)
+    tail = len(logits) - full
+    sums[:tail] += logits[full:]
+    counts[:tail] += 1
+    if start % period:
+        sums = np.roll(sums, start % period)
+        counts = np.roll(counts, start % period)
+    return sums / np.maximum(counts, 1)
+
+def soft_decode(logits):
+    """
+    Giải mã quyết định mềm: xác định chu kỳ lặp, cộng dồn logits của tất cả
+    bản sao rồi mới lấy ngưỡng, sau đó chỉ giải mã Reed-Solomon một lần.
+    """
+    for period in find_periods(logits):
+        bits = (fold_logits(logits, period) > 0).astype(np.uint8)
+        # 32 bit cuối của mỗi chu kỳ là phần phân cách toàn 0, loại nhanh
+        # các chu kỳ giả trước khi phải giải mã Reed-Solomon
+        if bits[-32:].sum() > 12:
+            continue
+        result = bytearray_to_text(bits_to_bytearray(bits[:-32]))
         if result:
-            return result  # Trả về sớm khi tìm thấy message hợp lệ
+            return result
+    return False
+
+def extract_message(logits, max_attempts=50, soft=True):
+    """Trích xuất message từ logits (đã làm phẳng) của decoder cho một ảnh"""
+    if isinstance(logits, torch.Tensor):
+        logits = logits.detach().float().cpu().numpy()
+    
+    result = decode_frames(logits)
+    if isinstance(result, str):
+        return result
+    if result is False:
+        raise ValueError('Tìm thấy frame payload nhưng không sửa được lỗi. '
+                         'Ảnh stego có thể đã bị biến đổi quá nhiều.')
+    
+    # Ảnh stego định dạng cũ (message + 32 bit 0 phân cách)
+    if soft:
+        result = soft_decode(logits)
+        if result:
+            return result
+    
+    bits = (logits > 0).astype(np.uint8)
+    
+    raw_bytes = bits_to_bytearray(bits)
+    
+    chunks = [bytearray(c) for c in raw_bytes.split(b'\x00\x00\x00\x00') if len(c) >= 10]
+    chunks = chunks[:max_attempts * 2]
+    
+    # Phương pháp 1: Dừng sớm với giới hạn số lần thử (nhanh cho payload lớn).
+    # Các ứng viên được sửa lỗi Reed-Solomon theo từng lô nhỏ
+    results = []
+    for i in range(0, min(len(chunks), max_attempts), 16):
+        results += bytearrays_to_texts(chunks[i:min(i + 16, max_attempts)])
+        for result in results[i:]:
+            if result:
+                return result  # Trả về sớm khi tìm thấy message hợp lệ
+    if len(chunks) > max_attempts:
+        print(f"Đã đạt giới hạn số lần thử ({max_attempts}), thử voting...")
+        results += bytearrays_to_texts(chunks[max_attempts:])
     
     # Phương pháp 2: Fallback với voting có giới hạn
     candidates = Counter()
-    attempts = 0
-    max_voting_attempts = max_attempts * 2
-    
-    for candidate in raw_bytes.split(b'\x00\x00\x00\x00'):
-        if len(candidate) < 10:
-            continue
-            
-        attempts += 1
-        if attempts > max_voting_attempts:
-            break
-            
-        result = bytearray_to_text(bytearray(candidate))
+    attempts = len(results)
+    for result in results:
         if result:
             candidates[result] += 1
             if candidates[result] >= 2:
@@ -257,122 +557,789 @@ def make_message(image, decoder, device, max_attempts=50):
     
     return candidates.most_common(1)[0][0]
 
-def encode_message(cover_image_path, secret_text, output_path, model_path=None):
+# ENGINE SUY LUẬN
+def select_device():
+    """Chọn thiết bị tốt nhất hiện có: MPS, CUDA rồi tới CPU"""
     if torch.backends.mps.is_available():
-        device = torch.device('mps')
-    elif torch.cuda.is_available():
-        device = torch.device('cuda')
-    else:
-        device = torch.device('cpu')
-    print(f"Đang sử dụng thiết bị: {device}")
-    
-    data_depth = 2
-    hidden_size = 32
-    encoder = ResidualEncoder(data_depth, hidden_size).to(device)
-    
-    # Tải model nếu có
-    if model_path:
-        checkpoint = torch.load(model_path, map_location=device, weights_only=False)
-        encoder.load_state_dict(checkpoint['state_dict_encoder'])
-        print("Đã tải encoder đã được huấn luyện trước")
-    
-    encoder.eval()
-    
-    cover_img = Image.open(cover_image_path).convert('RGB')
-    cover_im = np.array(cover_img) / 127.5 - 1.0
-    cover = torch.FloatTensor(cover_im).permute(2, 1, 0).unsqueeze(0)
-    cover_size = cover.size()
-    
-    payload = make_payload(cover_size[3], cover_size[2], data_depth, secret_text)
-    
-    cover = cover.to(device)
-    payload = payload.to(device)
-    
-    with torch.no_grad():
-        generated = encoder.forward(cover, payload)[0].clamp(-1.0, 1.0)
-    
-    generated = (generated.permute(2, 1, 0).detach().cpu().numpy() + 1.0) * 127.5
-    generated_img = generated.astype('uint8')
-    
-    # Sử dụng PIL để lưu ảnh (tương thích tốt hơn với Windows)
-    img = Image.fromarray(generated_img)
-    img.save(output_path)
-    
-    print(f"Đã mã hóa message vào: {output_path}")
-    print(f"Văn bản bí mật: {secret_text}")
+        return torch.device('mps')
+    if torch.cuda.is_available():
+        return torch.device('cuda')
+    return torch.device('cpu')
 
-def decode_message(stego_image_path, model_path=None):
-    if torch.backends.mps.is_available():
-        device = torch.device('mps')
-    elif torch.cuda.is_available():
-        device = torch.device('cuda')
-    else:
-        device = torch.device('cpu')
-    print(f"Đang sử dụng thiết bị: {device}")
-    
-    data_depth = 2
-    hidden_size = 32
-    decoder = BasicDecoder(data_depth, hidden_size).to(device)
-    
-    if model_path:
-        checkpoint = torch.load(model_path, map_location=device, weights_only=False)
-        decoder.load_state_dict(checkpoint['state_dict_decoder'])
-        print("Đã tải decoder đã được huấn luyện trước")
-    
-    decoder.eval()
-    
-    stego_img = Image.open(stego_image_path).convert('RGB')
-    image = np.array(stego_img) / 127.5 - 1.0
-    image = torch.FloatTensor(image).permute(2, 1, 0).unsqueeze(0)
-    
-    with torch.no_grad():
-        text = make_message(image, decoder, device)
-    
-    print(f"Đã giải mã message từ: {stego_image_path}")
-    print(f"Văn bản bí mật: {text}")
-    
-    return text
+def load_image_array(image):
+    """Đọc ảnh RGB thành mảng uint8 (H, W, 3); image có thể là đường dẫn, PIL.Image hoặc mảng"""
+    if isinstance(image, np.ndarray):
+        return image
+    if not isinstance(image, Image.Image):
+        image = Image.open(image)
+    return np.array(image.convert('RGB'))
 
-def reverse_hiding(stego_image_path, output_path, model_path=None):
-    if torch.backends.mps.is_available():
-        device = torch.device('mps')
-    elif torch.cuda.is_available():
-        device = torch.device('cuda')
-    else:
-        device = torch.device('cpu')
-    print(f"Đang sử dụng thiết bị: {device}")
-    
-    hidden_size = 32
-    reverse_decoder = ReverseDecoder(hidden_size).to(device)
-    
-    if model_path:
-        checkpoint = torch.load(model_path, map_location=device, weights_only=False)
-        if 'state_dict_reverse_decoder' in checkpoint:
-            reverse_decoder.load_state_dict(checkpoint['state_dict_reverse_decoder'])
-            print("Đã tải reverse decoder đã được huấn luyện trước")
-        else:
-            raise ValueError("Không tìm thấy trọng số reverse decoder trong checkpoint model. "
-                           "Model này không được huấn luyện với khả năng reverse hiding.")
-    else:
+def load_image_tensor(image, normalize=True):
+    """
+    Đọc ảnh RGB thành tensor (1, 3, W, H) trong khoảng [-1, 1] (hoặc giữ
+    nguyên 0..255 khi normalize=False, cho mô hình đã gộp phép chuẩn hóa).
+    image có thể là đường dẫn, PIL.Image hoặc mảng uint8 (H, W, 3).
+    """
+    return image_to_tensor(load_image_array(image), normalize=normalize)
+
+def image_to_tensor(pixels, normalize=True):
+    """
+    Chuyển mảng uint8 (H, W, 3) thành tensor float32 liên tục (1, 3, W, H)
+    bằng đúng một lần sao chép (đổi kiểu và layout cùng lúc); phép chuẩn hóa
+    về [-1, 1] được làm tại chỗ, không tạo mảng float64 trung gian.
+    """
+    height, width = pixels.shape[:2]
+    tensor = torch.empty(1, 3, width, height)
+    tensor[0].permute(2, 1, 0).copy_(torch.from_numpy(pixels))
+    if normalize:
+        tensor.div_(127.5).sub_(1.0)
+    return tensor
+
+def image_size(image):
+    """Kích thước (W, H) của ảnh mà không cần giải mã toàn bộ điểm ảnh"""
+    if isinstance(image, np.ndarray):
+        return image.shape[1], image.shape[0]
+    if isinstance(image, Image.Image):
+        return image.size
+    with Image.open(image) as img:
+        return img.size
+
+def size_batches(images, batch_size):
+    """
+    Gom chỉ số các ảnh cùng kích thước thành từng nhóm tối đa batch_size phần tử
+    để chạy chung một forward pass NCHW.
+    """
+    groups = {}
+    for i, image in enumerate(images):
+        groups.setdefault(image_size(image), []).append(i)
+    for indices in groups.values():
+        for start in range(0, len(indices), batch_size):
+            yield indices[start:start + batch_size]
+
+def tensor_to_image(tensor):
+    """
+    Chuyển tensor (3, W, H) trong [-1, 1] về mảng uint8 (H, W, 3): làm tròn
+    và kẹp về 0..255 trên tensor float32, đổi layout sau khi đã về uint8.
+    """
+    # Cộng thêm 0.5 rồi cắt phần thập phân khi đổi sang uint8 là phép làm tròn
+    pixels = tensor.detach().mul(127.5).add_(128.0).clamp_(0, 255).to(torch.uint8)
+    return pixels.permute(2, 1, 0).contiguous().cpu().numpy()
+
+def psnr(image, reference):
+    """PSNR (dB) giữa hai tensor ảnh trong khoảng [-1, 1]"""
+    mse = torch.mean((image.float() - reference.float()) ** 2).item()
+    return float('inf') if mse == 0 else 10 * math.log10(4.0 / mse)
+
+def save_image(image, output_path):
+    """Lưu mảng ảnh (H, W, 3) - dùng PIL (tương thích tốt hơn với Windows)"""
+    Image.fromarray(np.asarray(image, dtype=np.uint8)).save(output_path)
+
+
+def receptive_radius(model):
+    """Bán kính vùng tiếp nhận (pixel) của chuỗi tích chập trong mô hình"""
+    radius = 0
+    for module in model.modules():
+        if isinstance(module, nn.Conv2d):
+            radius += (module.kernel_size[0] - 1) // 2 * module.dilation[0]
+    return radius
+
+def tiled_forward(model, inputs, tile_size, halo=None, tile_batch=1):
+    """
+    Chạy model theo từng tile để bộ nhớ đỉnh chỉ phụ thuộc tile_size.
+
+    Mỗi tile (tile_size x tile_size) được mở rộng thêm một viền halo bằng bán
+    kính vùng tiếp nhận nên phần lõi cho kết quả giống hệt khi chạy trên toàn
+    ảnh. Các tile cùng kích thước được chạy chung theo nhóm tile_batch.
+
+    Args:
+        model: mô hình tích chập hoàn toàn, nhận các tensor trong inputs
+        inputs: danh sách tensor (N, C, W, H) có cùng kích thước không gian
+        tile_size: cạnh của phần lõi mỗi tile
+        halo: độ rộng viền, mặc định là receptive_radius(model)
+        tile_batch: số tile chạy trong một forward pass
+    """
+    if halo is None:
+        halo = receptive_radius(model)
+    width, height = inputs[0].shape[2:]
+    if width <= tile_size and height <= tile_size:
+        return model(*inputs)
+
+    groups = {}
+    for x0 in range(0, width, tile_size):
+        for y0 in range(0, height, tile_size):
+            x1, y1 = min(x0 + tile_size, width), min(y0 + tile_size, height)
+            px0, py0 = max(x0 - halo, 0), max(y0 - halo, 0)
+            px1, py1 = min(x1 + halo, width), min(y1 + halo, height)
+            tile = (x0, x1, y0, y1, px0, px1, py0, py1)
+            groups.setdefault((px1 - px0, py1 - py0), []).append(tile)
+
+    output = None
+    for tiles in groups.values():
+        for start in range(0, len(tiles), tile_batch):
+            chunk = tiles[start:start + tile_batch]
+            batch = [torch.cat([x[:, :, px0:px1, py0:py1] for (_, _, _, _, px0, px1, py0, py1) in chunk])
+                     for x in inputs]
+            result = model(*batch)
+            if output is None:
+                output = result.new_empty(inputs[0].size(0), result.size(1), width, height)
+            for k, (x0, x1, y0, y1, px0, px1, py0, py1) in enumerate(chunk):
+                n = inputs[0].size(0)
+                output[:, :, x0:x1, y0:y1] = result[k * n:(k + 1) * n, :,
+                                                    x0 - px0:x1 - px0, y0 - py0:y1 - py0]
+    return output
+
+
+class StegoEngine:
+    """
+    Phiên suy luận dùng lâu dài: chọn thiết bị và tải checkpoint đúng một lần,
+    giữ encoder, decoder và reverse decoder ở chế độ eval rồi dùng lại cho
+    mọi lần gọi encode/decode/reverse. Chi phí mỗi request chỉ còn tiền xử lý,
+    forward pass và I/O.
+
+    Khi đặt tile_size, ảnh lớn hơn một tile được xử lý theo từng tile có viền
+    chồng lấn (xem tiled_forward) nên bộ nhớ đỉnh không phụ thuộc kích thước ảnh.
+
+    Với optimize=True, BatchNorm của các mô hình được gộp vào tích chập và
+    decoder nhận trực tiếp ảnh 0..255 (xem optimize.optimize_for_inference).
+
+    model_path có thể là checkpoint huấn luyện (.dat) hoặc thư mục mô hình đã
+    xuất (xem model_export.py); khi đó không cần tới các lớp mô hình Python.
+    Lớp mô hình, data_depth và hidden_size được lấy từ checkpoint (xem
+    checkpoint_architecture); tham số data_depth và hidden_size chỉ dùng khi
+    không có checkpoint.
+
+    precision='bfloat16' chạy mô hình PyTorch với autocast bfloat16 và bộ nhớ
+    channels_last. Kết quả không bao giờ kém hơn float32: giải mã thất bại
+    (không qua được kiểm tra RS/frame) được chạy lại bằng float32, và ảnh
+    stego có PSNR kém bản float32 quá psnr_tolerance dB được mã hóa lại bằng
+    float32.
+
+    Các mô hình đã sẵn sàng suy luận được giữ trong cache (mặc định
+    model_cache.model_cache, dùng chung cả tiến trình), nên tạo lại engine cho
+    một checkpoint đã dùng không phải đọc lại file. cache=None để luôn tải mới.
+
+    roles giới hạn các mô hình được tải (ví dụ ('encoder',) khi chỉ mã hóa);
+    với thư mục checkpoint rút gọn (model_export.export_slim) hoặc thư mục đã
+    xuất, file của các mô hình khác không được đọc.
+    """
+
+    def __init__(self, model_path=None, device=None, data_depth=2, hidden_size=32, warmup=True,
+                 tile_size=None, tile_batch=1, ecc_symbols=None, optimize=True,
+                 precision='float32', psnr_tolerance=ENCODE_PSNR_TOLERANCE, cache=model_cache,
+                 roles=None):
+        if precision not in PRECISIONS:
+            raise ValueError(f"precision phải là một trong {PRECISIONS}, nhận được: {precision}")
+        self.model_path = model_path
+        self.device = device if device is not None else select_device()
+        self.data_depth = data_depth
+        self.hidden_size = hidden_size
+        self.tile_size = tile_size
+        self.tile_batch = tile_batch
+        self.bit_error_rate = None
+        self.ecc_symbols = ecc_symbols or DEFAULT_ECC_SYMBOLS
+        self.decoder_pixels = False
+        self.exported = bool(model_path) and is_export_dir(model_path) and not is_slim_export(model_path)
+        self.roles = tuple(roles) if roles else CACHED_ROLES
+        self._available_roles = ()
+        self.radius = {}
+        self.precision = precision
+        self.psnr_tolerance = psnr_tolerance
+        self._model_files = {}
+        # Mô hình chưa gộp BatchNorm (optimize=False) không được dùng chung
+        self.cache = cache if model_path and optimize else None
+        print(f"Đang sử dụng thiết bị: {self.device}")
+
+        # Khóa cache theo thiết bị và precision được yêu cầu (có thể đổi khi tải)
+        requested = (self.device, self.precision)
+        cached = self._load_cached(*requested)
+        if not cached:
+            if self.exported:
+                self._load_export(model_path)
+            else:
+                self._load_checkpoint(model_path)
+
+            for model in self.models():
+                model.eval()
+
+            if optimize and not self.exported:
+                self.optimize()
+
+            if self.precision != 'float32':
+                if self.exported:
+                    # Mô hình đã xuất có kiểu dữ liệu và layout cố định
+                    print(f"Mô hình đã xuất chỉ chạy float32, bỏ qua precision={self.precision}")
+                    self.precision = 'float32'
+                else:
+                    for model in self.models():
+                        model.to(memory_format=torch.channels_last)
+                    print(f"Chế độ độ chính xác: {self.precision} (channels_last)")
+            self._store_cached(*requested)
+
+        if self.bit_error_rate is not None and ecc_symbols is None:
+            self.ecc_symbols = choose_ecc_symbols(self.bit_error_rate * ECC_BER_MARGIN)
+        print(f"Số byte ECC mỗi khối Reed-Solomon: {self.ecc_symbols}")
+
+        # Tách phần encoder chỉ phụ thuộc ảnh cover cho encode_variants
+        self.shared_encoder = None
+        if not self.exported and self.encoder is not None:
+            self.shared_encoder = SharedCoverEncoder(self.encoder)
+
+        # Mô hình lấy từ cache đã được chạy thử khi tải lần đầu
+        if warmup and not cached:
+            self.warmup()
+
+    def _cache_key(self, role, device, precision):
+        return self.cache.key(self.model_path, role, device, precision)
+
+    def _load_cached(self, device, precision):
+        """
+        Lấy các mô hình và thông tin đi kèm từ cache (xem model_cache.py).
+        Trả về False nếu cache không có đủ mọi mô hình của checkpoint.
+        """
+        if self.cache is None:
+            return False
+        info = self.cache.get(self._cache_key('info', device, precision))
+        if info is None:
+            return False
+        entries = {role: self.cache.get(self._cache_key(role, device, precision))
+                   for role in info['roles'] if role in self.roles}
+        if any(entry is None for entry in entries.values()):
+            return False
+        for name, value in info['attributes'].items():
+            setattr(self, name, value)
+        self._available_roles = tuple(info['roles'])
+        for role in CACHED_ROLES:
+            model, attributes = entries.get(role, (None, {}))
+            setattr(self, role, model)
+            for name, value in attributes.items():
+                setattr(self, name, value)
+        print(f"Đã lấy mô hình từ cache: {self.model_path}")
+        return True
+
+    def _store_cached(self, device, precision):
+        """Đưa các mô hình đã sẵn sàng suy luận vào cache, khóa theo thiết bị và precision được yêu cầu"""
+        if self.cache is None:
+            return
+        for role in CACHED_ROLES:
+            model = getattr(self, role)
+            if model is not None:
+                attributes = {name: getattr(self, name) for name in CACHED_ROLE_ATTRIBUTES.get(role, ())}
+                self.cache.put(self._cache_key(role, device, precision), (model, attributes),
+                               model_nbytes(model, self._model_files.get(role)))
+        # roles: mọi mô hình có trong checkpoint, kể cả mô hình chưa được tải
+        attributes = {name: getattr(self, name) for name in CACHED_ATTRIBUTES}
+        self.cache.put(self._cache_key('info', device, precision),
+                       {'roles': list(self._available_roles), 'attributes': attributes}, 0)
+
+    def _load_checkpoint(self, model_path):
+        """Tạo các mô hình PyTorch và nạp trọng số từ checkpoint huấn luyện"""
+        if model_path and is_export_dir(model_path):
+            return self._load_slim(model_path)
+
+        # Không có checkpoint: trọng số ngẫu nhiên với kiến trúc mặc định
+        checkpoint = None
+        classes = {'encoder': 'ResidualEncoder', 'decoder': 'BasicDecoder'}
+        if model_path:
+            checkpoint = torch.load(model_path, map_location=self.device, weights_only=False)
+            self.data_depth, self.hidden_size, classes = checkpoint_architecture(checkpoint)
+        self._available_roles = tuple(classes)
+
+        for role in CACHED_ROLES:
+            model = None
+            if role in classes and role in self.roles:
+                model = build_model(classes[role], self.data_depth, self.hidden_size).to(self.device)
+                if checkpoint is not None:
+                    model.load_state_dict(checkpoint[f'state_dict_{role}'])
+                    print(f"Đã tải {role} ({classes[role]}) đã được huấn luyện trước")
+            setattr(self, role, model)
+
+        if checkpoint is not None:
+            print(f"Kiến trúc: data_depth={self.data_depth}, hidden_size={self.hidden_size}")
+            accuracy = checkpoint.get('metrics', {}).get('val.decoder_acc')
+            if accuracy:
+                self.bit_error_rate = 1.0 - float(np.mean(accuracy))
+            del checkpoint
+
+    def _load_slim(self, export_dir):
+        """
+        Dựng các mô hình PyTorch từ thư mục checkpoint rút gọn. Trọng số dùng
+        trực tiếp tensor ánh xạ bộ nhớ từ file (không sao chép) khi chạy trên CPU.
+        """
+        manifest, state_dicts = load_state_dicts(export_dir, self.roles)
+        self._apply_manifest(manifest)
+        for role in CACHED_ROLES:
+            model = None
+            if role in state_dicts:
+                model = build_model(manifest['architecture'][role], self.data_depth, self.hidden_size)
+                model.load_state_dict(state_dicts[role], assign=True)
+                model.to(self.device)
+            setattr(self, role, model)
+        print(f"Đã tải checkpoint rút gọn ({', '.join(state_dicts)}) từ {export_dir}")
+
+    def _apply_manifest(self, manifest):
+        """Thông tin của mô hình đã xuất lấy từ manifest"""
+        self.data_depth = manifest['data_depth']
+        self.hidden_size = manifest['hidden_size']
+        self.decoder_pixels = manifest.get('decoder_input') == 'pixels'
+        self.bit_error_rate = manifest.get('bit_error_rate')
+        self.radius = manifest.get('receptive_radius', {})
+        self._available_roles = tuple(manifest['files'])
+
+    def _load_export(self, export_dir):
+        """Tải các mô hình đã xuất cùng thông tin trong manifest"""
+        manifest = read_manifest(export_dir)
+        if (manifest['format'] == 'onnx' or 'quantization' in manifest) and self.device.type != 'cpu':
+            # ONNX Runtime và các phép INT8 chạy trên CPU, trả về tensor CPU
+            self.device = torch.device('cpu')
+            print(f"Mô hình {manifest['format']} chỉ chạy trên CPU, chuyển sang thiết bị: {self.device}")
+        manifest, models = load_export(export_dir, self.device, self.roles)
+        self._apply_manifest(manifest)
+        for role in CACHED_ROLES:
+            setattr(self, role, models.get(role))
+        self._model_files = {role: os.path.join(export_dir, filename)
+                             for role, filename in manifest['files'].items()}
+        print(f"Đã tải mô hình đã xuất ({manifest['format']}) từ {export_dir}")
+
+    def _receptive_radius(self, role):
+        """Bán kính vùng tiếp nhận của encoder/decoder/reverse_decoder"""
+        if role in self.radius:
+            return self.radius[role]
+        return receptive_radius(getattr(self, role))
+
+    def models(self):
+        """Danh sách các mô hình đã tải"""
+        return [m for m in (self.encoder, self.decoder, self.reverse_decoder) if m is not None]
+
+    def optimize(self, tolerance=1e-3):
+        """
+        Gộp BatchNorm vào tích chập cho mọi mô hình (và phép chuẩn hóa ảnh cho
+        decoder). Mô hình nào cho kết quả lệch quá tolerance so với bản gốc
+        trên một ảnh mẫu sẽ được giữ nguyên.
+        """
+        image = torch.rand(1, 3, 23, 17, device=self.device) * 2 - 1
+        payload = torch.randint(0, 2, (1, self.data_depth, 23, 17), device=self.device).float()
+        pixels = (image + 1.0) * 127.5
+        roles = [('encoder', None, (image, payload), None),
+                 ('decoder', PIXEL_SCALE, (image,), (pixels,)),
+                 ('reverse_decoder', None, (image,), None)]
+        for name, input_scale, inputs, optimized_inputs in roles:
+            model = getattr(self, name)
+            if model is None:
+                continue
+            optimized = optimize_for_inference(model, input_scale)
+            error = max_difference(model, optimized, *inputs, optimized_inputs=optimized_inputs)
+            if error > tolerance:
+                print(f"Bỏ qua tối ưu {name}: sai khác {error:.2e} vượt ngưỡng {tolerance:.0e}")
+                continue
+            setattr(self, name, optimized)
+            if name == 'decoder':
+                self.decoder_pixels = True
+
+    def _decoder_input(self, image):
+        """Tensor ảnh đầu vào của decoder (0..255 nếu decoder đã gộp phép chuẩn hóa)"""
+        return load_image_tensor(image, normalize=not self.decoder_pixels)
+
+    def warmup(self, size=32):
+        """Chạy thử một ảnh nhỏ để khởi tạo sẵn kernel/bộ nhớ đệm của backend"""
+        image = torch.zeros(1, 3, size, size, device=self.device)
+        payload = torch.zeros(1, self.data_depth, size, size, device=self.device)
+        with torch.no_grad():
+            if self.encoder is not None:
+                self.encoder(image, payload)
+            if self.decoder is not None:
+                self.decoder(image)
+            if self.reverse_decoder is not None:
+                self.reverse_decoder(image)
+
+    def _autocast(self, precision):
+        """Ngữ cảnh autocast cho precision (không làm gì với float32)"""
+        if precision == 'float32':
+            return contextlib.nullcontext()
+        return torch.autocast(self.device.type, dtype=getattr(torch, precision))
+
+    def _memory_format(self, x):
+        """Đổi tensor đầu vào sang channels_last khi chạy ở precision thấp"""
+        if self.precision == 'float32':
+            return x
+        return x.contiguous(memory_format=torch.channels_last)
+
+    def _forward(self, role, *inputs, tile_size=None, precision=None):
+        """
+        Forward pass của một mô hình ở precision (mặc định self.precision),
+        theo tile nếu tile_size (hoặc self.tile_size) được đặt. Đầu ra luôn là
+        float32.
+        """
+        model = getattr(self, role)
+        if model is None:
+            raise ValueError(f"Engine không tải {role} (roles={', '.join(self.roles)})")
+        tile_size = tile_size or self.tile_size
+        inputs = [self._memory_format(x) for x in inputs]
+        with self._autocast(precision or self.precision):
+            if not tile_size:
+                output = model(*inputs)
+            else:
+                output = tiled_forward(model, inputs, tile_size, halo=self._receptive_radius(role),
+                                       tile_batch=self.tile_batch)
+        return output.float()
+
+    def _encode_tensor(self, cover, payload, tile_size=None):
+        """
+        Chạy encoder và trả về ảnh stego trong [-1, 1]. Ở precision thấp, PSNR
+        của ENCODE_CHECK_COLUMNS cột đầu được so với kết quả float32 trên cùng
+        vùng; nếu kém hơn quá psnr_tolerance dB thì mã hóa lại bằng float32.
+        """
+        with torch.no_grad():
+            generated = self._forward('encoder', cover, payload, tile_size=tile_size).clamp(-1.0, 1.0)
+        return self._check_encode(cover, payload, generated, tile_size=tile_size)
+
+    def _check_encode(self, cover, payload, generated, tile_size=None):
+        """Giữ generated nếu đạt ngưỡng PSNR so với float32, nếu không mã hóa lại bằng float32"""
+        if self.precision == 'float32':
+            return generated
+
+        with torch.no_grad():
+            columns = min(cover.size(2), ENCODE_CHECK_COLUMNS)
+            context = min(cover.size(2), columns + self._receptive_radius('encoder'))
+            reference = self._forward('encoder', cover[:, :, :context], payload[:, :, :context],
+                                      precision='float32')[:, :, :columns].clamp(-1.0, 1.0)
+            region = cover[:, :, :columns]
+            loss = psnr(reference, region) - psnr(generated[:, :, :columns], region)
+            if loss <= self.psnr_tolerance:
+                return generated
+
+            print(f"PSNR ở {self.precision} kém float32 {loss:.2f} dB "
+                  f"(ngưỡng {self.psnr_tolerance} dB), mã hóa lại bằng float32")
+            return self._forward('encoder', cover, payload, tile_size=tile_size,
+                                 precision='float32').clamp(-1.0, 1.0)
+
+    def _require_reverse_decoder(self):
+        if self.reverse_decoder is not None:
+            return
+        if 'reverse_decoder' not in self.roles:
+            raise ValueError(f"Engine không tải reverse decoder (roles={', '.join(self.roles)})")
+        if not self.model_path:
+            raise ValueError("Không cung cấp đường dẫn model. Reverse hiding yêu cầu model đã được huấn luyện.")
+        raise ValueError("Không tìm thấy trọng số reverse decoder trong checkpoint model. "
+                         "Model này không được huấn luyện với khả năng reverse hiding.")
+
+    def encode(self, cover_image_path, secret_text, output_path, tile_size=None):
+        """Giấu secret_text vào ảnh cover và lưu ảnh stego ra output_path"""
+        cover = load_image_tensor(cover_image_path)
+        cover_size = cover.size()
+
+        payload = make_payload(cover_size[3], cover_size[2], self.data_depth, secret_text,
+                               nsym=self.ecc_symbols)
+
+        cover = cover.to(self.device)
+        payload = payload.to(self.device)
+
+        generated = self._encode_tensor(cover, payload, tile_size=tile_size)[0]
+
+        save_image(tensor_to_image(generated), output_path)
+
+        print(f"Đã mã hóa message vào: {output_path}")
+        print(f"Văn bản bí mật: {secret_text}")
+
+    def decode(self, stego_image_path, tile_size=None, progressive=True):
+        """
+        Trích xuất message từ ảnh stego. Mặc định giải mã tăng dần
+        (xem decode_progressive); progressive=False chạy decoder trên toàn ảnh.
+        Nếu giải mã ở precision thấp thất bại, thử lại bằng float32.
+        """
+        text = self._decode_with_fallback(stego_image_path, tile_size, progressive)
+
+        print(f"Đã giải mã message từ: {stego_image_path}")
+        print(f"Văn bản bí mật: {text}")
+
+        return text
+
+    def _decode_with_fallback(self, image, tile_size, progressive):
+        try:
+            return self._decode(image, tile_size, progressive, self.precision)
+        except ValueError as e:
+            if self.precision == 'float32' or self.decoder is None:
+                raise
+            print(f"Giải mã ở {self.precision} thất bại ({e}), thử lại bằng float32")
+            return self._decode(image, tile_size, progressive, 'float32')
+
+    def _decode(self, stego_image_path, tile_size, progressive, precision):
+        if progressive:
+            return self.decode_progressive(stego_image_path, tile_size=tile_size, precision=precision)
+
+        image = self._decoder_input(stego_image_path).to(self.device)
+        with torch.no_grad():
+            logits = self._forward('decoder', image, tile_size=tile_size, precision=precision)
+        return extract_message(logits.reshape(-1))
+
+    def decode_progressive(self, image, tile_size=None, min_bits=PROGRESSIVE_MIN_BITS, precision=None):
+        """
+        Giải mã trên các dải cột tăng dần của ảnh và dừng ngay khi khôi phục
+        được một frame hợp lệ.
+
+        Payload được trải theo thứ tự (kênh, x, y) nên N cột đầu tiên chứa một
+        đoạn bit liên tục của mỗi kênh, bắt đầu tại vị trí kênh * W * H. Mỗi
+        bước chỉ chạy decoder trên các cột mới (kèm viền bằng bán kính vùng
+        tiếp nhận nên logits giống hệt khi chạy trên toàn ảnh), số cột tăng
+        gấp đôi sau mỗi lần thử. Chi phí vì vậy tỉ lệ với độ dài message chứ
+        không phải diện tích ảnh; toàn ảnh chỉ được dùng khi không giải mã
+        được frame nào (ví dụ ảnh stego định dạng cũ).
+        """
+        pixels = load_image_array(image)
+        height, width = pixels.shape[:2]
+        halo = self._receptive_radius('decoder')
+
+        strips = []
+        done = 0
+        columns = min(width, max(1, -(-min_bits // height)))
+        while True:
+            px0, px1 = max(done - halo, 0), min(columns + halo, width)
+            crop = self._decoder_input(pixels[:, px0:px1]).to(self.device)
+            with torch.no_grad():
+                logits = self._forward('decoder', crop, tile_size=tile_size, precision=precision)
+            strips.append(logits[:, :, done - px0:columns - px0].cpu())
+            done = columns
+            logits = torch.cat(strips, dim=2)
+
+            if done == width:
+                return extract_message(logits.reshape(-1))
+
+            for channel in range(logits.size(1)):
+                text = decode_frames(logits[0, channel].reshape(-1).numpy(),
+                                     start=channel * width * height)
+                if isinstance(text, str):
+                    return text
+            columns = min(width, 2 * columns)
+
+    def reverse(self, stego_image_path, output_path, tile_size=None):
+        """Khôi phục ảnh cover từ ảnh stego, lưu ra output_path và trả về mảng ảnh uint8"""
+        self._require_reverse_decoder()
+
+        recovered_cover = self._reverse(stego_image_path, tile_size)
+        save_image(recovered_cover, output_path)
+
+        print(f"Đã khôi phục ảnh cover và lưu vào: {output_path}")
+
+        return recovered_cover
+
+    def _reverse(self, image, tile_size):
+        stego = load_image_tensor(image).to(self.device)
+        with torch.no_grad():
+            recovered_cover = self._forward('reverse_decoder', stego, tile_size=tile_size)[0].clamp(-1.0, 1.0)
+        return tensor_to_image(recovered_cover)
+
+    def decode_and_reverse(self, stego_image_path, output_path, tile_size=None, progressive=True):
+        """
+        Trích xuất message và khôi phục ảnh cover từ cùng một ảnh stego. Ảnh
+        chỉ được đọc và giải nén một lần, decoder và reverse decoder dùng
+        chung mảng pixel đó trong cùng engine. Ảnh cover được lưu ra
+        output_path. Trả về (message, mảng ảnh cover uint8 (H, W, 3)).
+        """
+        self._require_reverse_decoder()
+
+        pixels = load_image_array(stego_image_path)
+        text = self._decode_with_fallback(pixels, tile_size, progressive)
+        recovered_cover = self._reverse(pixels, tile_size)
+        save_image(recovered_cover, output_path)
+
+        print(f"Đã giải mã message từ: {stego_image_path}")
+        print(f"Văn bản bí mật: {text}")
+        print(f"Đã khôi phục ảnh cover và lưu vào: {output_path}")
+
+        return text, recovered_cover
+
+
+    def encode_batch(self, covers, messages, output_paths=None, batch_size=8):
+        """
+        Giấu messages[i] vào covers[i]. Các ảnh cùng kích thước được xếp thành
+        batch và mã hóa trong một forward pass. Trả về danh sách ảnh stego
+        uint8 (H, W, 3) theo đúng thứ tự đầu vào.
+        """
+        if len(covers) != len(messages):
+            raise ValueError("Số lượng ảnh cover và message phải bằng nhau")
+
+        results = [None] * len(covers)
+        for indices in size_batches(covers, batch_size):
+            cover = torch.cat([load_image_tensor(covers[i]) for i in indices])
+            cover_size = cover.size()
+            payload = torch.cat([make_payload(cover_size[3], cover_size[2], self.data_depth, messages[i],
+                                              nsym=self.ecc_symbols)
+                                 for i in indices])
+
+            generated = self._encode_tensor(cover.to(self.device), payload.to(self.device))
+
+            for i, stego in zip(indices, generated):
+                results[i] = tensor_to_image(stego)
+                if output_paths is not None:
+                    save_image(results[i], output_paths[i])
+
+        print(f"Đã mã hóa {len(covers)} ảnh theo batch")
+        return results
+
+    def encode_variants(self, cover, messages, output_paths=None, batch_size=8, tile_size=None):
+        """
+        Giấu từng message trong messages vào cùng một ảnh cover (ví dụ mỗi
+        người nhận một bản). Phần encoder chỉ phụ thuộc ảnh được tính một lần
+        (xem optimize.SharedCoverEncoder), chỉ các lớp phụ thuộc payload chạy
+        theo batch. Trả về danh sách ảnh stego uint8 (H, W, 3) theo thứ tự
+        messages.
+
+        Khi chạy theo tile (tile_size hoặc self.tile_size), phần dùng chung của
+        cả ảnh không còn vừa giới hạn bộ nhớ nên mỗi message được mã hóa riêng
+        theo tile như encode.
+        """
+        tile_size = tile_size or self.tile_size
+        image = self._memory_format(load_image_tensor(cover).to(self.device))
+        shared = self.shared_encoder if not tile_size else None
+        if tile_size:
+            batch_size = 1
+        if shared is not None:
+            with torch.no_grad(), self._autocast(self.precision):
+                state = shared.trunk(image)
+
+        results = []
+        for start in range(0, len(messages), batch_size):
+            chunk = messages[start:start + batch_size]
+            payload = torch.cat([make_payload(image.size(3), image.size(2), self.data_depth, message,
+                                              nsym=self.ecc_symbols)
+                                 for message in chunk]).to(self.device)
+            covers = image.expand(len(chunk), -1, -1, -1)
+
+            if shared is None:
+                generated = self._encode_tensor(covers, payload, tile_size=tile_size)
+            else:
+                with torch.no_grad(), self._autocast(self.precision):
+                    generated = shared.heads(state, self._memory_format(payload)).float().clamp(-1.0, 1.0)
+                generated = self._check_encode(covers, payload, generated)
+
+            for i, stego in enumerate(generated, start):
+                results.append(tensor_to_image(stego))
+                if output_paths is not None:
+                    save_image(results[i], output_paths[i])
+
+        print(f"Đã mã hóa {len(messages)} biến thể của ảnh cover")
+        return results
+
+    def decode_batch(self, images, batch_size=8):
+        """
+        Trích xuất message từ nhiều ảnh stego, chạy decoder theo batch các ảnh
+        cùng kích thước. Ảnh giải mã thất bại ở precision thấp được thử lại
+        bằng float32; ảnh vẫn không giải mã được sẽ có kết quả None.
+        """
+        results = [None] * len(images)
+        pending = list(range(len(images)))
+        errors = {}
+        for precision in dict.fromkeys((self.precision, 'float32')):
+            if precision != self.precision:
+                print(f"{len(pending)} ảnh giải mã thất bại ở {self.precision}, thử lại bằng float32")
+            for batch in size_batches([images[i] for i in pending], batch_size):
+                indices = [pending[k] for k in batch]
+                image = torch.cat([self._decoder_input(images[i]) for i in indices])
+
+                with torch.no_grad():
+                    logits = self._forward('decoder', image.to(self.device), precision=precision)
+
+                for i, item in zip(indices, logits):
+                    try:
+                        results[i] = extract_message(item.reshape(-1))
+                    except ValueError as e:
+                        errors[i] = e
+            pending = [i for i in pending if results[i] is None]
+            if not pending:
+                break
+
+        for i in pending:
+            print(f"Không giải mã được ảnh thứ {i}: {errors[i]}")
+
+        print(f"Đã giải mã {sum(r is not None for r in results)}/{len(images)} ảnh theo batch")
+        return results
+
+    def reverse_batch(self, images, output_paths=None, batch_size=8):
+        """
+        Khôi phục ảnh cover cho nhiều ảnh stego theo batch. Trả về danh sách
+        mảng uint8 (H, W, 3) theo đúng thứ tự đầu vào.
+        """
+        self._require_reverse_decoder()
+
+        results = [None] * len(images)
+        for indices in size_batches(images, batch_size):
+            stego = torch.cat([load_image_tensor(images[i]) for i in indices])
+
+            with torch.no_grad():
+                recovered = self._forward('reverse_decoder', stego.to(self.device)).clamp(-1.0, 1.0)
+
+            for i, item in zip(indices, recovered):
+                results[i] = tensor_to_image(item)
+                if output_paths is not None:
+                    save_image(results[i], output_paths[i])
+
+        print(f"Đã khôi phục {len(images)} ảnh cover theo batch")
+        return results
+
+
+_default_engine = None
+_default_engine_key = None
+_default_engine_lock = threading.Lock()
+
+def get_engine(model_path=None, precision='float32', roles=None):
+    """
+    Trả về engine dùng chung cho model_path. Engine chỉ được tạo lại khi
+    checkpoint (hoặc mtime của nó) hoặc precision được yêu cầu khác với engine
+    đang giữ, hoặc engine đang giữ không tải đủ các mô hình trong roles; các
+    mô hình của checkpoint đã dùng trước đó được lấy lại từ model_cache thay
+    vì đọc lại file.
+
+    roles chỉ thu hẹp việc tải với thư mục mô hình (rút gọn hoặc đã xuất), nơi
+    mỗi mô hình là một file riêng. Checkpoint .dat luôn được tải đủ mọi mô
+    hình trong một lần torch.load, để chuyển qua lại giữa encode, decode và
+    reverse không phải đọc lại file.
+    """
+    global _default_engine, _default_engine_key
+    key = (model_path, source_mtime(model_path) if model_path else None, precision)
+    # Trọng số ngẫu nhiên chỉ có nghĩa khi encoder và decoder thuộc cùng một engine
+    roles = roles if model_path and os.path.isdir(model_path) else None
+    with _default_engine_lock:
+        engine = _default_engine
+        if engine is None or _default_engine_key != key or \
+                not set(roles or CACHED_ROLES) <= set(engine.roles):
+            engine = StegoEngine(model_path, precision=precision, roles=roles)
+            _default_engine = engine
+            _default_engine_key = key
+    return engine
+
+def encode_message(cover_image_path, secret_text, output_path, model_path=None, tile_size=None,
+                   precision='float32'):
+    return get_engine(model_path, precision, ('encoder',)).encode(cover_image_path, secret_text, output_path,
+                                                                  tile_size=tile_size)
+
+def decode_message(stego_image_path, model_path=None, tile_size=None, progressive=True,
+                   precision='float32'):
+    return get_engine(model_path, precision, ('decoder',)).decode(stego_image_path, tile_size=tile_size,
+                                                                  progressive=progressive)
+
+def reverse_hiding(stego_image_path, output_path, model_path=None, tile_size=None, precision='float32'):
+    if not model_path:
         raise ValueError("Không cung cấp đường dẫn model. Reverse hiding yêu cầu model đã được huấn luyện.")
-    
-    reverse_decoder.eval()
-    
-    stego_img = Image.open(stego_image_path).convert('RGB')
-    stego_im = np.array(stego_img) / 127.5 - 1.0
-    stego = torch.FloatTensor(stego_im).permute(2, 1, 0).unsqueeze(0)
-    stego = stego.to(device)
-    
-    with torch.no_grad():
-        recovered_cover = reverse_decoder(stego)[0].clamp(-1.0, 1.0)
-    
-    recovered_cover = (recovered_cover.permute(2, 1, 0).detach().cpu().numpy() + 1.0) * 127.5
-    recovered_cover_img = recovered_cover.astype('uint8')
-    
-    # Sử dụng PIL để lưu ảnh (tương thích tốt hơn với Windows)
-    img = Image.fromarray(recovered_cover_img)
-    img.save(output_path)
-    
-    print(f"Đã khôi phục ảnh cover và lưu vào: {output_path}")
-    
-    return recovered_cover
\ No newline at end of file
+    return get_engine(model_path, precision, ('reverse_decoder',)).reverse(stego_image_path, output_path,
+                                                                           tile_size=tile_size)
+
+def decode_and_reverse(stego_image_path, output_path, model_path=None, tile_size=None, progressive=True,
+                       precision='float32'):
+    if not model_path:
+        raise ValueError("Không cung cấp đường dẫn model. Reverse hiding yêu cầu model đã được huấn luyện.")
+    return get_engine(model_path, precision, ('decoder', 'reverse_decoder')).decode_and_reverse(
+        stego_image_path, output_path, tile_size=tile_size, progressive=progressive)
+
+def encode_batch(covers, messages, output_paths=None, model_path=None, batch_size=8):
+    return get_engine(model_path, roles=('encoder',)).encode_batch(covers, messages, output_paths, batch_size)
+
+def encode_variants(cover, messages, output_paths=None, model_path=None, batch_size=8, tile_size=None):
+    return get_engine(model_path, roles=('encoder',)).encode_variants(cover, messages, output_paths, batch_size,
+                                                                      tile_size=tile_size)
+
+def decode_batch(images, model_path=None, batch_size=8):
+    return get_engine(model_path, roles=('decoder',)).decode_batch(images, batch_size)
+
+def reverse_batch(images, output_paths=None, model_path=None, batch_size=8):
+    if not model_path:
+        raise ValueError("Không cung cấp đường dẫn model. Reverse hiding yêu cầu model đã được huấn luyện.")
+    return get_engine(model_path, roles=('reverse_decoder',)).reverse_batch(images, output_paths, batch_size)
@@ -100,7 +100,6 @@ packages = {
     "matplotlib": ("matplotlib", True),
     "pycryptodome": ("Crypto.PublicKey", False),
     "imageio": ("imageio", True),
-    "reedsolo": ("reedsolo", True),
     "pyinstaller": ("PyInstaller", True),
 }
 
@@ -156,7 +155,7 @@ import sys
 try:
     import torch, torchvision
     from PIL import Image
-    import numpy, imageio, reedsolo
+    import numpy, imageio
     from skimage.metrics import peak_signal_noise_ratio
     import matplotlib, PyInstaller
     print("✓ Xac nhan tat ca dependencies da OK")
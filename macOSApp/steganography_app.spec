@@ -68,7 +68,6 @@ a = Analysis(
         'Crypto.Cipher.PKCS1_OAEP',
         'Crypto.Random',
         'Crypto.Util.Padding',
-        'reedsolo',
         'zlib',
         'skimage',
         'skimage.metrics',
@@ -83,6 +82,10 @@ a = Analysis(
         'decoder',
         'reverse_decoder',
         'critic',
+        'rs_codec',
+        'optimize',
+        'model_export',
+        'model_cache',
         'enhancedstegan',
     ],
     hookspath=[],
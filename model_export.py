@@ -0,0 +1,334 @@
+"""
+Xuất mô hình đã huấn luyện thành artifact độc lập và tải lại để suy luận.
+
+Một thư mục xuất gồm manifest.json và một file cho mỗi mô hình (encoder,
+decoder, reverse_decoder), ở dạng TorchScript hoặc ONNX. Mô hình được xuất
+sau khi đã gộp BatchNorm (xem optimize.py), nên artifact chạy được mà không
+cần các lớp mô hình Python và không phải đọc checkpoint huấn luyện (kèm
+trạng thái optimizer) khi khởi động. Mô hình ONNX được chạy bằng ONNX
+Runtime (CPU) nếu thư viện này đã được cài.
+
+Định dạng rút gọn (format state_dict) chỉ giữ state_dict gốc của từng mô
+hình, không có critic, optimizer, scheduler hay danh sách metrics của
+checkpoint huấn luyện. Các file được tải bằng mmap: chỉ mô hình cần dùng
+được đọc từ đĩa và các tiến trình cùng tải một file dùng chung trang bộ nhớ.
+"""
+import os
+import json
+import time
+import warnings
+from datetime import datetime
+import numpy as np
+import torch
+
+try:
+    import onnxruntime
+except ImportError:
+    onnxruntime = None
+
+EXPORT_MANIFEST = 'manifest.json'
+EXPORT_ROLES = ('encoder', 'decoder', 'reverse_decoder')
+# Thư mục chỉ chứa state_dict của các mô hình (dựng lại bằng lớp Python)
+SLIM_FORMAT = 'state_dict'
+
+
+def is_export_dir(path):
+    """Kiểm tra path có phải thư mục mô hình đã xuất (có manifest.json)"""
+    return os.path.isdir(path) and os.path.isfile(os.path.join(path, EXPORT_MANIFEST))
+
+
+def is_slim_export(path):
+    """Kiểm tra path có phải thư mục checkpoint rút gọn (format state_dict)"""
+    return is_export_dir(path) and read_manifest(path).get('format') == SLIM_FORMAT
+
+
+def read_manifest(export_dir):
+    with open(os.path.join(export_dir, EXPORT_MANIFEST), 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def write_manifest(export_dir, manifest):
+    with open(os.path.join(export_dir, EXPORT_MANIFEST), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2, ensure_ascii=False)
+
+
+def sample_inputs(role, data_depth, size, pixels=False, batch=1):
+    """Đầu vào mẫu (batch, C, W, H) cho một mô hình"""
+    image = torch.rand(batch, 3, *size) * 2 - 1
+    if role == 'encoder':
+        return image, torch.randint(0, 2, (batch, data_depth, *size)).float()
+    if role == 'decoder' and pixels:
+        return ((image + 1.0) * 127.5,)
+    return (image,)
+
+
+def export_manifest(engine, model_path, export_format):
+    """Thông tin chung của một lần xuất, lấy từ StegoEngine đã tải checkpoint"""
+    from enhancedstegan import receptive_radius
+    return {
+        'format': export_format,
+        'source': os.path.basename(model_path),
+        'date': datetime.now().isoformat(timespec='seconds'),
+        'data_depth': engine.data_depth,
+        'hidden_size': engine.hidden_size,
+        'decoder_input': 'pixels' if engine.decoder_pixels else 'normalized',
+        'bit_error_rate': engine.bit_error_rate,
+        'receptive_radius': {role: receptive_radius(getattr(engine, role))
+                             for role in EXPORT_ROLES if getattr(engine, role) is not None},
+        'files': {},
+    }
+
+
+def export_torchscript(model_path, output_dir, sample_size=(64, 48), freeze=True, tolerance=1e-3):
+    """
+    Trace encoder, decoder và reverse decoder (đã gộp BatchNorm) của checkpoint
+    thành các file TorchScript trong output_dir.
+
+    Mỗi mô hình được trace trên ảnh sample_size rồi kiểm tra lại trên một ảnh
+    có kích thước khác, để chắc chắn graph không bị cố định theo kích thước.
+    Với freeze=True, trọng số được nhúng thành hằng số (torch.jit.freeze).
+    Trả về manifest đã ghi.
+    """
+    from enhancedstegan import StegoEngine
+
+    engine = StegoEngine(model_path, device=torch.device('cpu'), warmup=False)
+    manifest = export_manifest(engine, model_path, 'torchscript')
+    os.makedirs(output_dir, exist_ok=True)
+
+    check_size = (sample_size[0] + 13, sample_size[1] + 7)
+    for role in EXPORT_ROLES:
+        model = getattr(engine, role)
+        if model is None:
+            continue
+        pixels = role == 'decoder' and engine.decoder_pixels
+        filename = f'{role}.pt'
+        error = save_torchscript(model, os.path.join(output_dir, filename),
+                                 sample_inputs(role, engine.data_depth, sample_size, pixels),
+                                 sample_inputs(role, engine.data_depth, check_size, pixels),
+                                 freeze=freeze, tolerance=tolerance)
+        manifest['files'][role] = filename
+        print(f"Đã xuất {role} -> {os.path.join(output_dir, filename)} (sai khác {error:.1e})")
+
+    write_manifest(output_dir, manifest)
+    return manifest
+
+
+def metrics_summary(metrics):
+    """Giá trị trung bình của epoch đã lưu cho mỗi chỉ số val.* trong checkpoint"""
+    return {name: float(np.mean(values)) for name, values in metrics.items()
+            if name.startswith('val.') and len(values)}
+
+
+def export_slim(model_path, output_dir):
+    """
+    Tách checkpoint huấn luyện thành thư mục rút gọn chỉ dùng để suy luận:
+    mỗi mô hình một file state_dict và manifest.json ghi lớp mô hình,
+    data_depth, hidden_size và tóm tắt metrics. Trọng số được giữ nguyên
+    (chưa gộp BatchNorm) nên StegoEngine vẫn tối ưu hóa và chạy bfloat16 được
+    như với checkpoint gốc. Trả về manifest đã ghi.
+    """
+    from enhancedstegan import StegoEngine
+
+    engine = StegoEngine(model_path, device=torch.device('cpu'), optimize=False, warmup=False, cache=None)
+    checkpoint = torch.load(model_path, map_location='cpu', weights_only=False)
+    manifest = export_manifest(engine, model_path, SLIM_FORMAT)
+    manifest['architecture'] = {}
+    manifest['epoch'] = checkpoint.get('train_epoch')
+    manifest['metrics'] = metrics_summary(checkpoint.get('metrics', {}))
+    del checkpoint
+    os.makedirs(output_dir, exist_ok=True)
+
+    for role in EXPORT_ROLES:
+        model = getattr(engine, role)
+        if model is None:
+            continue
+        filename = f'{role}.pt'
+        torch.save(model.state_dict(), os.path.join(output_dir, filename))
+        manifest['architecture'][role] = type(model).__name__
+        manifest['files'][role] = filename
+        print(f"Đã xuất {role} -> {os.path.join(output_dir, filename)}")
+
+    write_manifest(output_dir, manifest)
+    return manifest
+
+
+def load_state_dicts(export_dir, roles=None):
+    """
+    Đọc thư mục checkpoint rút gọn. Trả về (manifest, dict role -> state_dict)
+    chỉ cho các mô hình trong roles (mặc định tất cả); tensor được ánh xạ bộ
+    nhớ từ file (mmap) trên CPU.
+    """
+    manifest = read_manifest(export_dir)
+    state_dicts = {}
+    for role, filename in manifest['files'].items():
+        if roles is None or role in roles:
+            state_dicts[role] = torch.load(os.path.join(export_dir, filename), map_location='cpu',
+                                           mmap=True, weights_only=True)
+    return manifest, state_dicts
+
+
+def save_torchscript(model, path, inputs, check_inputs, freeze=True, tolerance=1e-3):
+    """
+    Trace model trên inputs, kiểm tra lại trên check_inputs (kích thước khác)
+    rồi lưu file TorchScript. Trả về sai khác lớn nhất so với model.
+    """
+    with torch.no_grad(), warnings.catch_warnings():
+        warnings.simplefilter('ignore', torch.jit.TracerWarning)
+        warnings.simplefilter('ignore', FutureWarning)
+        traced = torch.jit.trace(model, inputs)
+        if freeze:
+            traced = torch.jit.freeze(traced)
+        error = (traced(*check_inputs) - model(*check_inputs)).abs().max().item()
+    if error > tolerance:
+        raise RuntimeError(f'{os.path.basename(path)} sau khi trace lệch {error:.2e} so với mô hình gốc')
+    traced.save(path)
+    return error
+
+
+def export_onnx(model_path, output_dir, sample_size=(64, 48), opset=18, tolerance=1e-3):
+    """
+    Xuất encoder, decoder và reverse decoder (đã gộp BatchNorm) của checkpoint
+    thành các graph ONNX với chiều N, W, H động, rồi kiểm tra bằng ONNX Runtime
+    (nếu đã cài) trên một ảnh có kích thước khác ảnh mẫu. Trả về manifest.
+    """
+    from enhancedstegan import StegoEngine
+
+    engine = StegoEngine(model_path, device=torch.device('cpu'), warmup=False)
+    manifest = export_manifest(engine, model_path, 'onnx')
+    manifest['opset'] = opset
+    os.makedirs(output_dir, exist_ok=True)
+
+    check_size = (sample_size[0] + 13, sample_size[1] + 7)
+    batch = torch.export.Dim('batch', min=1)
+    width = torch.export.Dim('width', min=2)
+    height = torch.export.Dim('height', min=2)
+    for role in EXPORT_ROLES:
+        model = getattr(engine, role)
+        if model is None:
+            continue
+        pixels = role == 'decoder' and engine.decoder_pixels
+        # Batch mẫu 2 để chiều batch không bị cố định thành 1 khi xuất
+        inputs = sample_inputs(role, engine.data_depth, sample_size, pixels, batch=2)
+        input_names = ['image', 'payload'] if role == 'encoder' else ['image']
+        filename = f'{role}.onnx'
+        path = os.path.join(output_dir, filename)
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore')
+            torch.onnx.export(model, inputs, path, input_names=input_names, output_names=['output'],
+                              opset_version=opset, dynamo=True, verbose=False,
+                              dynamic_shapes=tuple({0: batch, 2: width, 3: height} for _ in inputs))
+        manifest['files'][role] = filename
+
+        message = f"Đã xuất {role} -> {path}"
+        if onnxruntime is not None:
+            inputs = sample_inputs(role, engine.data_depth, check_size, pixels)
+            with torch.no_grad():
+                error = (OnnxRuntimeModel(path)(*inputs) - model(*inputs)).abs().max().item()
+            if error > tolerance:
+                raise RuntimeError(f'{role} sau khi xuất ONNX lệch {error:.2e} so với mô hình gốc')
+            message += f" (sai khác {error:.1e})"
+        print(message)
+
+    write_manifest(output_dir, manifest)
+    return manifest
+
+
+class OnnxRuntimeModel:
+    """
+    Bọc một phiên ONNX Runtime (CPU) để dùng như mô hình PyTorch: nhận các
+    tensor đầu vào theo thứ tự của graph và trả về tensor CPU.
+    """
+
+    def __init__(self, path, threads=None):
+        if onnxruntime is None:
+            raise ImportError("Cần cài onnxruntime để chạy mô hình ONNX: pip install onnxruntime")
+        options = onnxruntime.SessionOptions()
+        options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads:
+            options.intra_op_num_threads = threads
+        self.session = onnxruntime.InferenceSession(path, options, providers=['CPUExecutionProvider'])
+        self.input_names = [i.name for i in self.session.get_inputs()]
+
+    def __call__(self, *inputs):
+        feeds = {name: x.detach().float().cpu().contiguous().numpy()
+                 for name, x in zip(self.input_names, inputs)}
+        return torch.from_numpy(self.session.run(None, feeds)[0])
+
+    def eval(self):
+        return self
+
+
+def load_export(export_dir, device='cpu', roles=None):
+    """
+    Tải thư mục mô hình đã xuất (chỉ các mô hình trong roles, mặc định tất
+    cả). Trả về (manifest, dict role -> mô hình); mô hình nhận và trả về
+    tensor giống hệt mô hình PyTorch tương ứng (mô hình ONNX và mô hình INT8
+    luôn chạy trên CPU).
+    """
+    manifest = read_manifest(export_dir)
+    export_format = manifest.get('format')
+    quantization = manifest.get('quantization')
+    if quantization and quantization['backend'] in torch.backends.quantized.supported_engines:
+        torch.backends.quantized.engine = quantization['backend']
+    models = {}
+    for role, filename in manifest['files'].items():
+        if roles is not None and role not in roles:
+            continue
+        path = os.path.join(export_dir, filename)
+        if export_format == 'torchscript':
+            with warnings.catch_warnings():
+                warnings.simplefilter('ignore', FutureWarning)
+                models[role] = torch.jit.load(path, map_location=device).eval()
+        elif export_format == 'onnx':
+            models[role] = OnnxRuntimeModel(path)
+        else:
+            raise ValueError(f"Định dạng mô hình đã xuất không được hỗ trợ: {export_format}")
+    return manifest, models
+
+
+BENCHMARK_SIZES = {'512x512': (512, 512), '1080p': (1920, 1080), '4K': (3840, 2160)}
+
+
+def benchmark_backends(model_path, export_dir, sizes=None, repeats=3, roles=EXPORT_ROLES):
+    """
+    So sánh mô hình đã xuất với đường PyTorch (checkpoint, đã gộp BatchNorm):
+    sai khác lớn nhất của đầu ra (parity) và thời gian chạy trung bình ở mỗi
+    kích thước ảnh. Trả về list dict kết quả, mỗi dict một (role, kích thước).
+    """
+    from enhancedstegan import StegoEngine
+
+    reference = StegoEngine(model_path, device=torch.device('cpu'))
+    exported = StegoEngine(export_dir, device=torch.device('cpu'))
+    sizes = sizes or BENCHMARK_SIZES
+
+    def timed(model, inputs):
+        model(*inputs)
+        start = time.perf_counter()
+        for _ in range(repeats):
+            output = model(*inputs)
+        return output, (time.perf_counter() - start) / repeats
+
+    results = []
+    for role in roles:
+        if getattr(reference, role) is None or getattr(exported, role) is None:
+            continue
+        pixels = role == 'decoder' and reference.decoder_pixels
+        for label, size in sizes.items():
+            inputs = sample_inputs(role, reference.data_depth, size, pixels)
+            with torch.no_grad():
+                expected, torch_time = timed(getattr(reference, role), inputs)
+                actual, export_time = timed(getattr(exported, role), inputs)
+            error = (expected - actual).abs().max().item()
+            agree = None
+            if role == 'decoder':
+                agree = float(((expected > 0) == (actual > 0)).float().mean())
+            results.append({'role': role, 'size': label, 'max_error': error, 'bit_agreement': agree,
+                            'torch_seconds': torch_time, 'export_seconds': export_time})
+            print(f"{role:<16} {label:>8}  sai khác {error:.1e}  "
+                  f"PyTorch {torch_time * 1000:9.1f} ms  {exported_format(export_dir):<11} "
+                  f"{export_time * 1000:9.1f} ms  x{torch_time / export_time:.2f}")
+    return results
+
+
+def exported_format(export_dir):
+    return read_manifest(export_dir).get('format')
@@ -0,0 +1,174 @@
+"""
+Lượng tử hóa INT8 (post-training, tĩnh) cho decoder và reverse decoder.
+
+Decoder chỉ cần dấu của logits (make_message so sánh với 0) và reverse decoder
+chỉ cần sai khác nhỏ hơn một mức xám, nên cả hai chịu được sai số của phép
+tính INT8. Thang đo của activation được hiệu chỉnh bằng cách chạy mô hình
+float trên một tập ảnh stego: mỗi ảnh cover được nhúng một payload ngẫu
+nhiên bằng encoder float rồi làm tròn về 0..255 như khi lưu PNG. Payload và
+cover đã biết nên có thể đo trực tiếp độ chính xác bit của decoder và PSNR
+của ảnh cover khôi phục, trước và sau khi lượng tử hóa.
+
+Mô hình INT8 được lưu thành thư mục TorchScript (xem model_export.py) cùng
+encoder float, nên StegoEngine tải được như mọi thư mục mô hình đã xuất.
+Các phép INT8 chỉ chạy trên CPU.
+"""
+import os
+import copy
+import time
+import warnings
+import torch
+import torch.nn as nn
+
+from enhancedstegan import StegoEngine, load_image_tensor, psnr
+from model_export import EXPORT_ROLES, export_manifest, sample_inputs, save_torchscript, write_manifest
+from optimize import optimize_for_inference
+
+QUANTIZED_ROLES = ('decoder', 'reverse_decoder')
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.bmp')
+
+
+def quantize_model(model, calibration_inputs, backend='x86'):
+    """
+    Lượng tử hóa tĩnh model (FX graph mode): trọng số INT8 theo kênh ra,
+    activation UINT8 với thang đo lấy từ calibration_inputs (list tensor ảnh).
+    Trả về bản sao đã lượng tử hóa, model gốc không bị thay đổi.
+    """
+    from torch.ao.quantization import get_default_qconfig_mapping
+    from torch.ao.quantization.quantize_fx import prepare_fx, convert_fx
+
+    torch.backends.quantized.engine = backend
+    model = copy.deepcopy(model).eval()
+    for module in model.modules():
+        # quantized::leaky_relu không hỗ trợ inplace
+        if isinstance(module, nn.LeakyReLU):
+            module.inplace = False
+
+    with torch.no_grad(), warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        prepared = prepare_fx(model, get_default_qconfig_mapping(backend),
+                              example_inputs=(calibration_inputs[0],))
+        for image in calibration_inputs:
+            prepared(image)
+        return convert_fx(prepared)
+
+
+def list_images(paths):
+    """Danh sách file ảnh từ các đường dẫn file hoặc thư mục"""
+    images = []
+    for path in paths:
+        if os.path.isdir(path):
+            images.extend(os.path.join(path, name) for name in sorted(os.listdir(path))
+                          if name.lower().endswith(IMAGE_EXTENSIONS))
+        else:
+            images.append(path)
+    return images
+
+
+def center_crop(image, crop):
+    """Cắt vùng giữa tối đa crop x crop của tensor (1, 3, W, H)"""
+    if not crop:
+        return image
+    width, height = image.shape[2:]
+    left, top = max(0, (width - crop) // 2), max(0, (height - crop) // 2)
+    return image[:, :, left:left + crop, top:top + crop]
+
+
+def calibration_set(engine, image_paths, crop=512, seed=0):
+    """
+    Tạo tập (cover, payload, stego) từ các ảnh cover: nhúng payload ngẫu nhiên
+    bằng encoder float, ảnh stego được làm tròn về 0..255 như khi lưu PNG.
+    """
+    generator = torch.Generator().manual_seed(seed)
+    samples = []
+    with torch.no_grad():
+        for path in image_paths:
+            cover = center_crop(load_image_tensor(path), crop)
+            payload = torch.randint(0, 2, (1, engine.data_depth, *cover.shape[2:]),
+                                    generator=generator).float()
+            stego = engine.encoder(cover, payload).clamp(-1.0, 1.0)
+            stego = torch.round((stego + 1.0) * 127.5) / 127.5 - 1.0
+            samples.append((cover, payload, stego))
+    return samples
+
+
+@torch.no_grad()
+def evaluate(role, model, samples):
+    """
+    Độ chính xác bit (decoder) hoặc PSNR trung bình so với cover (reverse
+    decoder) của model trên các mẫu, kèm tổng thời gian chạy.
+    """
+    scores, seconds = [], 0.0
+    for cover, payload, stego in samples:
+        start = time.perf_counter()
+        output = model(stego)
+        seconds += time.perf_counter() - start
+        if role == 'decoder':
+            scores.append(((output >= 0) == (payload > 0.5)).float().mean().item())
+        else:
+            scores.append(psnr(output, cover))
+    return sum(scores) / len(scores), seconds
+
+
+def quantize_checkpoint(model_path, image_paths, output_dir, crop=512, backend='x86', seed=0,
+                        sample_size=(64, 48)):
+    """
+    Hiệu chỉnh và lượng tử hóa INT8 decoder và reverse decoder của checkpoint
+    trên các ảnh cover image_paths, in bảng so sánh với mô hình float rồi lưu
+    thư mục TorchScript (encoder float đã gộp BatchNorm, decoder và reverse
+    decoder INT8) vào output_dir.
+
+    Độ chính xác và PSNR được đo trên chính tập ảnh hiệu chỉnh. Trả về manifest
+    đã ghi; manifest['quantization']['report'] chứa kết quả đo.
+    """
+    if backend not in torch.backends.quantized.supported_engines:
+        raise ValueError(f"Bản PyTorch này không hỗ trợ backend lượng tử hóa: {backend}")
+    image_paths = list_images(image_paths)
+    if not image_paths:
+        raise ValueError("Cần ít nhất một ảnh cover để hiệu chỉnh")
+
+    # Lượng tử hóa trên mô hình gốc: BatchNorm được giữ thành phép INT8 riêng
+    engine = StegoEngine(model_path, device=torch.device('cpu'), optimize=False, warmup=False)
+    print(f"Đang tạo {len(image_paths)} ảnh stego để hiệu chỉnh...")
+    samples = calibration_set(engine, image_paths, crop=crop, seed=seed)
+    stegos = [stego for _, _, stego in samples]
+
+    manifest = export_manifest(engine, model_path, 'torchscript')
+    manifest['quantization'] = {'dtype': 'int8', 'backend': backend, 'roles': [],
+                                'calibration_images': len(samples), 'report': {}}
+    os.makedirs(output_dir, exist_ok=True)
+
+    check_size = (sample_size[0] + 13, sample_size[1] + 7)
+    print(f"\n{'Mô hình':<16} {'float':>10} {'int8':>10} {'chênh lệch':>11} {'tăng tốc':>9}")
+    for role in EXPORT_ROLES:
+        model = getattr(engine, role)
+        if model is None:
+            continue
+        if role in QUANTIZED_ROLES:
+            quantized = quantize_model(model, stegos, backend)
+            # So sánh với mô hình float đã gộp BatchNorm (đường chạy mặc định)
+            float_score, float_time = evaluate(role, optimize_for_inference(model), samples)
+            int8_score, int8_time = evaluate(role, quantized, samples)
+            unit = 'bit_accuracy' if role == 'decoder' else 'psnr'
+            manifest['quantization']['roles'].append(role)
+            manifest['quantization']['report'][role] = {
+                'metric': unit, 'float': float_score, 'int8': int8_score,
+                'delta': int8_score - float_score, 'speedup': float_time / int8_time,
+            }
+            fmt, delta_fmt = ('{:>10.2%}', '{:>+11.2%}') if role == 'decoder' else ('{:>7.2f} dB', '{:>+8.2f} dB')
+            print(f"{role:<16} {fmt.format(float_score)} {fmt.format(int8_score)} "
+                  f"{delta_fmt.format(int8_score - float_score)} {float_time / int8_time:>8.2f}x")
+            model, tolerance = quantized, 1e-6
+        else:
+            model, tolerance = optimize_for_inference(model), 1e-3
+
+        filename = f'{role}.pt'
+        save_torchscript(model, os.path.join(output_dir, filename),
+                         sample_inputs(role, engine.data_depth, sample_size),
+                         sample_inputs(role, engine.data_depth, check_size),
+                         tolerance=tolerance)
+        manifest['files'][role] = filename
+
+    write_manifest(output_dir, manifest)
+    print(f"\nĐã lưu mô hình INT8 vào {output_dir}")
+    return manifest
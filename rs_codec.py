@@ -0,0 +1,274 @@
+"""
+Mã Reed-Solomon trên GF(256) viết bằng NumPy.
+
+Tương thích từng byte với reedsolo.RSCodec ở cấu hình mặc định (đa thức
+nguyên thủy 0x11d, phần tử sinh 2, fcr=0, khối 255 byte), nên các ảnh stego
+đã tạo bằng reedsolo vẫn giải mã được. Thay vì xử lý từng khối bằng vòng lặp
+Python, mọi khối (của một hay nhiều message) được xếp thành một ma trận và
+được mã hóa, tính syndrome, chạy Berlekamp-Massey, tìm nghiệm Chien và sửa
+lỗi Forney cùng lúc bằng phép tra bảng log/antilog.
+
+Các khối ngắn hơn 255 byte (khối cuối của message) là mã rút gọn: được thêm
+các byte 0 ở đầu, không làm thay đổi phần ECC và syndrome.
+"""
+import functools
+import numpy as np
+
+PRIM = 0x11d
+FIELD_SIZE = 255
+
+
+class ReedSolomonError(Exception):
+    pass
+
+
+# log(0) được gán một giá trị lớn để log(a) + log(b) rơi vào vùng toàn số 0
+# của bảng antilog khi a hoặc b bằng 0: phép nhân chỉ còn một lần tra bảng
+LOG_ZERO = 2 * FIELD_SIZE + 2
+
+
+def _init_tables(prim=PRIM):
+    """Bảng antilog (nhân đôi để khỏi phải lấy mod 255) và bảng log của GF(256)"""
+    exp = np.zeros(2 * LOG_ZERO + 1, dtype=np.uint8)
+    log = np.full(FIELD_SIZE + 1, LOG_ZERO, dtype=np.int16)
+    x = 1
+    for i in range(FIELD_SIZE):
+        exp[i] = exp[i + FIELD_SIZE] = x
+        log[x] = i
+        x <<= 1
+        if x & 0x100:
+            x ^= prim
+    return exp, log
+
+
+GF_EXP, GF_LOG = _init_tables()
+
+
+def gf_mul(a, b):
+    """Nhân từng phần tử của hai mảng trên GF(256)"""
+    return GF_EXP[GF_LOG[a] + GF_LOG[b]]
+
+
+def gf_div(a, b):
+    """Chia từng phần tử a / b trên GF(256) (b khác 0)"""
+    a = np.asarray(a)
+    return np.where(a == 0, 0, GF_EXP[(GF_LOG[a] - GF_LOG[b]) % FIELD_SIZE])
+
+
+def _mul_pow(values, exponents):
+    """values * alpha^exponents (exponents đã nằm trong 0..254)"""
+    return GF_EXP[GF_LOG[values] + exponents]
+
+
+def generator_poly(nsym):
+    """Đa thức sinh prod(x - alpha^i), i = 0..nsym-1 (hệ số bậc cao trước)"""
+    g = np.ones(1, dtype=np.uint8)
+    for i in range(nsym):
+        shifted = np.append(g, 0)
+        shifted[1:] ^= gf_mul(g, GF_EXP[i])
+        g = shifted
+    return g
+
+
+def eval_matrix(n_coeffs, log_x):
+    """
+    Ma trận nhị phân của phép tính giá trị đa thức n_coeffs hệ số tại các
+    điểm alpha^log_x. Phép tính này tuyến tính trên GF(2) theo các bit của
+    hệ số, nên giá trị của cả lô đa thức là một phép nhân ma trận (BLAS) rồi
+    lấy phần dư mod 2.
+    """
+    exps = (np.arange(n_coeffs)[:, None] * np.asarray(log_x, dtype=np.int64)[None, :]) % FIELD_SIZE
+    basis = (1 << np.arange(7, -1, -1)).astype(np.uint8)
+    products = gf_mul(basis[None, :, None], GF_EXP[exps][:, None, :])
+    bits = np.unpackbits(products[..., None], axis=-1)
+    return bits.reshape(n_coeffs * 8, len(log_x) * 8).astype(np.float32)
+
+
+def _poly_eval(coeffs, matrix):
+    """
+    Tính giá trị các đa thức (mỗi hàng của coeffs, hệ số bậc thấp trước) bằng
+    ma trận của eval_matrix. Trả về mảng (số đa thức, số điểm).
+    """
+    bits = np.unpackbits(coeffs, axis=1).astype(np.float32)
+    parity = (bits @ matrix).astype(np.int32) & 1
+    return np.packbits(parity.astype(np.uint8), axis=1)
+
+
+class RSCodec:
+    """
+    Bộ mã Reed-Solomon với nsym byte ECC trên mỗi khối nsize byte, cùng giao
+    diện encode/decode với reedsolo.RSCodec và thêm decode_batch để sửa lỗi
+    nhiều message cùng lúc.
+    """
+
+    def __init__(self, nsym=10, nsize=255):
+        if not 0 < nsym < nsize <= FIELD_SIZE:
+            raise ValueError('Cần 0 < nsym < nsize <= 255')
+        self.nsym = nsym
+        self.nsize = nsize
+        self.gen = generator_poly(nsym)
+        # Bậc p của vị trí i trong khối đã đệm đủ 255 byte: p = 254 - i
+        self._degree = np.arange(FIELD_SIZE - 1, -1, -1, dtype=np.int16)
+
+    @functools.cached_property
+    def _syndrome_matrix(self):
+        """Syndrome: giá trị của khối (hệ số bậc thấp trước) tại alpha^j, j < nsym"""
+        return eval_matrix(FIELD_SIZE, np.arange(self.nsym))
+
+    @functools.cached_property
+    def _chien_matrix(self):
+        """Giá trị đa thức bậc <= nsym / 2 tại alpha^-p của mọi vị trí"""
+        return eval_matrix(self.nsym // 2 + 1, (-self._degree) % FIELD_SIZE)
+
+    def _blocks(self, data, size):
+        """Chia data thành các khối size byte, đệm 0 ở đầu về đủ 255 byte"""
+        data = np.frombuffer(bytes(data), dtype=np.uint8)
+        n_blocks = -(-len(data) // size)
+        blocks = np.zeros((n_blocks, FIELD_SIZE), dtype=np.uint8)
+        lengths = np.full(n_blocks, size, dtype=np.int64)
+        if n_blocks:
+            lengths[-1] = len(data) - size * (n_blocks - 1)
+        for b in range(n_blocks):
+            chunk = data[b * size:(b + 1) * size]
+            blocks[b, FIELD_SIZE - len(chunk):] = chunk
+        return blocks, lengths
+
+    def encode(self, data):
+        """Thêm nsym byte ECC sau mỗi khối (nsize - nsym) byte dữ liệu"""
+        blocks, lengths = self._blocks(data, self.nsize - self.nsym)
+        reg = np.zeros((len(blocks), self.nsym), dtype=np.uint8)
+        # Chia đa thức cho đa thức sinh, mọi khối cùng lúc; các byte 0 đệm
+        # ở đầu không làm thay đổi thanh ghi
+        for j in range(FIELD_SIZE - int(lengths.max(initial=0)), FIELD_SIZE):
+            feedback = blocks[:, j] ^ reg[:, 0]
+            reg[:, :-1] = reg[:, 1:]
+            reg[:, -1] = 0
+            reg ^= gf_mul(feedback[:, None], self.gen[None, 1:])
+        out = bytearray()
+        for b, length in enumerate(lengths):
+            out += bytes(blocks[b, FIELD_SIZE - length:])
+            out += bytes(reg[b])
+        return out
+
+    def syndromes(self, blocks):
+        """Syndrome S_j = c(alpha^j) của mọi khối, dạng (số khối, nsym)"""
+        return _poly_eval(np.ascontiguousarray(blocks[:, ::-1]), self._syndrome_matrix)
+
+    def _error_locator(self, synd):
+        """
+        Berlekamp-Massey chạy song song trên mọi khối (hệ số bậc thấp trước).
+        Đa thức định vị có bậc không vượt quá độ dài L, và khối nào có
+        L > nsym / 2 đều không sửa được, nên chỉ cần giữ nsym / 2 + 1 hệ số.
+        """
+        width = self.nsym // 2 + 1
+        locator = np.zeros((len(synd), width), dtype=np.uint8)
+        locator[:, 0] = 1
+        prev = locator.copy()
+        degree = np.zeros(len(synd), dtype=np.int64)
+        last = np.ones(len(synd), dtype=np.uint8)
+        for n in range(self.nsym):
+            # Độ lệch d = sum C_k * S_{n-k}
+            k = min(n + 1, width)
+            d = np.bitwise_xor.reduce(gf_mul(locator[:, :k], synd[:, n::-1][:, :k]), axis=1)
+            # prev luôn được lưu dưới dạng đã nhân x^m
+            shifted = np.zeros_like(prev)
+            shifted[:, 1:] = prev[:, :-1]
+            active = d != 0
+            coef = gf_div(d, np.where(active, last, 1))
+            updated = locator ^ gf_mul(coef[:, None], shifted)
+            grow = active & (2 * degree <= n)
+            prev = np.where(grow[:, None], locator, shifted)
+            degree = np.where(grow, n + 1 - degree, degree)
+            last = np.where(grow, d, last)
+            locator = np.where(active[:, None], updated, locator)
+        return locator, degree
+
+    def _correct(self, blocks, lengths, synd):
+        """Sửa lỗi các khối có syndrome khác 0. Trả về (khối đã sửa, thành công, vị trí lỗi)"""
+        locator, degree = self._error_locator(synd)
+        # Tìm nghiệm Chien: vị trí bậc p có lỗi khi locator(alpha^-p) = 0
+        roots = _poly_eval(locator, self._chien_matrix) == 0
+        roots &= self._degree[None, :] < lengths[:, None]
+        ok = (2 * degree <= self.nsym) & (roots.sum(axis=1) == degree)
+
+        # Forney: Y = X * omega(X^-1) / locator'(X^-1), X = alpha^p
+        # omega = S * locator mod x^nsym có bậc nhỏ hơn L
+        width = locator.shape[1]
+        evaluator = np.zeros_like(locator)
+        for k in range(width):
+            evaluator[:, k:] ^= gf_mul(locator[:, k:k + 1], synd[:, :width - k])
+        derivative = np.zeros_like(locator)
+        derivative[:, 0:-1:2] = locator[:, 1::2]
+        numerator = _poly_eval(evaluator, self._chien_matrix)
+        denominator = _poly_eval(derivative, self._chien_matrix)
+        ok &= ~np.any(roots & (denominator == 0), axis=1)
+        magnitude = _mul_pow(gf_div(numerator, np.where(denominator == 0, 1, denominator)),
+                             self._degree[None, :])
+        corrected = blocks ^ np.where(roots, magnitude, 0)
+
+        # Kiểm tra lại: khối sửa xong phải là một từ mã hợp lệ
+        ok &= ~np.any(self.syndromes(corrected), axis=1)
+        return corrected, ok, roots
+
+    def _decode_blocks(self, blocks, lengths):
+        """Sửa lỗi mọi khối cùng lúc, chỉ chạy phần sửa lỗi cho khối có lỗi"""
+        synd = self.syndromes(blocks)
+        bad = np.nonzero(np.any(synd, axis=1))[0]
+        ok = np.ones(len(blocks), dtype=bool)
+        errata = [[] for _ in range(len(blocks))]
+        if len(bad):
+            corrected, fixed, roots = self._correct(blocks[bad], lengths[bad], synd[bad])
+            blocks = blocks.copy()
+            blocks[bad] = corrected
+            ok[bad] = fixed
+            for row, b in enumerate(bad):
+                # Vị trí byte (trong khối gốc chưa đệm) đã được sửa
+                errata[b] = list(lengths[b] - 1 - self._degree[roots[row]])
+        return blocks, ok, errata
+
+    def decode(self, data):
+        """
+        Sửa lỗi và bỏ phần ECC, xử lý theo khối nsize byte.
+        Trả về (message, message kèm ECC, vị trí byte đã sửa trong từng khối);
+        ném ReedSolomonError nếu có khối không sửa được.
+        """
+        blocks, lengths = self._blocks(data, self.nsize)
+        blocks, ok, errata = self._decode_blocks(blocks, lengths)
+        if not ok.all():
+            raise ReedSolomonError('Quá nhiều lỗi, không thể sửa')
+        return self._join(blocks, lengths, errata)
+
+    def _join(self, blocks, lengths, errata):
+        """Ghép các khối đã sửa thành (message, message kèm ECC, vị trí đã sửa)"""
+        dec, dec_full, errata_pos = bytearray(), bytearray(), bytearray()
+        for b, length in enumerate(lengths):
+            block = bytes(blocks[b, FIELD_SIZE - length:])
+            dec += block[:-self.nsym]
+            dec_full += block
+            errata_pos += bytes(errata[b])
+        return dec, dec_full, errata_pos
+
+    def decode_batch(self, messages):
+        """
+        Sửa lỗi nhiều message cùng lúc: khối của tất cả message được xếp
+        chung một ma trận. Trả về list message (đã bỏ ECC), None cho message
+        không sửa được.
+        """
+        parts = [self._blocks(message, self.nsize) for message in messages]
+        if not parts:
+            return []
+        counts = [len(lengths) for _, lengths in parts]
+        blocks = np.concatenate([blocks for blocks, _ in parts])
+        lengths = np.concatenate([lengths for _, lengths in parts])
+        blocks, ok, errata = self._decode_blocks(blocks, lengths)
+
+        results = []
+        start = 0
+        for count in counts:
+            end = start + count
+            if ok[start:end].all():
+                results.append(self._join(blocks[start:end], lengths[start:end], errata[start:end])[0])
+            else:
+                results.append(None)
+            start = end
+        return results
@@ -7,6 +7,11 @@ Cách dùng:
     python runstego.py encode <ảnh> <văn_bản> [tùy_chọn]
     python runstego.py decode <ảnh_stego> [tùy_chọn]
     python runstego.py reverse <ảnh_stego> [tùy_chọn]
+    python runstego.py export-torchscript [tùy_chọn]
+    python runstego.py export-slim [tùy_chọn]
+    python runstego.py export-onnx [tùy_chọn]
+    python runstego.py quantize <ảnh_cover...> [tùy_chọn]
+    python runstego.py benchmark --export <thư_mục_xuất> [tùy_chọn]
 
 Ví dụ:
     # Encode (ẩn message vào ảnh)
@@ -22,6 +27,18 @@ Ví dụ:
     # Reverse (khôi phục ảnh cover gốc)
     python runstego.py reverse stego.png
     python runstego.py reverse stego.png --output recovered.png
+    
+    # Xuất mô hình TorchScript rồi dùng thư mục xuất thay cho checkpoint
+    python runstego.py export-torchscript --output results/torchscript
+    python runstego.py decode stego.png --model results/torchscript
+    
+    # Xuất checkpoint rút gọn chỉ dùng để suy luận (tải bằng mmap)
+    python runstego.py export-slim --output results/slim
+    python runstego.py decode stego.png --model results/slim
+    
+    # Xuất ONNX (chạy bằng ONNX Runtime) và so sánh với PyTorch
+    python runstego.py export-onnx --output results/onnx
+    python runstego.py benchmark --export results/onnx
 """
 
 import os
@@ -40,7 +57,7 @@ import matplotlib.pyplot as plt
 
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
-from enhancedstegan import encode_message, decode_message, reverse_hiding
+from enhancedstegan import encode_message, decode_message, reverse_hiding, decode_and_reverse
 
 try:
     from Crypto.PublicKey import RSA
@@ -356,7 +373,9 @@ def cmd_encode(args):
             cover_image_path=args.image,
             secret_text=message_to_hide,
             output_path=args.output,
-            model_path=model_path
+            model_path=model_path,
+            tile_size=args.tile_size,
+            precision=args.precision
         )
     except Exception as e:
         print(f"Mã hóa thất bại: {e}")
@@ -425,10 +444,23 @@ def cmd_decode(args):
     print(f"Ảnh stego: {args.image}")
     
     try:
-        extracted_message = decode_message(
-            stego_image_path=args.image,
-            model_path=model_path
-        )
+        if args.recover:
+            extracted_message, _ = decode_and_reverse(
+                stego_image_path=args.image,
+                output_path=args.recover,
+                model_path=model_path,
+                tile_size=args.tile_size,
+                progressive=not args.full_image,
+                precision=args.precision
+            )
+        else:
+            extracted_message = decode_message(
+                stego_image_path=args.image,
+                model_path=model_path,
+                tile_size=args.tile_size,
+                progressive=not args.full_image,
+                precision=args.precision
+            )
     except Exception as e:
         print(f"Giải mã thất bại: {e}")
         return 1
@@ -476,6 +508,8 @@ def cmd_decode(args):
     print(f"{'='*60}")
     print(f"Message đã khôi phục:")
     print(f"{secret_message}")
+    if args.recover:
+        print(f"Cover đã khôi phục: {args.recover}")
     print(f"{'='*60}")
     
     if args.output:
@@ -510,7 +544,9 @@ def cmd_reverse(args):
         reverse_hiding(
             stego_image_path=args.image,
             output_path=args.output,
-            model_path=model_path
+            model_path=model_path,
+            tile_size=args.tile_size,
+            precision=args.precision
         )
     except Exception as e:
         print(f"Reverse hiding thất bại: {e}")
@@ -551,6 +587,152 @@ def cmd_reverse(args):
     return 0
 
 
+def cmd_export_torchscript(args):
+    """Xử lý lệnh export-torchscript"""
+    from model_export import export_torchscript
+    
+    model_path = get_model_path(args.model)
+    if not model_path:
+        return 1
+    
+    if not os.path.exists(model_path):
+        print(f"Không tìm thấy checkpoint model: {model_path}")
+        return 1
+    
+    try:
+        manifest = export_torchscript(model_path, args.output, freeze=not args.no_freeze)
+    except Exception as e:
+        print(f"Xuất TorchScript thất bại: {e}")
+        return 1
+    
+    print(f"\n{'='*60}")
+    print(f"THÀNH CÔNG!")
+    print(f"{'='*60}")
+    print(f"Checkpoint: {model_path}")
+    print(f"Thư mục xuất: {args.output} ({', '.join(manifest['files'])})")
+    print(f"Dùng với: python runstego.py decode <ảnh_stego> --model {args.output}")
+    print(f"{'='*60}")
+    
+    return 0
+
+
+def cmd_export_slim(args):
+    """Xử lý lệnh export-slim"""
+    from model_export import export_slim
+    
+    model_path = get_model_path(args.model)
+    if not model_path:
+        return 1
+    
+    if not os.path.exists(model_path):
+        print(f"Không tìm thấy checkpoint model: {model_path}")
+        return 1
+    
+    try:
+        manifest = export_slim(model_path, args.output)
+    except Exception as e:
+        print(f"Xuất checkpoint rút gọn thất bại: {e}")
+        return 1
+    
+    size = sum(os.path.getsize(os.path.join(args.output, f)) for f in manifest['files'].values())
+    print(f"\n{'='*60}")
+    print(f"THÀNH CÔNG!")
+    print(f"{'='*60}")
+    print(f"Checkpoint: {model_path} ({os.path.getsize(model_path) / 1024:.0f} KB)")
+    print(f"Thư mục xuất: {args.output} ({', '.join(manifest['files'])}, {size / 1024:.0f} KB)")
+    print(f"Dùng với: python runstego.py encode <ảnh> <tin> --model {args.output}")
+    print(f"{'='*60}")
+    
+    return 0
+
+
+def cmd_quantize(args):
+    """Xử lý lệnh quantize"""
+    from quantize import quantize_checkpoint
+    
+    model_path = get_model_path(args.model)
+    if not model_path:
+        return 1
+    
+    try:
+        manifest = quantize_checkpoint(model_path, args.images, args.output,
+                                       crop=args.crop, backend=args.backend)
+    except Exception as e:
+        print(f"Lượng tử hóa thất bại: {e}")
+        return 1
+    
+    print(f"\n{'='*60}")
+    print(f"THÀNH CÔNG!")
+    print(f"{'='*60}")
+    print(f"Checkpoint: {model_path}")
+    print(f"Số ảnh hiệu chỉnh: {manifest['quantization']['calibration_images']}")
+    print(f"Thư mục xuất: {args.output} (INT8: {', '.join(manifest['quantization']['roles'])})")
+    print(f"Dùng với: python runstego.py decode <ảnh_stego> --model {args.output}")
+    print(f"{'='*60}")
+    
+    return 0
+
+
+def cmd_export_onnx(args):
+    """Xử lý lệnh export-onnx"""
+    from model_export import export_onnx
+    
+    model_path = get_model_path(args.model)
+    if not model_path:
+        return 1
+    
+    if not os.path.exists(model_path):
+        print(f"Không tìm thấy checkpoint model: {model_path}")
+        return 1
+    
+    try:
+        manifest = export_onnx(model_path, args.output, opset=args.opset)
+    except Exception as e:
+        print(f"Xuất ONNX thất bại: {e}")
+        return 1
+    
+    print(f"\n{'='*60}")
+    print(f"THÀNH CÔNG!")
+    print(f"{'='*60}")
+    print(f"Checkpoint: {model_path}")
+    print(f"Thư mục xuất: {args.output} ({', '.join(manifest['files'])})")
+    print(f"Dùng với: python runstego.py decode <ảnh_stego> --model {args.output}")
+    print(f"{'='*60}")
+    
+    return 0
+
+
+def cmd_benchmark(args):
+    """Xử lý lệnh benchmark"""
+    from model_export import benchmark_backends, is_export_dir, BENCHMARK_SIZES
+    
+    model_path = get_model_path(args.model)
+    if not model_path:
+        return 1
+    
+    if not is_export_dir(args.export):
+        print(f"Không tìm thấy thư mục mô hình đã xuất: {args.export}")
+        return 1
+    
+    sizes = {label: BENCHMARK_SIZES[label] for label in args.sizes}
+    try:
+        results = benchmark_backends(model_path, args.export, sizes=sizes,
+                                     repeats=args.repeats, roles=args.roles)
+    except Exception as e:
+        print(f"Benchmark thất bại: {e}")
+        return 1
+    
+    failed = [r for r in results if r['max_error'] > args.tolerance]
+    print(f"\n{'='*60}")
+    if failed:
+        print(f"PARITY THẤT BẠI: {len(failed)}/{len(results)} phép đo lệch quá {args.tolerance:g}")
+    else:
+        print(f"PARITY OK: mọi đầu ra lệch không quá {args.tolerance:g} so với PyTorch")
+    print(f"{'='*60}")
+    
+    return 1 if failed else 0
+
+
 # MAIN
 
 def main():
@@ -620,6 +802,11 @@ Examples:
                                help='Đường dẫn checkpoint model (tự chọn tốt nhất nếu không chỉ định)')
     encode_parser.add_argument('--compare', '-c', action='store_true',
                                help='Tạo ảnh so sánh hiển thị cover vs stego với các chỉ số')
+    encode_parser.add_argument('--tile-size', type=int, default=None,
+                               help='Xử lý theo tile có cạnh này để giới hạn bộ nhớ với ảnh rất lớn')
+    encode_parser.add_argument('--precision', type=str, default='float32', choices=['float32', 'bfloat16'],
+                               help='Độ chính xác khi suy luận; bfloat16 nhanh hơn trên CPU hỗ trợ '
+                                    '(tự chạy lại float32 nếu kết quả kém hơn)')
     
     # ===== DECODE subcommand =====
     decode_parser = subparsers.add_parser(
@@ -631,6 +818,7 @@ Ví dụ:
   python runstego.py decode stego.png
   python runstego.py decode stego.png --output secret.txt
   python runstego.py decode stego.png --encrypt
+  python runstego.py decode stego.png --recover recovered.png
         """
     )
     decode_parser.add_argument('image', type=str, help='Đường dẫn ảnh stego')
@@ -642,6 +830,15 @@ Ví dụ:
                                help='Đường dẫn khóa riêng tư RSA (mặc định: private_key.pem)')
     decode_parser.add_argument('--model', '-m', type=str, default=None,
                                help='Đường dẫn checkpoint model (tự chọn tốt nhất nếu không chỉ định)')
+    decode_parser.add_argument('--tile-size', type=int, default=None,
+                               help='Xử lý theo tile có cạnh này để giới hạn bộ nhớ với ảnh rất lớn')
+    decode_parser.add_argument('--precision', type=str, default='float32', choices=['float32', 'bfloat16'],
+                               help='Độ chính xác khi suy luận; bfloat16 nhanh hơn trên CPU hỗ trợ '
+                                    '(tự chạy lại float32 nếu kết quả kém hơn)')
+    decode_parser.add_argument('--full-image', action='store_true',
+                               help='Chạy decoder trên toàn ảnh thay vì giải mã tăng dần theo dải cột')
+    decode_parser.add_argument('--recover', '-r', type=str, default=None,
+                               help='Đồng thời khôi phục ảnh cover và lưu vào file này (đọc ảnh stego một lần)')
     
     # ===== REVERSE subcommand =====
     reverse_parser = subparsers.add_parser(
@@ -663,6 +860,109 @@ Ví dụ:
                                 help='Đường dẫn checkpoint model (tự chọn tốt nhất nếu không chỉ định)')
     reverse_parser.add_argument('--compare', '-c', action='store_true',
                                 help='Tạo ảnh so sánh hiển thị cover/stego/khôi-phục với các chỉ số')
+    reverse_parser.add_argument('--tile-size', type=int, default=None,
+                                help='Xử lý theo tile có cạnh này để giới hạn bộ nhớ với ảnh rất lớn')
+    reverse_parser.add_argument('--precision', type=str, default='float32', choices=['float32', 'bfloat16'],
+                                help='Độ chính xác khi suy luận; bfloat16 nhanh hơn trên CPU hỗ trợ')
+    
+    # ===== EXPORT-TORCHSCRIPT subcommand =====
+    export_ts_parser = subparsers.add_parser(
+        'export-torchscript',
+        help='Xuất encoder/decoder/reverse decoder thành TorchScript',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+Ví dụ:
+  python runstego.py export-torchscript
+  python runstego.py export-torchscript --model results/model/best.dat --output results/torchscript
+        """
+    )
+    export_ts_parser.add_argument('--model', '-m', type=str, default=None,
+                                  help='Đường dẫn checkpoint model (tự chọn tốt nhất nếu không chỉ định)')
+    export_ts_parser.add_argument('--output', '-o', type=str, default='results/torchscript',
+                                  help='Thư mục xuất (mặc định: results/torchscript)')
+    export_ts_parser.add_argument('--no-freeze', action='store_true',
+                                  help='Không nhúng trọng số thành hằng số (torch.jit.freeze)')
+    
+    # ===== EXPORT-SLIM subcommand =====
+    export_slim_parser = subparsers.add_parser(
+        'export-slim',
+        help='Tách checkpoint thành thư mục rút gọn chỉ chứa trọng số để suy luận (tải bằng mmap)',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+Ví dụ:
+  python runstego.py export-slim
+  python runstego.py export-slim --model results/model/best.dat --output results/slim
+        """
+    )
+    export_slim_parser.add_argument('--model', '-m', type=str, default=None,
+                                    help='Đường dẫn checkpoint model (tự chọn tốt nhất nếu không chỉ định)')
+    export_slim_parser.add_argument('--output', '-o', type=str, default='results/slim',
+                                    help='Thư mục xuất (mặc định: results/slim)')
+    
+    # ===== EXPORT-ONNX subcommand =====
+    export_onnx_parser = subparsers.add_parser(
+        'export-onnx',
+        help='Xuất encoder/decoder/reverse decoder thành ONNX (N, W, H động)',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+Ví dụ:
+  python runstego.py export-onnx
+  python runstego.py export-onnx --model results/model/best.dat --output results/onnx
+        """
+    )
+    export_onnx_parser.add_argument('--model', '-m', type=str, default=None,
+                                    help='Đường dẫn checkpoint model (tự chọn tốt nhất nếu không chỉ định)')
+    export_onnx_parser.add_argument('--output', '-o', type=str, default='results/onnx',
+                                    help='Thư mục xuất (mặc định: results/onnx)')
+    export_onnx_parser.add_argument('--opset', type=int, default=18,
+                                    help='Phiên bản ONNX opset (mặc định: 18)')
+    
+    # ===== QUANTIZE subcommand =====
+    quantize_parser = subparsers.add_parser(
+        'quantize',
+        help='Lượng tử hóa INT8 decoder và reverse decoder (hiệu chỉnh trên ảnh cover)',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+Ví dụ:
+  python runstego.py quantize div2k/val/ --output results/int8
+  python runstego.py quantize a.png b.png c.png --model results/model/best.dat --crop 256
+        """
+    )
+    quantize_parser.add_argument('images', nargs='+',
+                                 help='Ảnh cover hoặc thư mục ảnh dùng để hiệu chỉnh')
+    quantize_parser.add_argument('--model', '-m', type=str, default=None,
+                                 help='Đường dẫn checkpoint model (tự chọn tốt nhất nếu không chỉ định)')
+    quantize_parser.add_argument('--output', '-o', type=str, default='results/int8',
+                                 help='Thư mục xuất (mặc định: results/int8)')
+    quantize_parser.add_argument('--crop', type=int, default=512,
+                                 help='Cắt vùng giữa tối đa NxN của mỗi ảnh, 0 để giữ nguyên (mặc định: 512)')
+    quantize_parser.add_argument('--backend', type=str, default='x86',
+                                 choices=['x86', 'fbgemm', 'qnnpack', 'onednn'],
+                                 help='Backend lượng tử hóa của PyTorch (mặc định: x86; qnnpack cho ARM)')
+    
+    # ===== BENCHMARK subcommand =====
+    benchmark_parser = subparsers.add_parser(
+        'benchmark',
+        help='So sánh mô hình đã xuất với PyTorch: sai khác đầu ra và độ trễ',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+Ví dụ:
+  python runstego.py benchmark --export results/onnx
+  python runstego.py benchmark --export results/torchscript --sizes 512x512 1080p --roles decoder
+        """
+    )
+    benchmark_parser.add_argument('--export', '-x', type=str, required=True,
+                                  help='Thư mục mô hình đã xuất (TorchScript hoặc ONNX)')
+    benchmark_parser.add_argument('--model', '-m', type=str, default=None,
+                                  help='Checkpoint để so sánh (tự chọn tốt nhất nếu không chỉ định)')
+    benchmark_parser.add_argument('--sizes', nargs='+', default=['512x512', '1080p', '4K'],
+                                  choices=['512x512', '1080p', '4K'], help='Kích thước ảnh đo')
+    benchmark_parser.add_argument('--roles', nargs='+', default=['encoder', 'decoder', 'reverse_decoder'],
+                                  choices=['encoder', 'decoder', 'reverse_decoder'], help='Các mô hình đo')
+    benchmark_parser.add_argument('--repeats', type=int, default=3,
+                                  help='Số lần chạy để lấy trung bình (mặc định: 3)')
+    benchmark_parser.add_argument('--tolerance', type=float, default=1e-3,
+                                  help='Sai khác tối đa chấp nhận được (mặc định: 1e-3)')
     
     # Parse arguments
     args = parser.parse_args()
@@ -679,6 +979,16 @@ Ví dụ:
         return cmd_decode(args)
     elif args.command == 'reverse':
         return cmd_reverse(args)
+    elif args.command == 'export-torchscript':
+        return cmd_export_torchscript(args)
+    elif args.command == 'export-slim':
+        return cmd_export_slim(args)
+    elif args.command == 'quantize':
+        return cmd_quantize(args)
+    elif args.command == 'export-onnx':
+        return cmd_export_onnx(args)
+    elif args.command == 'benchmark':
+        return cmd_benchmark(args)
     else:
         parser.print_help()
         return 1
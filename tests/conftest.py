@@ -0,0 +1,46 @@
+"""
+Fixture dùng chung: mô hình và checkpoint nhỏ với trọng số ngẫu nhiên.
+"""
+import pytest
+import torch
+import torch.nn as nn
+
+from enhancedstegan import build_model
+
+DATA_DEPTH = 2
+HIDDEN_SIZE = 8
+ARCHITECTURE = {'encoder': 'ResidualEncoder', 'decoder': 'BasicDecoder', 'reverse_decoder': 'ReverseDecoder'}
+
+
+def randomize_batchnorm(model):
+    """Thống kê và hệ số BatchNorm ngẫu nhiên để phép gộp BatchNorm không tầm thường"""
+    for module in model.modules():
+        if isinstance(module, nn.BatchNorm2d):
+            module.running_mean.uniform_(-0.5, 0.5)
+            module.running_var.uniform_(0.5, 2.0)
+            with torch.no_grad():
+                module.weight.uniform_(0.5, 1.5)
+                module.bias.uniform_(-0.5, 0.5)
+    return model
+
+
+@pytest.fixture
+def random_model():
+    """Hàm tạo mô hình (chế độ eval) theo tên lớp trong MODEL_CLASSES"""
+    def make(name, data_depth=DATA_DEPTH, hidden_size=HIDDEN_SIZE, seed=0):
+        torch.manual_seed(seed)
+        return randomize_batchnorm(build_model(name, data_depth, hidden_size)).eval()
+    return make
+
+
+@pytest.fixture
+def checkpoint(tmp_path, random_model):
+    """Checkpoint huấn luyện (.dat) nhỏ theo định dạng của train.py"""
+    path = tmp_path / 'checkpoint.dat'
+    states = {f'state_dict_{role}': random_model(name, seed=k).state_dict()
+              for k, (role, name) in enumerate(ARCHITECTURE.items())}
+    states['architecture'] = {'data_depth': DATA_DEPTH, 'hidden_size': HIDDEN_SIZE, **ARCHITECTURE}
+    states['metrics'] = {'val.decoder_acc': [0.99, 0.98]}
+    states['train_epoch'] = 1
+    torch.save(states, path)
+    return str(path)
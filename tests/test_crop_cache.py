@@ -0,0 +1,118 @@
+"""
+Kiểm tra cache ảnh huấn luyện (crop_cache.py): shard memmap + index.json và
+dataset dùng được trong tiến trình worker.
+"""
+import json
+import os
+import pickle
+
+import numpy as np
+import pytest
+import torch
+from PIL import Image
+
+from crop_cache import CACHE_INDEX, CropCacheDataset, build_crop_cache, is_crop_cache
+
+CROP = 16
+# Ảnh 20x30 có hai tile 20 theo chiều rộng; ảnh 12x10 nhỏ hơn crop
+SIZES = [(24, 24), (20, 30), (12, 10), (16, 16)]
+
+
+@pytest.fixture
+def images(tmp_path):
+    rng = np.random.default_rng(0)
+    image_dir = tmp_path / 'images' / 'class'
+    image_dir.mkdir(parents=True)
+    pixels = {}
+    for i, (height, width) in enumerate(SIZES):
+        array = rng.integers(0, 256, (height, width, 3), dtype=np.uint8)
+        Image.fromarray(array).save(image_dir / f'{i:02d}.png')
+        pixels[f'class/{i:02d}.png'] = array
+    return str(tmp_path / 'images'), pixels
+
+
+def to_pixels(tensor):
+    return (tensor.permute(1, 2, 0).numpy() + 1.0) * 127.5
+
+
+def find_crop(crop, source):
+    """Crop (đệm 0 nếu ảnh nhỏ hơn) có nằm trong source không"""
+    height, width = source.shape[:2]
+    padded = np.zeros((max(height, CROP), max(width, CROP), 3))
+    padded[:height, :width] = source
+    return any(np.allclose(crop, padded[top:top + CROP, left:left + CROP], atol=1e-3)
+               for top in range(padded.shape[0] - CROP + 1) for left in range(padded.shape[1] - CROP + 1))
+
+
+@pytest.mark.parametrize('tile', [None, 20])
+def test_index_and_shards(images, tmp_path, tile):
+    image_dir, pixels = images
+    cache_dir = str(tmp_path / 'cache')
+    # Shard nhỏ để mỗi ảnh nằm ở một shard riêng
+    index = build_crop_cache(image_dir, cache_dir, tile=tile, shard_bytes=1)
+    assert is_crop_cache(cache_dir)
+    with open(os.path.join(cache_dir, CACHE_INDEX), encoding='utf-8') as f:
+        assert json.load(f) == index
+    assert [image['path'].replace(os.sep, '/') for image in index['images']] == list(pixels)
+
+    for image in index['images']:
+        source = pixels[image['path'].replace(os.sep, '/')]
+        covered = np.zeros(source.shape[:2], dtype=bool)
+        for shard, offset, height, width in image['entries']:
+            data = np.fromfile(os.path.join(cache_dir, index['shards'][shard]), dtype=np.uint8)
+            region = data[offset:offset + height * width * 3].reshape(height, width, 3)
+            top, left = next((t, l) for t in range(source.shape[0] - height + 1)
+                             for l in range(source.shape[1] - width + 1)
+                             if np.array_equal(source[t:t + height, l:l + width], region))
+            covered[top:top + height, left:left + width] = True
+        assert covered.all()
+    assert len(index['shards']) == sum(len(image['entries']) for image in index['images'])
+
+
+@pytest.mark.parametrize('tile', [None, 20])
+def test_crops_come_from_source(images, tmp_path, tile):
+    image_dir, pixels = images
+    cache_dir = str(tmp_path / 'cache')
+    build_crop_cache(image_dir, cache_dir, tile=tile)
+    dataset = CropCacheDataset(cache_dir, crop=CROP, flip=False)
+    assert len(dataset) == len(pixels)
+    torch.manual_seed(0)
+    for i, source in enumerate(pixels.values()):
+        for _ in range(3):
+            crop, label = dataset[i]
+            assert label == 0 and crop.shape == (3, CROP, CROP) and crop.dtype == torch.float32
+            assert find_crop(to_pixels(crop), source)
+
+
+def test_tile_smaller_than_crop_is_rejected(images, tmp_path):
+    cache_dir = str(tmp_path / 'cache')
+    build_crop_cache(images[0], cache_dir, tile=12)
+    with pytest.raises(ValueError):
+        CropCacheDataset(cache_dir, crop=CROP)
+
+
+def test_pickled_dataset_reopens_shards(images, tmp_path):
+    cache_dir = str(tmp_path / 'cache')
+    build_crop_cache(images[0], cache_dir)
+    dataset = CropCacheDataset(cache_dir, crop=CROP, flip=False)
+    dataset[0]
+    assert dataset._shards is not None
+    # Memmap đã mở không được gửi sang worker, worker tự mở lại
+    clone = pickle.loads(pickle.dumps(dataset))
+    assert clone._shards is None
+    torch.manual_seed(1)
+    expected = dataset[1][0]
+    torch.manual_seed(1)
+    assert torch.equal(clone[1][0], expected)
+
+
+def test_dataloader_with_workers(images, tmp_path):
+    cache_dir = str(tmp_path / 'cache')
+    build_crop_cache(images[0], cache_dir)
+    dataset = CropCacheDataset(cache_dir, crop=CROP)
+    dataset[0]
+    # spawn: dataset được pickle sang worker (qua __getstate__) như trên Windows/macOS
+    loader = torch.utils.data.DataLoader(dataset, batch_size=2, num_workers=1, multiprocessing_context='spawn')
+    batches = list(loader)
+    assert sum(len(labels) for _, labels in batches) == len(dataset)
+    assert all(images.shape[1:] == (3, CROP, CROP) for images, _ in batches)
@@ -0,0 +1,51 @@
+"""
+Kiểm tra StegoEngine.encode_variants cho từng biến thể đúng ảnh mà encode
+tạo ra cho message đó.
+"""
+import numpy as np
+import pytest
+import torch
+from PIL import Image
+
+from enhancedstegan import StegoEngine, save_image
+
+MESSAGES = ['Xin chào', 'Bí mật thứ hai', 'a', 'Một message dài hơn một chút cho người nhận thứ tư']
+# Tile 20 trên ảnh 64x48 để lại tile lẻ ở cạnh phải/dưới
+COVER_SIZE = (48, 64)
+
+
+@pytest.fixture
+def cover(tmp_path):
+    pixels = np.random.default_rng(0).integers(0, 256, (*COVER_SIZE, 3), dtype=np.uint8)
+    path = tmp_path / 'cover.png'
+    save_image(pixels, path)
+    return str(path)
+
+
+@pytest.mark.parametrize('tile_size', [None, 20])
+@pytest.mark.parametrize('batch_size', [1, 3])
+def test_variants_match_single_encode(checkpoint, cover, tmp_path, tile_size, batch_size):
+    engine = StegoEngine(checkpoint, device=torch.device('cpu'), warmup=False, cache=None)
+    variants = engine.encode_variants(cover, MESSAGES, batch_size=batch_size, tile_size=tile_size)
+    assert len(variants) == len(MESSAGES)
+    for i, (message, variant) in enumerate(zip(MESSAGES, variants)):
+        path = tmp_path / f'single_{i}.png'
+        engine.encode(cover, message, str(path), tile_size=tile_size)
+        np.testing.assert_array_equal(variant, np.asarray(Image.open(path)))
+
+
+def test_engine_tile_size_is_used(checkpoint, cover, tmp_path):
+    untiled = StegoEngine(checkpoint, device=torch.device('cpu'), warmup=False, cache=None)
+    tiled = StegoEngine(checkpoint, device=torch.device('cpu'), warmup=False, cache=None, tile_size=20)
+    calls = []
+    encode_tensor = tiled._encode_tensor
+
+    def recorded(cover, payload, tile_size=None):
+        calls.append(tile_size)
+        return encode_tensor(cover, payload, tile_size=tile_size)
+
+    tiled._encode_tensor = recorded
+    variants = tiled.encode_variants(cover, MESSAGES[:2])
+    assert calls == [20, 20]
+    for variant, expected in zip(variants, untiled.encode_variants(cover, MESSAGES[:2])):
+        np.testing.assert_array_equal(variant, expected)
@@ -0,0 +1,57 @@
+"""
+Kiểm tra giải mã payload dạng frame (enhancedstegan.decode_frames).
+"""
+import numpy as np
+import pytest
+
+import enhancedstegan
+from enhancedstegan import _ecc_fits, decode_frames, extract_message, make_frame
+
+TEXT = 'Hello world secret'
+# Vị trí trường length (4 byte, big-endian) trong header v2
+LENGTH_OFFSET = 7
+
+
+def frame_logits(frame, copies, magnitude=4.0):
+    """Logits lý tưởng của payload gồm copies bản sao liên tiếp của frame"""
+    bits = np.unpackbits(np.frombuffer(frame * copies, dtype=np.uint8))
+    return np.where(bits > 0, magnitude, -magnitude).astype(np.float32)
+
+
+def test_decode_frames_roundtrip():
+    assert extract_message(frame_logits(make_frame(TEXT), 2)) == TEXT
+
+
+@pytest.mark.parametrize('bit', range(24, 32))
+def test_corrupted_length_field_is_ignored(bit, monkeypatch):
+    """
+    Một bit lỗi ở byte cao của trường length trong bản sao đầu không được
+    làm decode_frames cộng dồn theo chu kỳ dài hơn số logits hiện có (trước
+    đây là MemoryError hoặc hàng GB bộ nhớ); bản sao còn lại vẫn giải mã được.
+    """
+    frame = make_frame(TEXT)
+    length = int.from_bytes(frame[LENGTH_OFFSET:LENGTH_OFFSET + 4], 'big') ^ (1 << bit)
+    if not _ecc_fits(length, frame[6]):
+        pytest.skip('length sai đã bị parse_frame_header loại')
+    corrupted = bytearray(frame)
+    corrupted[LENGTH_OFFSET:LENGTH_OFFSET + 4] = length.to_bytes(4, 'big')
+    logits = np.concatenate([frame_logits(bytes(corrupted), 1), frame_logits(frame, 1)])
+
+    periods = []
+    fold_logits = enhancedstegan.fold_logits
+
+    def checked_fold_logits(logits, period, *args, **kwargs):
+        periods.append(period)
+        assert period <= len(logits), f'chu kỳ {period} dài hơn {len(logits)} logits'
+        return fold_logits(logits, period, *args, **kwargs)
+
+    monkeypatch.setattr(enhancedstegan, 'fold_logits', checked_fold_logits)
+    assert decode_frames(logits) == TEXT
+    assert periods
+
+
+def test_bytearrays_to_texts_marks_uncorrectable():
+    good = enhancedstegan.text_to_bytearray(TEXT)
+    bad = bytearray(good)
+    bad[:200] = bytes(200)
+    assert enhancedstegan.bytearrays_to_texts([bad, good]) == [False, TEXT]
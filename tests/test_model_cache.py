@@ -0,0 +1,82 @@
+"""
+Kiểm tra cache mô hình (model_cache.ModelCache): loại LRU theo dung lượng và
+tải lại khi checkpoint bị ghi đè.
+"""
+import os
+
+import torch
+
+from enhancedstegan import StegoEngine
+from model_cache import ModelCache
+
+
+def touch(path, seconds):
+    """Đặt mtime của path lệch seconds giây so với hiện tại"""
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + seconds * 10**9))
+
+
+def key(name):
+    return (f'/models/{name}.dat', 0, 'decoder', 'cpu', 'float32')
+
+
+def test_lru_eviction_by_bytes():
+    cache = ModelCache(max_bytes=100)
+    cache.put(key('a'), 'A', 40)
+    cache.put(key('b'), 'B', 40)
+    assert cache.get(key('a')) == 'A'
+    # 'b' ít được dùng gần đây nhất nên bị loại để vừa 100 byte
+    cache.put(key('c'), 'C', 40)
+    assert cache.get(key('b')) is None
+    assert cache.get(key('a')) == 'A' and cache.get(key('c')) == 'C'
+    assert cache.current_bytes() == 80
+    assert cache.stats()['evictions'] == 1
+
+
+def test_oversized_entry_is_kept_until_next_put():
+    cache = ModelCache(max_bytes=100)
+    cache.put(key('a'), 'A', 40)
+    cache.put(key('big'), 'BIG', 500)
+    assert len(cache) == 1 and cache.get(key('big')) == 'BIG'
+    cache.put(key('b'), 'B', 10)
+    assert cache.get(key('big')) is None and cache.get(key('b')) == 'B'
+
+
+def test_resize_evicts_immediately():
+    cache = ModelCache(max_bytes=100)
+    for name in 'abc':
+        cache.put(key(name), name.upper(), 30)
+    cache.resize(40)
+    assert len(cache) == 1 and cache.get(key('c')) == 'C'
+    assert cache.stats()['evictions'] == 2
+
+
+def test_key_changes_with_mtime(tmp_path):
+    path = tmp_path / 'model.dat'
+    path.write_bytes(b'0')
+    original = ModelCache.key(str(path), 'decoder', 'cpu', 'float32')
+    assert ModelCache.key(str(path), 'decoder', 'cpu', 'float32') == original
+    touch(path, 10)
+    assert ModelCache.key(str(path), 'decoder', 'cpu', 'float32') != original
+
+
+def test_engine_reuses_and_reloads_checkpoint(checkpoint, monkeypatch):
+    loads = []
+    torch_load = torch.load
+
+    def counted_load(*args, **kwargs):
+        loads.append(args[0])
+        return torch_load(*args, **kwargs)
+
+    monkeypatch.setattr(torch, 'load', counted_load)
+    cache = ModelCache()
+    first = StegoEngine(checkpoint, device=torch.device('cpu'), warmup=False, cache=cache)
+    second = StegoEngine(checkpoint, device=torch.device('cpu'), warmup=False, cache=cache)
+    assert len(loads) == 1
+    assert second.decoder is first.decoder and second.decoder_pixels == first.decoder_pixels
+
+    # Checkpoint được ghi đè (mtime mới): phải đọc lại file
+    touch(checkpoint, 10)
+    third = StegoEngine(checkpoint, device=torch.device('cpu'), warmup=False, cache=cache)
+    assert len(loads) == 2
+    assert third.decoder is not first.decoder
@@ -0,0 +1,38 @@
+"""
+Kiểm tra mô hình xuất TorchScript/ONNX cho kết quả như mô hình PyTorch.
+"""
+import pytest
+import torch
+
+from enhancedstegan import StegoEngine
+from model_export import EXPORT_ROLES, export_onnx, export_torchscript, load_export, sample_inputs
+
+TOLERANCE = 1e-4
+# Khác kích thước ảnh mẫu lúc xuất và có batch 2: các chiều N, W, H phải động
+CHECK_SIZE = (37, 29)
+
+
+def assert_parity(checkpoint, export_dir):
+    reference = StegoEngine(checkpoint, device=torch.device('cpu'), warmup=False, cache=None)
+    manifest, models = load_export(export_dir)
+    assert set(models) == set(EXPORT_ROLES)
+    for role, model in models.items():
+        pixels = role == 'decoder' and manifest['decoder_input'] == 'pixels'
+        inputs = sample_inputs(role, manifest['data_depth'], CHECK_SIZE, pixels, batch=2)
+        with torch.no_grad():
+            expected = getattr(reference, role)(*inputs)
+            actual = model(*inputs)
+        assert actual.shape == expected.shape
+        assert torch.allclose(actual, expected, atol=TOLERANCE), role
+
+
+def test_torchscript_matches_pytorch(checkpoint, tmp_path):
+    export_torchscript(checkpoint, str(tmp_path / 'torchscript'), sample_size=(32, 24))
+    assert_parity(checkpoint, str(tmp_path / 'torchscript'))
+
+
+def test_onnx_matches_pytorch(checkpoint, tmp_path):
+    pytest.importorskip('onnxruntime')
+    pytest.importorskip('onnxscript')
+    export_onnx(checkpoint, str(tmp_path / 'onnx'), sample_size=(32, 24))
+    assert_parity(checkpoint, str(tmp_path / 'onnx'))
@@ -0,0 +1,41 @@
+"""
+Kiểm tra mô hình đã gộp BatchNorm (optimize.optimize_for_inference) tương
+đương mô hình gốc ở chế độ eval.
+"""
+import pytest
+import torch
+
+from enhancedstegan import MODEL_CLASSES
+from optimize import FoldedConv2d, PIXEL_SCALE, max_difference, optimize_for_inference
+
+TOLERANCE = 1e-4
+# Ảnh rộng một điểm dùng nhánh tính trực tiếp thay cho bảng hiệu chỉnh biên
+SIZES = [(23, 17), (2, 2), (1, 9), (9, 1), (1, 1)]
+
+
+def model_inputs(name, size, data_depth=2):
+    image = torch.rand(2, 3, *size) * 2 - 1
+    if name.endswith('Encoder'):
+        return (image, torch.randint(0, 2, (2, data_depth, *size)).float())
+    return (image,)
+
+
+@pytest.mark.parametrize('name', sorted(MODEL_CLASSES))
+@pytest.mark.parametrize('size', SIZES, ids=lambda size: 'x'.join(map(str, size)))
+def test_folded_model_matches_original(random_model, name, size):
+    model = random_model(name)
+    optimized = optimize_for_inference(model)
+    assert not any(isinstance(m, torch.nn.BatchNorm2d) for m in optimized.modules())
+    assert any(isinstance(m, FoldedConv2d) for m in optimized.modules())
+    assert max_difference(model, optimized, *model_inputs(name, size)) < TOLERANCE
+
+
+@pytest.mark.parametrize('name', [name for name in sorted(MODEL_CLASSES) if name.endswith('Decoder')
+                                  and name != 'ReverseDecoder'])
+@pytest.mark.parametrize('size', SIZES, ids=lambda size: 'x'.join(map(str, size)))
+def test_pixel_scale_is_folded_into_decoder(random_model, name, size):
+    model = random_model(name)
+    optimized = optimize_for_inference(model, PIXEL_SCALE)
+    image, = model_inputs(name, size)
+    pixels = (image + 1.0) * 127.5
+    assert max_difference(model, optimized, image, optimized_inputs=(pixels,)) < TOLERANCE
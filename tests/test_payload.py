@@ -0,0 +1,29 @@
+"""
+Kiểm tra make_payload(legacy=True) tạo đúng payload của bản dựng trước khi
+vector hóa, để ảnh stego cũ vẫn giải mã được.
+"""
+import pytest
+import torch
+
+from enhancedstegan import make_payload, text_to_bytearray
+
+
+def reference_payload(width, height, depth, text):
+    """Cách làm cũ: danh sách bit (MSB trước) + 32 bit 0, lặp rồi cắt cho vừa"""
+    message = [(byte >> (7 - i)) & 1 for byte in text_to_bytearray(text) for i in range(8)] + [0] * 32
+    payload = message
+    while len(payload) < width * height * depth:
+        payload += message
+    payload = payload[:width * height * depth]
+    return torch.FloatTensor(payload).view(1, depth, height, width)
+
+
+@pytest.mark.parametrize('text', ['a', 'Hello world secret', 'Tiếng Việt có dấu ' * 20])
+# (513, 8, 2) chứa đúng hai bản sao của message 'a'; (9, 7, 3) ngắn hơn một bản sao
+@pytest.mark.parametrize('width, height, depth', [(64, 48, 2), (37, 23, 1), (9, 7, 3), (513, 8, 2),
+                                                  (200, 150, 4)])
+def test_legacy_payload_matches_reference(text, width, height, depth):
+    expected = reference_payload(width, height, depth, text)
+    actual = make_payload(width, height, depth, text, legacy=True)
+    assert actual.dtype == expected.dtype
+    assert torch.equal(actual, expected)
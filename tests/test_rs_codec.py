@@ -0,0 +1,44 @@
+"""
+Kiểm tra rs_codec tương thích từng byte với reedsolo (ảnh stego cũ được mã
+hóa bằng reedsolo). reedsolo chỉ cần khi chạy kiểm tra này:
+pip install reedsolo
+"""
+import numpy as np
+import pytest
+
+from rs_codec import RSCodec
+
+reedsolo = pytest.importorskip('reedsolo')
+
+NSYMS = [10, 134, 250]
+LENGTHS = [1, 4, 100, 255, 600]
+
+
+def random_bytes(rng, length):
+    return bytearray(rng.integers(0, 256, length, dtype=np.uint8).tobytes())
+
+
+@pytest.mark.parametrize('nsym', NSYMS)
+@pytest.mark.parametrize('length', LENGTHS)
+def test_encode_matches_reedsolo(nsym, length):
+    message = random_bytes(np.random.default_rng(length * 1000 + nsym), length)
+    assert RSCodec(nsym).encode(message) == reedsolo.RSCodec(nsym).encode(message)
+
+
+@pytest.mark.parametrize('nsym', NSYMS)
+@pytest.mark.parametrize('length', LENGTHS)
+def test_decode_reedsolo_codewords_with_errors(nsym, length):
+    """Codeword của reedsolo có tới nsym // 2 byte lỗi mỗi khối được sửa giống hệt"""
+    rng = np.random.default_rng(length * 1000 + nsym + 1)
+    message = random_bytes(rng, length)
+    encoded = reedsolo.RSCodec(nsym).encode(message)
+    corrupted = bytearray(encoded)
+    for block in range(0, len(encoded), 255):
+        size = min(255, len(encoded) - block)
+        for pos in rng.choice(size, min(nsym // 2, size), replace=False):
+            corrupted[block + pos] ^= int(rng.integers(1, 256))
+
+    decoded, decoded_full, _ = RSCodec(nsym).decode(corrupted)
+    expected, expected_full, _ = reedsolo.RSCodec(nsym).decode(corrupted)
+    assert decoded == expected == message
+    assert decoded_full == expected_full == encoded
@@ -0,0 +1,60 @@
+"""
+Kiểm tra checkpoint rút gọn (model_export.export_slim) đọc lại bằng mmap cho
+đúng trọng số và kết quả như checkpoint huấn luyện.
+"""
+import torch
+
+from enhancedstegan import StegoEngine
+from model_export import EXPORT_ROLES, SLIM_FORMAT, export_slim, is_slim_export, load_state_dicts
+from conftest import ARCHITECTURE, DATA_DEPTH, HIDDEN_SIZE
+
+
+def test_slim_roundtrip(checkpoint, tmp_path, monkeypatch):
+    output = str(tmp_path / 'slim')
+    manifest = export_slim(checkpoint, output)
+    assert is_slim_export(output)
+    assert manifest['format'] == SLIM_FORMAT
+    assert manifest['architecture'] == ARCHITECTURE
+    assert (manifest['data_depth'], manifest['hidden_size']) == (DATA_DEPTH, HIDDEN_SIZE)
+    assert manifest['epoch'] == 1
+
+    loads = []
+    torch_load = torch.load
+
+    def recorded_load(*args, **kwargs):
+        loads.append(kwargs.get('mmap'))
+        return torch_load(*args, **kwargs)
+
+    monkeypatch.setattr(torch, 'load', recorded_load)
+    _, state_dicts = load_state_dicts(output)
+    assert loads == [True] * len(EXPORT_ROLES)
+    monkeypatch.undo()
+
+    original = torch.load(checkpoint, map_location='cpu', weights_only=False)
+    for role in EXPORT_ROLES:
+        expected = original[f'state_dict_{role}']
+        assert state_dicts[role].keys() == expected.keys()
+        for name, tensor in expected.items():
+            assert torch.equal(state_dicts[role][name], tensor), (role, name)
+
+
+def test_load_state_dicts_reads_only_requested_roles(checkpoint, tmp_path):
+    output = str(tmp_path / 'slim')
+    export_slim(checkpoint, output)
+    _, state_dicts = load_state_dicts(output, roles=('decoder',))
+    assert list(state_dicts) == ['decoder']
+
+
+def test_slim_engine_matches_checkpoint(checkpoint, tmp_path):
+    output = str(tmp_path / 'slim')
+    export_slim(checkpoint, output)
+    reference = StegoEngine(checkpoint, device=torch.device('cpu'), warmup=False, cache=None)
+    slim = StegoEngine(output, device=torch.device('cpu'), warmup=False, cache=None)
+    image = torch.rand(1, 3, 29, 21) * 2 - 1
+    payload = torch.randint(0, 2, (1, DATA_DEPTH, 29, 21)).float()
+    assert slim.decoder_pixels == reference.decoder_pixels
+    with torch.no_grad():
+        assert torch.allclose(slim.encoder(image, payload), reference.encoder(image, payload), atol=1e-6)
+        decoder_input = (image + 1.0) * 127.5 if slim.decoder_pixels else image
+        assert torch.allclose(slim.decoder(decoder_input), reference.decoder(decoder_input), atol=1e-6)
+        assert torch.allclose(slim.reverse_decoder(image), reference.reverse_decoder(image), atol=1e-6)
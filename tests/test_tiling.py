@@ -0,0 +1,30 @@
+"""
+Kiểm tra suy luận theo tile (enhancedstegan.tiled_forward) cho kết quả như
+khi chạy trên toàn ảnh.
+"""
+import pytest
+import torch
+
+from enhancedstegan import tiled_forward
+from optimize import PIXEL_SCALE, optimize_for_inference
+
+# Ảnh 45x33 với tile 16: các tile ở cạnh phải/dưới chỉ còn 13 và 1 điểm
+SIZE = (45, 33)
+
+
+@pytest.mark.parametrize('name', ['BasicDecoder', 'DenseDecoder', 'ReverseDecoder'])
+@pytest.mark.parametrize('optimized', [False, True], ids=['eager', 'folded'])
+@pytest.mark.parametrize('tile_size, tile_batch', [(16, 1), (16, 4), (7, 2)])
+def test_tiled_matches_untiled(random_model, name, optimized, tile_size, tile_batch):
+    model = random_model(name)
+    image = torch.rand(2, 3, *SIZE) * 2 - 1
+    if optimized:
+        # Decoder đã gộp nhận ảnh 0..255; biên mỗi tile dùng bảng hiệu chỉnh của FoldedConv2d
+        pixels = name.endswith('Decoder') and name != 'ReverseDecoder'
+        model = optimize_for_inference(model, PIXEL_SCALE if pixels else None)
+        if pixels:
+            image = (image + 1.0) * 127.5
+    with torch.no_grad():
+        expected = model(image)
+        actual = tiled_forward(model, [image], tile_size, tile_batch=tile_batch)
+    assert torch.allclose(actual, expected, atol=1e-5)
@@ -3,9 +3,8 @@ import matplotlib.pyplot as plt
 from torch.nn.functional import binary_cross_entropy_with_logits, mse_loss
 
 from critic import BasicCritic
-from decoder import BasicDecoder
-from encoder import BasicEncoder, ResidualEncoder
-from reverse_decoder import ReverseDecoder
+from enhancedstegan import build_model
+from crop_cache import CropCacheDataset, is_crop_cache
 
 from torchvision import datasets, transforms
 from torchvision.models import vgg16, VGG16_Weights
@@ -19,7 +18,8 @@ from tqdm import tqdm
 import torch
 import torch.nn.functional as F
 import os
-import gc
+import time
+import contextlib
 from PIL import ImageFile
 ImageFile.LOAD_TRUNCATED_IMAGES = True
 
@@ -84,13 +84,196 @@ def compute_gradient_penalty(critic, real_data, fake_data, device):
     return gradient_penalty
 
 
+def compute_r1_penalty(real_scores, real_data):
+    """
+    R1: bình phương chuẩn gradient của critic trên ảnh thật. Dùng lại điểm
+    critic của ảnh thật (real_data phải requires_grad) nên không tốn thêm một
+    lần chạy critic như gradient penalty trên ảnh nội suy.
+    """
+    gradients = torch.autograd.grad(
+        outputs=real_scores.sum(),
+        inputs=real_data,
+        create_graph=True
+    )[0]
+    return gradients.pow(2).reshape(gradients.size(0), -1).sum(dim=1).mean()
+
+
+CRITIC_REGULARIZERS = ('gp', 'lazy_gp', 'r1', 'spectral_norm', 'clip')
+
+
+class CriticRegularizer:
+    """
+    Một bước cập nhật critic với cách điều chuẩn chọn trong cấu hình:
+
+    - gp: gradient penalty trên ảnh nội suy ở mọi bước (WGAN-GP)
+    - lazy_gp: gradient penalty mỗi interval bước, trọng số nhân interval
+    - r1: penalty gamma/2 * |grad|^2 trên ảnh thật, mỗi interval bước
+    - spectral_norm: chuẩn hóa phổ các lớp tích chập của critic, không penalty
+    - clip: kẹp trọng số về [-0.1, 0.1] sau mỗi bước (WGAN gốc)
+
+    Thời gian các bước có và không có penalty được đo riêng để thấy chi phí
+    của điều chuẩn.
+    """
+
+    def __init__(self, kind, weight=10.0, interval=1):
+        if kind not in CRITIC_REGULARIZERS:
+            raise ValueError(f"critic_regularizer phải là một trong {CRITIC_REGULARIZERS}: {kind}")
+        self.kind = kind
+        self.weight = weight
+        self.interval = interval if kind in ('lazy_gp', 'r1') else 1
+        self.steps = 0
+        self.reset_timing()
+
+    def reset_timing(self):
+        self.timing = {True: [0, 0.0], False: [0, 0.0]}
+
+    def prepare(self, critic):
+        """Gắn spectral norm vào các lớp tích chập của critic nếu cần"""
+        if self.kind == 'spectral_norm':
+            for module in critic.modules():
+                if isinstance(module, torch.nn.Conv2d):
+                    torch.nn.utils.parametrizations.spectral_norm(module)
+        return critic
+
+    def step(self, critic, optimizer, cover, generated, device, autocast=contextlib.nullcontext, scaler=None):
+        """
+        Một bước cập nhật critic, trả về (cover_score, generated_score).
+        Critic chạy trong autocast(); penalty luôn tính bằng float32, scaler
+        (GradScaler) dùng cho float16.
+        """
+        start = time.perf_counter()
+        self.steps += 1
+        penalized = self.kind in ('gp', 'lazy_gp', 'r1') and self.steps % self.interval == 0
+        r1 = penalized and self.kind == 'r1'
+
+        if r1:
+            # R1 lấy gradient qua chính lần chạy critic trên ảnh thật
+            cover = cover.detach().requires_grad_(True)
+        with contextlib.nullcontext() if r1 else autocast():
+            cover_scores = critic(cover).float()
+        with autocast():
+            generated_score = critic(generated).float().mean()
+        cover_score = cover_scores.mean()
+
+        critic_loss = generated_score - cover_score
+        if r1:
+            critic_loss += self.weight / 2 * self.interval * compute_r1_penalty(cover_scores, cover)
+        elif penalized:
+            critic_loss += self.weight * self.interval * compute_gradient_penalty(
+                critic, cover.float(), generated.float(), device)
+
+        optimizer.zero_grad()
+        if scaler is None:
+            critic_loss.backward()
+            optimizer.step()
+        else:
+            scaler.scale(critic_loss).backward()
+            scaler.step(optimizer)
+            scaler.update()
+
+        if self.kind == 'clip':
+            for p in critic.parameters():
+                p.data.clamp_(-0.1, 0.1)
+
+        if device.type == 'cuda':
+            torch.cuda.synchronize()
+        self.timing[penalized][0] += 1
+        self.timing[penalized][1] += time.perf_counter() - start
+        return cover_score, generated_score
+
+    def stats(self):
+        """Số bước và thời gian trung bình (ms) của bước có/không có penalty"""
+        stats = {}
+        for penalized, name in ((False, 'plain'), (True, 'penalized')):
+            count, seconds = self.timing[penalized]
+            stats[f'{name}_steps'] = count
+            stats[f'{name}_ms'] = seconds / count * 1000 if count else None
+        return stats
+
+    def summary(self):
+        stats = self.stats()
+        parts = [f"{label} {stats[name + '_ms']:.1f} ms x {stats[name + '_steps']}"
+                 for name, label in (('plain', 'không penalty'), ('penalized', 'có penalty'))
+                 if stats[name + '_steps']]
+        return f"Critic ({self.kind}): " + ', '.join(parts)
+
+
+def make_loader(dataset, batch_size, shuffle, num_workers, pin_memory, prefetch_factor):
+    """
+    DataLoader đọc và cắt ảnh song song trong num_workers tiến trình. Mỗi
+    worker chuẩn bị trước prefetch_factor batch và được giữ lại giữa các lượt
+    duyệt (persistent_workers) nên không phải khởi động lại mỗi epoch.
+    """
+    options = {}
+    if num_workers > 0:
+        options = {'persistent_workers': True, 'prefetch_factor': prefetch_factor}
+    return torch.utils.data.DataLoader(
+        dataset,
+        batch_size=batch_size,
+        shuffle=shuffle,
+        num_workers=num_workers,
+        pin_memory=pin_memory,
+        **options
+    )
+
+
+class Throughput:
+    """
+    Đo tốc độ một pha huấn luyện: số ảnh mỗi giây và tỷ lệ thời gian chờ
+    DataLoader. Tỷ lệ chờ cao nghĩa là mô hình đang thiếu dữ liệu.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.images = 0
+        self.batches = 0
+        self.wait = 0.0
+        self.elapsed = 0.0
+
+    def __call__(self, loader):
+        """Duyệt loader, cộng dồn thời gian chờ từng batch và tổng thời gian"""
+        start = time.perf_counter()
+        batches = iter(loader)
+        try:
+            while True:
+                waited = time.perf_counter()
+                try:
+                    cover, label = next(batches)
+                except StopIteration:
+                    return
+                self.wait += time.perf_counter() - waited
+                self.images += cover.size(0)
+                self.batches += 1
+                yield cover, label
+        finally:
+            self.elapsed += time.perf_counter() - start
+
+    def summary(self):
+        elapsed = max(self.elapsed, 1e-9)
+        return (f"{self.name:<16} {self.images / elapsed:8.2f} ảnh/s | "
+                f"{elapsed / max(self.batches, 1) * 1000:.0f} ms/batch | "
+                f"{self.images} ảnh trong {elapsed:.1f}s | chờ dữ liệu {self.wait / elapsed:.0%}")
+
+
 def main():
     data_dir = 'div2k'
+    # Cache ảnh đã giải mã (tạo bằng crop_cache.py); dùng ImageFolder nếu chưa có
+    crop_cache_dir = 'div2k_cache'
+    crop_size = 360
     epochs = 60
     data_depth = 2
     hidden_size = 32
+    # Tên lớp trong enhancedstegan.MODEL_CLASSES; được lưu trong checkpoint để
+    # StegoEngine dựng lại đúng lớp bằng cùng build_model
+    encoder_class = 'ResidualEncoder'
+    decoder_class = 'BasicDecoder'
     batch_size = 4
     
+    # DataLoader: số tiến trình đọc ảnh (0 = đọc trên luồng chính) và số
+    # batch mỗi worker chuẩn bị trước
+    num_workers = min(4, os.cpu_count() or 1)
+    prefetch_factor = 2
+    
     lr_critic = 2e-4
     lr_encoder_decoder = 2e-4
     
@@ -101,10 +284,19 @@ def main():
     weight_adversarial = 0.005
     weight_reverse = 50.0
     
-    use_gradient_penalty = True
+    # Điều chuẩn critic: 'gp', 'lazy_gp', 'r1', 'spectral_norm' hoặc 'clip'
+    critic_regularizer = 'gp'
     lambda_gp = 10.0
+    r1_gamma = 10.0
+    # Với lazy_gp và r1: áp penalty mỗi k bước critic (trọng số nhân k)
+    regularizer_interval = 4
     n_critic = 2
     
+    # Mixed precision: None (float32), 'bfloat16' (CPU, CUDA) hoặc 'float16'
+    # (CUDA, MPS; dùng GradScaler). Penalty của critic và các loss luôn tính
+    # bằng float32, kiểm định chạy float32.
+    amp_dtype = None
+    
     stop_on_target = True
     patience = 25
     min_psnr = 37.0
@@ -121,13 +313,25 @@ def main():
     
     use_pin_memory = (device.type == 'cuda')
     
+    amp_enabled = amp_dtype is not None
+    amp_torch_dtype = getattr(torch, amp_dtype) if amp_enabled else torch.float32
+    
+    def autocast():
+        return torch.autocast(device.type, dtype=amp_torch_dtype, enabled=amp_enabled)
+    
     print(f"\n{'='*70}")
     print(f"CẤU HÌNH HUẤN LUYỆN CẢI TIẾN")
     print(f"{'='*70}")
     print(f"Thiết bị: {device}")
     print(f"Pin Memory: {use_pin_memory}")
+    print(f"Mixed precision: {amp_dtype or 'tắt (float32)'}")
+    if amp_dtype == 'float16' and device.type == 'cpu':
+        print("Cảnh báo: float16 trên CPU rất chậm, dùng amp_dtype = 'bfloat16'")
+    print(f"DataLoader: {num_workers} worker, prefetch {prefetch_factor} batch/worker")
     print(f"Số epoch: {epochs}")
     print(f"Kích thước batch: {batch_size}")
+    print(f"Kiến trúc: {encoder_class}/{decoder_class}, "
+          f"data_depth={data_depth}, hidden_size={hidden_size}")
     print(f"LR Critic: {lr_critic}")
     print(f"LR Encoder/Decoder: {lr_encoder_decoder}")
     print(f"\nTrọng số Loss:")
@@ -137,8 +341,9 @@ def main():
     print(f"  Decoder: {weight_decoder}")
     print(f"  Adversarial: {weight_adversarial}")
     print(f"  Reverse Hiding: {weight_reverse}")
-    print(f"\nWGAN-GP: {use_gradient_penalty}")
-    print(f"Số vòng lặp Critic: {n_critic}")
+    print(f"\nĐiều chuẩn Critic: {critic_regularizer}"
+          + (f" (mỗi {regularizer_interval} bước)" if critic_regularizer in ('lazy_gp', 'r1') else ""))
+    print(f"Số bước Critic mỗi batch: {n_critic}")
     print(f"\nDừng Sớm:")
     print(f"  Dừng khi đạt mục tiêu: {stop_on_target}")
     print(f"  Patience: {patience} epochs")
@@ -181,6 +386,8 @@ def main():
         'val.reverse_mse',
         'val.reverse_psnr',
         'val.reverse_ssim',
+        'val.decoder_acc_amp',
+        'val.psnr_amp',
         'train.encoder_mse',
         'train.decoder_loss',
         'train.decoder_acc',
@@ -197,33 +404,33 @@ def main():
 
     transform = transforms.Compose([
         transforms.RandomHorizontalFlip(),
-        transforms.RandomCrop(360, pad_if_needed=True),
+        transforms.RandomCrop(crop_size, pad_if_needed=True),
         transforms.ToTensor(),
         transforms.Normalize(mu, sigma)
     ])
 
-    train_set = datasets.ImageFolder(os.path.join(data_dir, "train/"), transform=transform)
-    train_loader = torch.utils.data.DataLoader(
-        train_set, 
-        batch_size=batch_size, 
-        shuffle=True, 
-        num_workers=0,
-        pin_memory=False
-    )
+    def load_dataset(split):
+        cache = os.path.join(crop_cache_dir, split)
+        if is_crop_cache(cache):
+            print(f"Dữ liệu {split}: cache uint8 {cache}")
+            return CropCacheDataset(cache, crop=crop_size)
+        print(f"Dữ liệu {split}: giải mã PNG từ {os.path.join(data_dir, split)} "
+              f"(tạo cache: python crop_cache.py {os.path.join(data_dir, split)} {cache})")
+        return datasets.ImageFolder(os.path.join(data_dir, split), transform=transform)
 
-    valid_set = datasets.ImageFolder(os.path.join(data_dir, "val/"), transform=transform)
-    valid_loader = torch.utils.data.DataLoader(
-        valid_set, 
-        batch_size=batch_size, 
-        shuffle=False, 
-        num_workers=0,
-        pin_memory=False
-    )
+    train_set = load_dataset("train")
+    train_loader = make_loader(train_set, batch_size, True, num_workers, use_pin_memory, prefetch_factor)
+
+    valid_set = load_dataset("val")
+    valid_loader = make_loader(valid_set, batch_size, False, num_workers, use_pin_memory, prefetch_factor)
 
-    encoder = ResidualEncoder(data_depth, hidden_size).to(device)
-    decoder = BasicDecoder(data_depth, hidden_size).to(device)
-    reverse_decoder = ReverseDecoder(hidden_size).to(device)
-    critic = BasicCritic(hidden_size).to(device)
+    encoder = build_model(encoder_class, data_depth, hidden_size).to(device)
+    decoder = build_model(decoder_class, data_depth, hidden_size).to(device)
+    reverse_decoder = build_model('ReverseDecoder', data_depth, hidden_size).to(device)
+    regularizer = CriticRegularizer(critic_regularizer,
+                                    weight=r1_gamma if critic_regularizer == 'r1' else lambda_gp,
+                                    interval=regularizer_interval)
+    critic = regularizer.prepare(BasicCritic(hidden_size)).to(device)
     
     cr_optimizer = Adam(critic.parameters(), lr=lr_critic, betas=(0.5, 0.999))
     en_de_optimizer = Adam(
@@ -239,6 +446,10 @@ def main():
     print(f"Critic tham số: {sum(p.numel() for p in critic.parameters()):,}")
     print(f"Tổng tham số có thể train: {sum(p.numel() for p in list(encoder.parameters()) + list(decoder.parameters()) + list(reverse_decoder.parameters()) + list(critic.parameters())):,}\n")
     
+    # GradScaler chỉ cần cho float16; với bfloat16/float32 nó không làm gì
+    cr_scaler = torch.amp.GradScaler(device.type, enabled=amp_dtype == 'float16')
+    en_de_scaler = torch.amp.GradScaler(device.type, enabled=amp_dtype == 'float16')
+    
     scheduler_critic = CosineAnnealingLR(cr_optimizer, T_max=epochs, eta_min=1e-6)
     scheduler_encdec = CosineAnnealingLR(en_de_optimizer, T_max=epochs, eta_min=1e-6)
     
@@ -254,60 +465,42 @@ def main():
         print(f"Epoch {ep+1}/{epochs} | LR Critic: {cr_optimizer.param_groups[0]['lr']:.6f} | LR EncDec: {en_de_optimizer.param_groups[0]['lr']:.6f}")
         print(f"{'='*70}")
         
-        encoder.eval()
-        decoder.eval()
-        reverse_decoder.eval()
-        critic.train()
-        
-        print(f"Huấn luyện Critic ({n_critic}x vòng lặp)...")
-        
-        for _ in range(n_critic):
-            for cover, _ in tqdm(train_loader, desc=f"Critic vòng {_+1}/{n_critic}", leave=False):
-                gc.collect()
-                cover = cover.to(device)
-                N, _, H, W = cover.size()
-                
-                payload = torch.zeros((N, data_depth, H, W), device=device).random_(0, 2)
-                
-                with torch.no_grad():
-                    generated = encoder(cover, payload)
-                
-                cover_score = critic(cover).mean()
-                generated_score = critic(generated).mean()
-                
-                critic_loss = generated_score - cover_score
-                
-                if use_gradient_penalty:
-                    gp = compute_gradient_penalty(critic, cover, generated, device)
-                    critic_loss += lambda_gp * gp
-                
-                cr_optimizer.zero_grad()
-                critic_loss.backward()
-                cr_optimizer.step()
-                
-                if not use_gradient_penalty:
-                    for p in critic.parameters():
-                        p.data.clamp_(-0.1, 0.1)
-                
-                metrics['train.cover_score'].append(cover_score.item())
-                metrics['train.generated_score'].append(generated_score.item())
-
         encoder.train()
         decoder.train()
         reverse_decoder.train()
-        critic.eval()
         
-        print("Huấn luyện Encoder-Decoder...")
-        for cover, _ in tqdm(train_loader, desc="Encoder-Decoder", leave=False):
-            gc.collect()
-            cover = cover.to(device)
+        # Mỗi batch: n_critic bước critic rồi một bước encoder-decoder trên cùng
+        # batch. Encoder chỉ chạy một lần; critic học trên bản detach của ảnh
+        # stego, bước encoder-decoder dùng lại đồ thị của chính lần chạy đó
+        # (trọng số encoder chưa đổi giữa hai bước).
+        print(f"Huấn luyện Critic ({n_critic} bước) + Encoder-Decoder mỗi batch...")
+        train_throughput = Throughput('Huấn luyện')
+        regularizer.reset_timing()
+        for cover, _ in tqdm(train_throughput(train_loader), desc="Huấn luyện",
+                             total=len(train_loader), leave=False):
+            cover = cover.to(device, non_blocking=use_pin_memory)
             N, _, H, W = cover.size()
             
             payload = torch.zeros((N, data_depth, H, W), device=device).random_(0, 2)
             
-            generated = encoder(cover, payload)
-            decoded = decoder(generated)
-            recovered_cover = reverse_decoder(generated)
+            # Các mô hình chạy trong autocast, đầu ra được đưa về float32 để
+            # tính loss
+            with autocast():
+                generated = encoder(cover, payload).float()
+            generated_detached = generated.detach()
+            
+            critic.train()
+            for _ in range(n_critic):
+                cover_score, generated_score = regularizer.step(critic, cr_optimizer, cover,
+                                                                generated_detached, device,
+                                                                autocast=autocast, scaler=cr_scaler)
+                metrics['train.cover_score'].append(cover_score.item())
+                metrics['train.generated_score'].append(generated_score.item())
+            critic.eval()
+            
+            with autocast():
+                decoded = decoder(generated).float()
+                recovered_cover = reverse_decoder(generated).float()
             
             encoder_mse = mse_loss(generated, cover)
             
@@ -317,8 +510,9 @@ def main():
             if use_perceptual_loss and vgg is not None:
                 gen_normalized = (generated + 1.0) / 2.0
                 cover_normalized = (cover + 1.0) / 2.0
-                gen_features = vgg(gen_normalized)
-                cover_features = vgg(cover_normalized)
+                with autocast():
+                    gen_features = vgg(gen_normalized).float()
+                    cover_features = vgg(cover_normalized).float()
                 perceptual_loss = mse_loss(gen_features, cover_features)
             else:
                 perceptual_loss = torch.tensor(0.0, device=device)
@@ -326,7 +520,8 @@ def main():
             decoder_loss = binary_cross_entropy_with_logits(decoded, payload)
             decoder_acc = (decoded >= 0.0).eq(payload >= 0.5).sum().float() / payload.numel()
             
-            generated_score = critic(generated).mean()
+            with autocast():
+                generated_score = critic(generated).float().mean()
             
             reverse_mse = mse_loss(recovered_cover, cover)
             
@@ -340,13 +535,15 @@ def main():
             )
             
             en_de_optimizer.zero_grad()
-            total_loss.backward()
+            en_de_scaler.scale(total_loss).backward()
+            en_de_scaler.unscale_(en_de_optimizer)
             
             torch.nn.utils.clip_grad_norm_(encoder.parameters(), max_norm=1.0)
             torch.nn.utils.clip_grad_norm_(decoder.parameters(), max_norm=1.0)
             torch.nn.utils.clip_grad_norm_(reverse_decoder.parameters(), max_norm=1.0)
             
-            en_de_optimizer.step()
+            en_de_scaler.step(en_de_optimizer)
+            en_de_scaler.update()
             
             metrics['train.encoder_mse'].append(encoder_mse.item())
             metrics['train.decoder_loss'].append(decoder_loss.item())
@@ -362,10 +559,11 @@ def main():
         critic.eval()
         
         print("Đang kiểm định...")
+        valid_throughput = Throughput('Kiểm định')
         with torch.no_grad():
-            for cover, _ in tqdm(valid_loader, desc="Kiểm định", leave=False):
-                gc.collect()
-                cover = cover.to(device)
+            for cover, _ in tqdm(valid_throughput(valid_loader), desc="Kiểm định",
+                                 total=len(valid_loader), leave=False):
+                cover = cover.to(device, non_blocking=use_pin_memory)
                 N, _, H, W = cover.size()
                 
                 payload = torch.zeros((N, data_depth, H, W), device=device).random_(0, 2)
@@ -395,6 +593,15 @@ def main():
                 metrics['val.reverse_mse'].append(reverse_mse.item())
                 metrics['val.reverse_psnr'].append(reverse_psnr.item())
                 metrics['val.reverse_ssim'].append(reverse_ssim.item())
+                
+                if amp_enabled:
+                    # Cùng batch, chạy trong autocast để so với float32 ở trên
+                    with autocast():
+                        generated_amp = encoder(cover, payload).float()
+                        decoded_amp = decoder(generated_amp).float()
+                    decoder_acc_amp = (decoded_amp >= 0.0).eq(payload >= 0.5).sum().float() / payload.numel()
+                    metrics['val.decoder_acc_amp'].append(decoder_acc_amp.item())
+                    metrics['val.psnr_amp'].append(10 * torch.log10(4 / mse_loss(generated_amp, cover)).item())
         
         avg_psnr = np.mean(metrics['val.psnr'])
         avg_ssim = np.mean(metrics['val.ssim'])
@@ -427,6 +634,16 @@ def main():
         print(f"   Điểm Cover:     {np.mean(metrics['val.cover_score']):.4f}")
         print(f"   Điểm Generated: {np.mean(metrics['val.generated_score']):.4f}")
         print(f"   Margin:         {np.mean(metrics['val.cover_score']) - np.mean(metrics['val.generated_score']):.4f}")
+        if amp_enabled:
+            print(f"\nMixed precision ({amp_dtype}) so với float32:")
+            print(f"   Độ chính xác Val: {np.mean(metrics['val.decoder_acc_amp']):.4f} "
+                  f"({np.mean(metrics['val.decoder_acc_amp']) - avg_decoder_acc:+.4f})")
+            print(f"   PSNR Val:         {np.mean(metrics['val.psnr_amp']):.2f} dB "
+                  f"({np.mean(metrics['val.psnr_amp']) - avg_psnr:+.2f} dB)")
+        print(f"\nTốc độ:")
+        for throughput in (train_throughput, valid_throughput):
+            print(f"   {throughput.summary()}")
+        print(f"   {regularizer.summary()}")
         
         improved = False
         
@@ -491,6 +708,10 @@ def main():
             'best_ssim': best_ssim,
             'best_reverse_psnr': avg_reverse_psnr,
             'best_reverse_ssim': avg_reverse_ssim,
+            'throughput': {
+                'train_images_per_sec': train_throughput.images / max(train_throughput.elapsed, 1e-9),
+                'critic': regularizer.stats(),
+            },
             'hyperparameters': {
                 'weight_mse': weight_mse,
                 'weight_ssim': weight_ssim,
@@ -498,10 +719,21 @@ def main():
                 'weight_decoder': weight_decoder,
                 'weight_adversarial': weight_adversarial,
                 'weight_reverse': weight_reverse,
-                'use_gradient_penalty': use_gradient_penalty,
+                'critic_regularizer': critic_regularizer,
+                'regularizer_interval': regularizer.interval,
+                'lambda_gp': lambda_gp,
+                'r1_gamma': r1_gamma,
+                'amp_dtype': amp_dtype,
                 'n_critic': n_critic,
                 'hidden_size': hidden_size,
             },
+            'architecture': {
+                'data_depth': data_depth,
+                'hidden_size': hidden_size,
+                'encoder': encoder_class,
+                'decoder': decoder_class,
+                'reverse_decoder': 'ReverseDecoder',
+            },
             'date': now.strftime("%Y-%m-%d_%H:%M:%S"),
         }
         torch.save(states, fname)
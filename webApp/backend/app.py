@@ -37,7 +37,9 @@ logger = logging.getLogger(__name__)
 
 # Import steganography modules
 try:
-    from enhancedstegan import encode_message, decode_message, reverse_hiding
+    from enhancedstegan import encode_message, decode_message, reverse_hiding, decode_and_reverse, get_engine
+    from model_export import is_export_dir, onnxruntime
+    from model_cache import model_cache
     logger.info("✓ Successfully imported steganography modules")
 except Exception as e:
     logger.error(f"✗ Failed to import steganography modules: {e}")
@@ -70,9 +72,17 @@ ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg'}
 BEST_MODEL_PATH = None
 try:
     if os.path.exists(MODEL_FOLDER):
-        # First try to find model.dat
+        # Prefer an exported bundle (runstego.py export-onnx --output model/onnx,
+        # export-torchscript --output model/torchscript or export-slim --output
+        # model/slim), then model.dat (ONNX only when onnxruntime is installed)
+        exported_models = [os.path.join(MODEL_FOLDER, name) for name in ('onnx', 'torchscript', 'slim')
+                           if name != 'onnx' or onnxruntime is not None]
+        exported_model = next((path for path in exported_models if is_export_dir(path)), None)
         default_model = os.path.join(MODEL_FOLDER, 'model.dat')
-        if os.path.exists(default_model):
+        if exported_model:
+            BEST_MODEL_PATH = exported_model
+            logger.info(f"✓ Found exported model: {BEST_MODEL_PATH}")
+        elif os.path.exists(default_model):
             BEST_MODEL_PATH = default_model
             logger.info(f"✓ Found default model: {BEST_MODEL_PATH}")
         else:
@@ -88,6 +98,14 @@ try:
 except Exception as e:
     logger.error(f"✗ Error loading model: {e}")
 
+# Load the checkpoint once at startup so requests only pay for inference
+try:
+    get_engine(BEST_MODEL_PATH)
+    logger.info("✓ Steganography engine ready")
+except Exception as e:
+    logger.error(f"✗ Failed to initialize steganography engine: {e}")
+    logger.error(traceback.format_exc())
+
 # Ensure folders exist
 # Ensure folders exist
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
@@ -100,6 +118,27 @@ app.config['KEYS_FOLDER'] = KEYS_FOLDER
 app.config['MAX_CONTENT_LENGTH'] = MAX_CONTENT_LENGTH
 
 
+def list_models():
+    """Checkpoints (.dat) and exported model folders available in MODEL_FOLDER"""
+    if not os.path.isdir(MODEL_FOLDER):
+        return []
+    return sorted(name for name in os.listdir(MODEL_FOLDER)
+                  if name.endswith('.dat') or is_export_dir(os.path.join(MODEL_FOLDER, name)))
+
+
+def resolve_model_path(name):
+    """
+    Path of the model named in a request (a name returned by /models),
+    or BEST_MODEL_PATH when no model is named
+    """
+    name = (name or '').strip()
+    if not name:
+        return BEST_MODEL_PATH
+    if name not in list_models():
+        raise ValueError(f"Unknown model: {name}")
+    return os.path.join(MODEL_FOLDER, name)
+
+
 def allowed_file(filename):
     """Check if file extension is allowed"""
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
@@ -189,6 +228,19 @@ def health_check():
     return jsonify(health_status)
 
 
+@app.route('/models', methods=['GET'])
+def models():
+    """
+    Models endpoint - List the models a request can name in its `model`
+    field, with the hit/miss/eviction counters of the model cache
+    """
+    return jsonify({
+        'default': os.path.basename(BEST_MODEL_PATH) if BEST_MODEL_PATH else None,
+        'models': list_models(),
+        'cache': model_cache.stats(),
+    })
+
+
 @app.route('/encode', methods=['POST'])
 def encode():
     """
@@ -200,11 +252,17 @@ def encode():
     - use_encryption: boolean (optional)
     - public_key: public key file (if use_encryption=true)
     - return_url: boolean (optional, default=true) - return URL instead of file
+    - model: model name from /models (optional, default=best model)
     """
     cover_path = None
     stego_path = None
     
     try:
+        try:
+            model_path = resolve_model_path(request.form.get('model'))
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
         # Validate inputs
         if 'cover_image' not in request.files:
             return jsonify({'error': 'No cover image provided'}), 400
@@ -281,14 +339,14 @@ def encode():
         
         logger.info(f"[ENCODE] Starting steganography encoding...")
         logger.info(f"[ENCODE] Message length: {len(final_message)} chars")
-        logger.info(f"[ENCODE] Using model: {BEST_MODEL_PATH or 'random weights'}")
+        logger.info(f"[ENCODE] Using model: {model_path or 'random weights'}")
         
         try:
             encode_message(
                 cover_image_path=cover_path,
                 secret_text=final_message,
                 output_path=stego_path,
-                model_path=BEST_MODEL_PATH
+                model_path=model_path
             )
             logger.info(f"[ENCODE] Encoding complete: {stego_path}")
         except Exception as encode_error:
@@ -350,10 +408,19 @@ def decode():
     - stego_url: URL to stego image (optional if stego_image provided)
     - use_decryption: boolean (optional)
     - private_key: private key file (if use_decryption=true)
+    - model: model name from /models (optional, default=best model)
+    - reverse: boolean (optional, default=false) - also recover the cover image
+      from the same upload; the response then includes recovered_url
     """
     stego_path = None
+    recovered_path = None
     
     try:
+        try:
+            model_path = resolve_model_path(request.form.get('model'))
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
         unique_id = str(uuid.uuid4())
         logger.info(f"[DECODE] Request ID: {unique_id}")
         
@@ -400,10 +467,21 @@ def decode():
             return jsonify({'error': 'No stego image or URL provided'}), 400
         
         use_decryption = request.form.get('use_decryption', 'false').lower() == 'true'
+        with_reverse = request.form.get('reverse', 'false').lower() == 'true'
         
-        # Decode message
-        logger.info(f"[DECODE] Using model: {BEST_MODEL_PATH or 'random weights'}")
-        decoded_message = decode_message(stego_image_path=stego_path, model_path=BEST_MODEL_PATH)
+        if with_reverse and not model_path:
+            return jsonify({'error': 'No trained model available. Reverse hiding requires a trained model.'}), 500
+        
+        # Decode message (and recover the cover from the same image load)
+        logger.info(f"[DECODE] Using model: {model_path or 'random weights'}")
+        if with_reverse:
+            recovered_filename = f"{unique_id}_recovered.png"
+            recovered_path = os.path.join(app.config['OUTPUT_FOLDER'], recovered_filename)
+            decoded_message, _ = decode_and_reverse(stego_image_path=stego_path, output_path=recovered_path,
+                                                    model_path=model_path)
+            logger.info(f"[DECODE] Recovered cover: {recovered_path}")
+        else:
+            decoded_message = decode_message(stego_image_path=stego_path, model_path=model_path)
         logger.info(f"[DECODE] Decoded message length: {len(decoded_message)} chars")
         
         # Handle decryption
@@ -446,10 +524,17 @@ def decode():
         
         logger.info(f"[DECODE] Success! Message length: {len(final_message)} chars")
         
-        return jsonify({
+        response = {
             'success': True,
             'message': final_message
-        })
+        }
+        if with_reverse:
+            cleanup_old_files(app.config['OUTPUT_FOLDER'])
+            base_url = request.url_root.rstrip('/')
+            response['recovered_url'] = f"{base_url}/files/{recovered_filename}"
+            response['recovered_filename'] = recovered_filename
+        
+        return jsonify(response)
         
     except Exception as e:
         error_msg = str(e)
@@ -462,6 +547,8 @@ def decode():
         try:
             if stego_path and os.path.exists(stego_path):
                 os.remove(stego_path)
+            if recovered_path and os.path.exists(recovered_path):
+                os.remove(recovered_path)
         except:
             pass
         
@@ -475,12 +562,18 @@ def reverse():
     
     Form data:
     - stego_image: stego image file
+    - model: model name from /models (optional, default=best model)
     """
     stego_path = None
     recovered_path = None
     
     try:
         logger.info("[REVERSE] Starting reverse operation...")
+        try:
+            model_path = resolve_model_path(request.form.get('model'))
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
         if 'stego_image' not in request.files:
             return jsonify({'error': 'No stego image provided'}), 400
         
@@ -509,16 +602,16 @@ def reverse():
         recovered_path = os.path.join(app.config['OUTPUT_FOLDER'], recovered_filename)
         
         # Check if model exists and has reverse decoder weights
-        if not BEST_MODEL_PATH:
+        if not model_path:
             return jsonify({'error': 'No trained model available. Reverse hiding requires a trained model.'}), 500
         
-        logger.info(f"[REVERSE] Using model: {BEST_MODEL_PATH}")
+        logger.info(f"[REVERSE] Using model: {model_path}")
         
         try:
             reverse_hiding(
                 stego_image_path=stego_path,
                 output_path=recovered_path,
-                model_path=BEST_MODEL_PATH
+                model_path=model_path
             )
         except ValueError as ve:
             # Handle missing reverse decoder weights
@@ -0,0 +1,129 @@
+"""
+Cache mô hình dùng chung trong một tiến trình.
+
+Mỗi mục là một mô hình đã sẵn sàng suy luận (đã tải, gộp BatchNorm, chuyển
+layout), khóa theo (đường dẫn checkpoint, mtime, vai trò, thiết bị,
+precision). Checkpoint bị ghi đè có mtime mới nên tự động được tải lại, và
+nhiều checkpoint (ví dụ các epoch trong results/model) có thể được phục vụ
+song song mà không phải torch.load mỗi lần đổi qua lại.
+
+Tổng dung lượng (trọng số và buffer) được giới hạn bởi max_bytes; khi vượt
+ngưỡng, mục ít được dùng gần đây nhất bị loại (LRU). Các bộ đếm hits,
+misses, evictions cho biết hiệu quả của cache.
+"""
+import os
+import itertools
+import threading
+from collections import OrderedDict
+import torch
+
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+
+
+def source_mtime(model_path):
+    """
+    Thời điểm sửa đổi (ns) của checkpoint, hoặc của manifest.json với thư mục
+    mô hình đã xuất (manifest được ghi sau cùng khi xuất).
+    """
+    from model_export import EXPORT_MANIFEST
+    if os.path.isdir(model_path):
+        model_path = os.path.join(model_path, EXPORT_MANIFEST)
+    return os.stat(model_path).st_mtime_ns
+
+
+def model_nbytes(model, path=None):
+    """
+    Dung lượng trọng số và buffer của model. Mô hình không có tham số PyTorch
+    (TorchScript đã freeze, phiên ONNX Runtime) được tính theo kích thước file
+    path nếu có.
+    """
+    nbytes = 0
+    if isinstance(model, (torch.nn.Module, torch.jit.ScriptModule)):
+        nbytes = sum(t.numel() * t.element_size()
+                     for t in itertools.chain(model.parameters(), model.buffers()))
+    if not nbytes and path and os.path.isfile(path):
+        nbytes = os.path.getsize(path)
+    return nbytes
+
+
+class ModelCache:
+    """
+    Cache LRU các mô hình với giới hạn dung lượng, an toàn khi nhiều luồng
+    cùng dùng. Mục lớn hơn cả max_bytes vẫn được giữ cho tới lần put sau.
+    """
+
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def key(model_path, role, device, precision):
+        """Khóa cache của mô hình role tải từ model_path"""
+        return (os.path.abspath(model_path), source_mtime(model_path), role, str(device), precision)
+
+    def get(self, key):
+        """Mô hình đã cache cho key, hoặc None"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, value, nbytes=None):
+        """Thêm value vào cache rồi loại các mục cũ nhất cho tới khi vừa max_bytes"""
+        if nbytes is None:
+            nbytes = model_nbytes(value)
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = (value, nbytes)
+            self._evict(keep=key)
+
+    def _evict(self, keep=None):
+        while self.current_bytes() > self.max_bytes and len(self._entries) > 1:
+            key = next(iter(self._entries))
+            if key == keep:
+                break
+            del self._entries[key]
+            self.evictions += 1
+
+    def current_bytes(self):
+        return sum(nbytes for _, nbytes in self._entries.values())
+
+    def resize(self, max_bytes):
+        """Đổi giới hạn dung lượng, loại ngay các mục vượt ngưỡng mới"""
+        with self._lock:
+            self.max_bytes = max_bytes
+            self._evict(keep=next(reversed(self._entries), None))
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """Bộ đếm và nội dung hiện tại của cache"""
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'entries': len(self._entries),
+                'bytes': self.current_bytes(),
+                'max_bytes': self.max_bytes,
+                'models': [{'path': key[0], 'role': key[2], 'device': key[3], 'precision': key[4],
+                            'bytes': nbytes}
+                           for key, (_, nbytes) in self._entries.items()],
+            }
+
+    def __len__(self):
+        return len(self._entries)
+
+
+# Cache mặc định của tiến trình, dùng chung cho mọi StegoEngine
+model_cache = ModelCache()
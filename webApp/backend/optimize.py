@@ -0,0 +1,247 @@
+"""
+Tối ưu mô hình cho suy luận: gộp BatchNorm vào tích chập.
+
+Mỗi khối của encoder/decoder/reverse decoder/critic là Conv -> LeakyReLU ->
+BatchNorm. Ở chế độ eval, BatchNorm chỉ là một phép affine theo kênh
+y = a * z + b nên có thể gộp vào tích chập nhận y làm đầu vào: nhân trọng số
+với a theo kênh vào và cộng phần đóng góp của b vào bias. Phép chuẩn hóa
+đầu vào x / 127.5 - 1 cũng là một phép affine như vậy và được gộp vào tích
+chập đầu tiên của decoder.
+
+Vì tích chập đệm 0 ở biên, phần đóng góp của b ở các hàng/cột biên khác phần
+bên trong; phần chênh lệch này (chỉ phụ thuộc vị trí góc/cạnh) được tính sẵn
+và cộng lại vào các hàng/cột biên nên kết quả tương đương chính xác với mô
+hình gốc (chỉ sai khác do làm tròn số thực).
+
+SharedCoverEncoder dùng cùng tính tuyến tính đó để mã hóa nhiều payload vào
+một ảnh cover: phần của encoder chỉ phụ thuộc ảnh được tính một lần.
+"""
+import copy
+import itertools
+import torch
+import torch.nn as nn
+import torch.nn.functional as F
+
+# Chuẩn hóa ảnh trong enhancedstegan.load_image_tensor: x / 127.5 - 1
+PIXEL_SCALE = (1.0 / 127.5, -1.0)
+
+
+class FoldedConv2d(nn.Module):
+    """
+    Conv2d nhận trực tiếp z thay vì y = scale * z + shift (theo kênh vào),
+    kể cả ở biên khi tích chập gốc đệm 0 trong không gian của y.
+    """
+
+    def __init__(self, conv, scale, shift):
+        super().__init__()
+        if conv.kernel_size != (3, 3) or conv.padding not in ((0, 0), (1, 1)) \
+                or conv.stride != (1, 1) or conv.dilation != (1, 1) or conv.groups != 1:
+            raise ValueError('Chỉ hỗ trợ tích chập 3x3, stride 1, padding 0 hoặc 1')
+
+        weight = conv.weight.detach()
+        bias = conv.bias.detach() if conv.bias is not None else weight.new_zeros(weight.size(0))
+        scale = scale.to(weight)
+        shift = shift.to(weight)
+
+        self.conv = nn.Conv2d(conv.in_channels, conv.out_channels, 3, padding=conv.padding)
+        self.conv.to(weight.device)
+        with torch.no_grad():
+            self.conv.weight.copy_(weight * scale[None, :, None, None])
+            self.conv.bias.copy_(bias + (weight * shift[None, :, None, None]).sum(dim=(1, 2, 3)))
+
+        if conv.padding == (0, 0):
+            self.border = None
+            return
+        # Đóng góp của shift tại 3x3 loại vị trí (góc, cạnh, bên trong) của
+        # một ảnh có mỗi chiều >= 2, trừ đi phần đã có trong bias
+        self.register_buffer('_weight', weight, persistent=False)
+        self.register_buffer('_shift', shift, persistent=False)
+        table = F.conv2d(shift.view(1, -1, 1, 1).expand(1, -1, 3, 3), weight, padding=1)[0]
+        table = table - table[:, 1:2, 1:2]
+        # Ở góc, phần hiệu chỉnh hàng và cột đã được cộng cả hai lần
+        table[:, 0::2, 0::2] -= table[:, 0::2, 1:2] + table[:, 1:2, 0::2]
+        self.register_buffer('border', table)
+
+    def forward(self, x):
+        out = self.conv(x)
+        if self.border is None:
+            return out
+        if out.size(2) < 2 or out.size(3) < 2:
+            # Ảnh chỉ rộng một điểm: tính trực tiếp phần đóng góp của shift
+            ones = self._shift.view(1, -1, 1, 1).expand(1, -1, out.size(2), out.size(3))
+            inner = (self._weight * self._shift[None, :, None, None]).sum(dim=(1, 2, 3))
+            return out + F.conv2d(ones, self._weight, padding=1) - inner[None, :, None, None]
+        border = self.border
+        out[:, :, 0, :] += border[:, 0, 1, None]
+        out[:, :, -1, :] += border[:, 2, 1, None]
+        out[:, :, :, 0] += border[:, 1, 0, None]
+        out[:, :, :, -1] += border[:, 1, 2, None]
+        out[:, :, 0, 0] += border[:, 0, 0]
+        out[:, :, 0, -1] += border[:, 0, 2]
+        out[:, :, -1, 0] += border[:, 2, 0]
+        out[:, :, -1, -1] += border[:, 2, 2]
+        return out
+
+
+def model_blocks(model):
+    """Các khối nn.Sequential (conv1, conv2, ...) theo thứ tự của mô hình"""
+    blocks = getattr(model, '_models', None)
+    if blocks:
+        return list(blocks)
+    blocks = []
+    for i in itertools.count(1):
+        block = getattr(model, f'conv{i}', None)
+        if not isinstance(block, nn.Sequential):
+            return blocks
+        blocks.append(block)
+
+
+def block_sources(model, n_blocks):
+    """
+    Nguồn đầu vào (theo thứ tự ghép kênh) của từng khối: chỉ số khối trước đó,
+    hoặc 'data' cho tensor dữ liệu của encoder. Khối đầu tiên nhận ảnh (None).
+    Mô hình Dense ghép đầu ra của mọi khối trước (và dữ liệu, với encoder);
+    BasicEncoder chỉ ghép dữ liệu vào khối thứ hai.
+    """
+    name = type(model).__name__
+    dense = name.startswith('Dense')
+    encoder = name.endswith('Encoder')
+    sources = [[None]]
+    for k in range(1, n_blocks):
+        previous = list(range(k)) if dense else [k - 1]
+        with_data = encoder and (dense or k == 1)
+        sources.append(previous + (['data'] if with_data else []))
+    return sources
+
+
+def batchnorm_affine(bn):
+    """Hệ số (a, b) của BatchNorm ở chế độ eval: y = a * z + b"""
+    scale = bn.weight.detach() / torch.sqrt(bn.running_var + bn.eps)
+    return scale, bn.bias.detach() - bn.running_mean * scale
+
+
+def optimize_for_inference(model, input_scale=None):
+    """
+    Trả về bản sao của model (encoder, decoder, reverse decoder hoặc critic)
+    đã gộp mọi BatchNorm vào tích chập phía sau, tương đương với model gốc ở
+    chế độ eval.
+
+    Args:
+        model: mô hình cần tối ưu (không bị thay đổi)
+        input_scale: (scale, shift) để gộp phép chuẩn hóa ảnh đầu vào vào tích
+            chập đầu tiên, ví dụ PIXEL_SCALE để mô hình nhận ảnh 0..255. Chỉ
+            dùng cho mô hình không cộng ảnh đầu vào vào kết quả (decoder, critic).
+    """
+    model = copy.deepcopy(model).eval()
+    blocks = model_blocks(model)
+    if not blocks:
+        raise ValueError(f'Không nhận ra cấu trúc của {type(model).__name__}')
+
+    channels = [block[0].out_channels for block in blocks]
+    affines = []
+    for block in blocks:
+        bn = block[-1] if isinstance(block[-1], nn.BatchNorm2d) else None
+        affines.append(batchnorm_affine(bn) if bn is not None else None)
+
+    data_depth = getattr(model, 'data_depth', 0)
+    for k, (block, sources) in enumerate(zip(blocks, block_sources(model, len(blocks)))):
+        conv = block[0]
+        parts = []
+        for source in sources:
+            if source is None:
+                parts.append(tuple(torch.full((3,), v) for v in input_scale) if input_scale else None)
+            elif source == 'data':
+                parts.append(None)
+            else:
+                parts.append(affines[source])
+        if all(part is None for part in parts):
+            continue
+        sizes = [3 if s is None else data_depth if s == 'data' else channels[s]
+                 for s in sources]
+        if sum(sizes) != conv.in_channels:
+            raise ValueError(f'Số kênh vào của khối {k + 1} không khớp cấu trúc của '
+                             f'{type(model).__name__}')
+        scale = torch.cat([p[0].to(conv.weight) if p else conv.weight.new_ones(n) for p, n in zip(parts, sizes)])
+        shift = torch.cat([p[1].to(conv.weight) if p else conv.weight.new_zeros(n) for p, n in zip(parts, sizes)])
+        block[0] = FoldedConv2d(conv, scale, shift)
+
+    for block, affine in zip(blocks, affines):
+        if affine is not None:
+            del block[-1]
+    return model
+
+
+@torch.no_grad()
+def max_difference(original, optimized, *inputs, optimized_inputs=None):
+    """Sai khác tuyệt đối lớn nhất giữa đầu ra của hai mô hình trên cùng đầu vào"""
+    expected = original(*inputs)
+    actual = optimized(*(optimized_inputs or inputs))
+    return (expected - actual).abs().max().item()
+
+
+def _block_conv(block):
+    """Tích chập thật (nn.Conv2d) của khối, kể cả khi đã được gộp BatchNorm"""
+    conv = block[0]
+    return conv.conv if isinstance(conv, FoldedConv2d) else conv
+
+
+class SharedCoverEncoder:
+    """
+    Chạy encoder (gốc hoặc đã gộp BatchNorm) cho một ảnh cover với nhiều
+    payload mà không lặp lại phần chỉ phụ thuộc ảnh.
+
+    Khối đầu tiên chỉ nhận ảnh nên được tính một lần (trunk). Mỗi khối sau
+    nhận ghép kênh của đầu ra khối đầu với các kênh phụ thuộc payload; vì tích
+    chập tuyến tính theo đầu vào, phần đóng góp của các kênh khối đầu (cùng
+    bias và phần hiệu chỉnh biên của FoldedConv2d) cũng được tính một lần.
+    Mỗi payload (heads) chỉ còn tích chập trên các kênh phụ thuộc payload.
+    """
+
+    def __init__(self, encoder):
+        self.blocks = model_blocks(encoder)
+        if not self.blocks:
+            raise ValueError(f'Không nhận ra cấu trúc của {type(encoder).__name__}')
+        self.sources = block_sources(encoder, len(self.blocks))
+        self.residual = type(encoder).__name__ != 'BasicEncoder'
+        self.data_depth = encoder.data_depth
+
+        channels = [_block_conv(block).out_channels for block in self.blocks]
+        self.sizes = [[3 if s is None else self.data_depth if s == 'data' else channels[s] for s in sources]
+                      for sources in self.sources]
+        # Trọng số của các kênh phụ thuộc payload, cho các khối nhận đầu ra khối đầu
+        self.weights = [None] * len(self.blocks)
+        for k, (block, sources, sizes) in enumerate(zip(self.blocks, self.sources, self.sizes)):
+            if k == 0 or 0 not in sources:
+                continue
+            weight = _block_conv(block).weight.detach()
+            offsets = [sum(sizes[:i]) for i in range(len(sizes))]
+            self.weights[k] = torch.cat([weight[:, o:o + n] for s, o, n in zip(sources, offsets, sizes)
+                                         if s != 0], dim=1)
+
+    @torch.no_grad()
+    def trunk(self, image):
+        """Phần dùng chung cho ảnh cover image (1, 3, W, H)"""
+        features = self.blocks[0](image)
+        shared = [None] * len(self.blocks)
+        for k, (block, sources, sizes) in enumerate(zip(self.blocks, self.sources, self.sizes)):
+            if self.weights[k] is None:
+                continue
+            parts = [features if s == 0 else features.new_zeros(1, n, *features.shape[2:])
+                     for s, n in zip(sources, sizes)]
+            shared[k] = block[0](torch.cat(parts, dim=1))
+        return image, shared
+
+    @torch.no_grad()
+    def heads(self, state, data):
+        """Ảnh stego (N, 3, W, H) cho các payload data (N, D, W, H) từ trunk(image)"""
+        image, shared = state
+        outputs = [None]
+        for k in range(1, len(self.blocks)):
+            inputs = [data if s == 'data' else outputs[s] for s in self.sources[k] if s != 0]
+            x = inputs[0] if len(inputs) == 1 else torch.cat(inputs, dim=1)
+            if self.weights[k] is None:
+                outputs.append(self.blocks[k](x))
+                continue
+            x = F.conv2d(x, self.weights[k], padding=_block_conv(self.blocks[k]).padding)
+            outputs.append(self.blocks[k][1:](x.add_(shared[k])))
+        return image + outputs[-1] if self.residual else outputs[-1]
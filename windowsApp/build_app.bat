@@ -148,6 +148,10 @@ python -m PyInstaller --clean ^
     --add-data "%PROJECT_DIR%\decoder.py;." ^
     --add-data "%PROJECT_DIR%\critic.py;." ^
     --add-data "%PROJECT_DIR%\reverse_decoder.py;." ^
+    --add-data "%PROJECT_DIR%\rs_codec.py;." ^
+    --add-data "%PROJECT_DIR%\optimize.py;." ^
+    --add-data "%PROJECT_DIR%\model_export.py;." ^
+    --add-data "%PROJECT_DIR%\model_cache.py;." ^
     --add-data "%PROJECT_DIR%\enhancedstegan.py;." ^
     --collect-all torch ^
     --collect-all torchvision ^
@@ -189,7 +193,6 @@ python -m PyInstaller --clean ^
     --hidden-import scipy.sparse ^
     --hidden-import scipy.sparse.linalg ^
     --hidden-import scipy.sparse.csgraph ^
-    --hidden-import reedsolo ^
     --hidden-import Crypto ^
     --hidden-import Crypto.Cipher ^
     --hidden-import Crypto.Cipher.AES ^
@@ -199,7 +202,6 @@ python -m PyInstaller --clean ^
     --hidden-import Crypto.Random ^
     --hidden-import Crypto.Util ^
     --hidden-import Crypto.Util.Padding ^
-    --collect-all reedsolo ^
     --collect-all pycryptodome ^
     steganography_app.py
 